@@ -0,0 +1,51 @@
+"""
+Compare key generation against the old md5 path.
+
+    python benchmarks/bench_hashing.py
+"""
+import hashlib
+import timeit
+
+import numpy as np
+
+from naginpy import hashing
+
+
+def md5_key(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.md5(data).hexdigest()
+
+def md5_buffer(buf):
+    return hashlib.md5(memoryview(buf).cast('B')).hexdigest()
+
+
+def bench(name, func, arg, number):
+    t = timeit.timeit(lambda: func(arg), number=number)
+    per = t / number * 1e6
+    print("{name:<30} {per:10.3f} us/call".format(name=name, per=per))
+    return per
+
+
+def main():
+    source = "pd.rolling_sum(df.iloc[df.a > 5], 5) + some_slow_func(df)"
+    context_key = ", ".join("k{0}=ContextObject({1})".format(i, i * 997)
+                            for i in range(20))
+    arr = np.random.randn(10 ** 7)
+
+    cases = [
+        ('expression key', source, 100000),
+        ('context key', context_key, 100000),
+    ]
+    for label, data, number in cases:
+        old = bench('md5 ' + label, md5_key, data, number)
+        new = bench('hashing ' + label, hashing.hash_key, data, number)
+        print("{0:<30} {1:10.2f}x".format('speedup', old / new))
+
+    old = bench('md5 80MB buffer', md5_buffer, arr, 5)
+    new = bench('hashing 80MB buffer', hashing.hash_buffer, arr, 5)
+    print("{0:<30} {1:10.2f}x".format('speedup', old / new))
+
+
+if __name__ == '__main__':
+    main()
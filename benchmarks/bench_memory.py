@@ -0,0 +1,70 @@
+"""
+Framework memory per cached entry.
+
+    python benchmarks/bench_memory.py
+
+The values are small ints, so nearly everything counted is Computable,
+Manifest, Expression, ExecutionContext and ContextObject overhead.
+"""
+import sys
+import tracemalloc
+
+from naginpy.special_eval.computation import ComputationManager
+from naginpy.special_eval.exec_context import (
+    ContextObject,
+    ExecutionContext,
+    ScalarObject,
+)
+from naginpy.special_eval.manifest import _manifest
+from naginpy.special_eval.node_context import NodeContext
+
+
+def instance_size(obj):
+    size = sys.getsizeof(obj)
+    d = getattr(obj, '__dict__', None)
+    if d is not None:
+        size += sys.getsizeof(d)
+    return size
+
+
+def per_entry(n, unique_sources):
+    """ bytes allocated per ComputationManager entry """
+    objs = [object() for i in range(n)]
+    sources = ["f(x) + {0}".format(i) for i in range(unique_sources)]
+    manager = ComputationManager()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i, obj in enumerate(objs):
+        source = sources[i % unique_sources]
+        manager.get(source, {'x': obj, 'f': len, 'n': i})
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / n
+
+
+def main():
+    manifest = _manifest("a + b", {'a': object(), 'b': 1})
+    node = NodeContext(None, None, None, None, None, 0, 0, {}, None)
+    entry = ComputationManager().get("a + b", {'a': object(), 'b': 1})
+    objects = [
+        ('ContextObject', ContextObject(object())),
+        ('ScalarObject', ScalarObject(1)),
+        ('ExecutionContext', manifest.context),
+        ('Expression', manifest.expression),
+        ('Manifest', manifest),
+        ('Computable', entry),
+        ('NodeContext', node),
+    ]
+    for name, obj in objects:
+        print("{0:<30} {1:10d} bytes".format(name, instance_size(obj)))
+
+    n = 20000
+    for unique in (1, 100, n):
+        size = per_entry(n, unique)
+        label = "entry, {0} sources".format(unique)
+        print("{0:<30} {1:10.0f} bytes".format(label, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,6 @@ pip install cython
 pip install numpy
 pip install pandas
 pip install git+https://github.com/dalejung/asttools
-pip install -e git+https://github.com/dalejung/earthdragon#egg=earthdragon
 pip install .
 
 pip freeze
@@ -1,9 +1,115 @@
-from IPython.core.inputtransformer import CoroutineInputTransformer
-from naginpy.inputsplitter import splitter, transformer_manager
+"""
+Activate with `%load_ext naginpy.dplr` or `add_dsl(dsl)`. Importing this
+module does not touch IPython.
+
+```
+mtcars %>%
+    filter('hp > 100') %>%
+    select('mpg', 'cyl') %>%
+    head(10)
+```
+
+Lines ending in a pipe are joined into one logical line and the `%>%` chain
+is rewritten into a single `Chain` call, see naginpy.pipeline. The verbs
+below carry pipe metadata so the chain can stream row chunks through them.
+Only expressions that work row by row are streamed. Functions of the
+frame have to be declared with `rowwise` to be run per chunk.
+
+filter and mutate are `@nse(columns=True)`, so with NSEEngine they take
+bare column expressions, `filter(hp > 100)`. Model formulas like
+`lm(mpg ~ hp + cyl, data=mtcars)` are rewritten too, see
+naginpy.special_eval.formula.
+"""
+import ast
+import io
+import tokenize
+
+from asttools import ast_source
+
+from naginpy.pipeline import Stage, chain, pipe_func, merge_projections
+from naginpy.special_eval.column_expr import ColumnExpr, elementwise
+from naginpy.special_eval.formula import FORMULA_NS, formula_transform
+from naginpy.special_eval.nse import nse
+
+PIPE_FORWARD = '%>%'
+CHAIN_NAME = '__pipe_chain__'
+STAGE_NAME = '__pipe_stage__'
+
+# names the rewritten chains need
+PIPE_NS = {CHAIN_NAME: chain, STAGE_NAME: Stage}
+PIPE_NS.update(FORMULA_NS)
+
+
+def _pipe_offsets(source):
+    """ (start, end) offsets of the `%>%` tokens in source """
+    lines = source.splitlines(True)
+    line_starts = [0]
+    for line in lines:
+        line_starts.append(line_starts[-1] + len(line))
+
+    def offset(pos):
+        row, col = pos
+        return line_starts[row - 1] + col
+
+    tokens = [tok for tok in
+              tokenize.generate_tokens(io.StringIO(source).readline)
+              if tok.type == tokenize.OP]
+    offsets = []
+    for first, second, third in zip(tokens, tokens[1:], tokens[2:]):
+        if (first.string, second.string, third.string) != ('%', '>', '%'):
+            continue
+        if first.end != second.start or second.end != third.start:
+            continue
+        offsets.append((offset(first.start), offset(third.end)))
+    return offsets
+
+def _stage_node(node):
+    func = ast.Name(id=STAGE_NAME, ctx=ast.Load())
+    if isinstance(node, ast.Call):
+        return ast.Call(func=func, args=[node.func] + node.args,
+                        keywords=node.keywords)
+    return ast.Call(func=func, args=[node], keywords=[])
+
+def pipe_transform(source):
+    """
+    Rewrite `x %>% f(a) %>% g` into
+
+        __pipe_chain__(x, __pipe_stage__(f, a), __pipe_stage__(g))
+
+    Source without `%>%` is returned unchanged.
+    """
+    try:
+        offsets = _pipe_offsets(source)
+    except (tokenize.TokenError, SyntaxError):
+        return source
+    if not offsets:
+        return source
+
+    segments = []
+    start = 0
+    for pipe_start, pipe_end in offsets:
+        segments.append(source[start:pipe_start])
+        start = pipe_end
+    segments.append(source[start:])
+
+    first = segments[0].lstrip('\n')
+    # keep the line inside its block
+    indent = first[:len(first) - len(first.lstrip())]
+    stmt = ast.parse(first.strip()).body[0]
+    if not isinstance(stmt, (ast.Assign, ast.Expr)):
+        raise SyntaxError("Pipe chain must be an expression or assignment")
+
+    stages = [_stage_node(ast.parse(segment.strip(), mode='eval').body)
+              for segment in segments[1:]]
+    stmt.value = ast.Call(func=ast.Name(id=CHAIN_NAME, ctx=ast.Load()),
+                          args=[stmt.value] + stages, keywords=[])
+    new_source = ast_source(ast.fix_missing_locations(stmt))
+    return '\n'.join(indent + line for line in new_source.splitlines())
+
 
 class DSL(object):
     def logical_line_transform(self):
-        PIPE = '<%<'
+        PIPES = ('<%<', PIPE_FORWARD)
         line = ''
         while True:
             line = (yield line)
@@ -11,19 +117,16 @@ class DSL(object):
             while not line:
                 line = (yield line)
 
-            print('original', line)
             line = line.rstrip()
-            if not line.endswith(PIPE):
-                continue
-
             lines = []
-            while line.endswith(PIPE):
+            while line.endswith(PIPES):
                 lines.append(line)
                 line = (yield None)
 
             lines.append(line)
             body = u'\n'.join(lines)
-            line = body
+            # formulas first, `y ~ x` doesn't parse
+            line = pipe_transform(formula_transform(body))
 
 def another_one():
     PIPE = '<%<'
@@ -50,13 +153,212 @@ def another_one():
         print('other one222', body)
         line = body
 
+# verbs
+
+def _arg(args, kwargs, name, default=None):
+    if args:
+        return args[0]
+    return kwargs.get(name, default)
+
+def rowwise(func):
+    """
+    Declare that func(df) computes each row from that row alone, so
+    filter and mutate can run it per row chunk.
+
+        mutate(z=rowwise(lambda df: df.a * 2))
+    """
+    func.__rowwise__ = True
+    return func
+
+def _reads_frame(value):
+    """ Computed from the frame it is applied to, not precomputed """
+    return callable(value) or isinstance(value, str)
+
+def _source_rowwise(expr):
+    try:
+        # @local is a scalar from the caller
+        tree = ast.parse(expr.replace('@', ''), mode='eval')
+    except SyntaxError:
+        return False
+    return elementwise(tree)
+
+def _is_rowwise(value):
+    """
+    Computed row by row from the rows it is applied to. Functions are only
+    rowwise when declared with `rowwise`. They could look at the whole
+    frame, like `df.a > df.a.mean()`.
+    """
+    if getattr(value, '__rowwise__', False):
+        return True
+    if isinstance(value, str):
+        return _source_rowwise(value)
+    if isinstance(value, ColumnExpr):
+        return value.rowwise
+    return False
+
+def _expr_columns(expr):
+    """
+    Names used by a query/eval string. None if it can't be parsed, e.g.
+    `@local` references.
+    """
+    try:
+        tree = ast.parse(expr, mode='eval')
+    except SyntaxError:
+        return None
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+def _value_columns(value):
+    """
+    Columns a value reads, empty for scalars. None when unknown or when
+    the value isn't computed row by row. A precomputed array is aligned to
+    the rows it was made for.
+    """
+    import numpy as np
+    if isinstance(value, str):
+        return _expr_columns(value) if _is_rowwise(value) else None
+    if np.isscalar(value):
+        return set()
+    if not _is_rowwise(value):
+        return None
+    if isinstance(value, ColumnExpr):
+        return value.names
+    return None
+
+def _filter_chunk_safe(args, kwargs):
+    # a precomputed mask is aligned to the whole frame
+    return _is_rowwise(_arg(args, kwargs, 'cond'))
+
+def _filter_uses(args, kwargs):
+    cond = _arg(args, kwargs, 'cond')
+    if not _reads_frame(cond):
+        # mask is aligned to the input rows, can't move
+        return None
+    return _value_columns(cond)
+
+@nse(columns=True)
+@pipe_func(chunk_safe=_filter_chunk_safe, kind='filter', uses=_filter_uses)
+def filter(df, cond):
+    """
+    cond is a query string, a function of df returning a mask, or a mask.
+    Under SpecialEval with NSEEngine, `filter(df, hp > 100)` works too.
+    """
+    if isinstance(cond, str):
+        return df.query(cond)
+    if callable(cond):
+        cond = cond(df)
+    return df[cond]
+
+@pipe_func(chunk_safe=True, kind='project', cost=0,
+           uses=lambda args, kwargs: args, merge=merge_projections)
+def select(df, *columns):
+    return df[list(columns)]
+
+def _mutate_chunk_safe(args, kwargs):
+    import numpy as np
+    # strings are expressions, not scalars
+    return all(_is_rowwise(v) or (np.isscalar(v) and not isinstance(v, str))
+               for v in kwargs.values())
+
+def _mutate_uses(args, kwargs):
+    uses = set()
+    for value in kwargs.values():
+        columns = _value_columns(value)
+        if columns is None:
+            return None
+        uses |= columns
+    return uses
+
+@nse(columns=True)
+@pipe_func(chunk_safe=_mutate_chunk_safe, kind='map', cost=2,
+           uses=_mutate_uses, produces=lambda args, kwargs: kwargs)
+def mutate(df, **columns):
+    """ New columns from expression strings, functions of df, or values """
+    df = df.copy()
+    for name, value in columns.items():
+        if isinstance(value, str):
+            value = df.eval(value)
+        elif callable(value):
+            value = value(df)
+        df[name] = value
+    return df
+
+@pipe_func(kind='order', uses=lambda args, kwargs: args)
+def arrange(df, *columns, ascending=True):
+    return df.sort_values(list(columns), ascending=ascending)
+
+def _head_stream(chunks, n=5):
+    """ Stop pulling chunks once we have n rows """
+    if n <= 0:
+        return
+    for chunk in chunks:
+        chunk = chunk[:n]
+        n -= len(chunk)
+        yield chunk
+        if n <= 0:
+            return
+
+@pipe_func(chunk_safe=True, stream=_head_stream, kind='limit',
+           uses=lambda args, kwargs: ())
+def head(df, n=5):
+    return df[:n]
+
+# how => how to combine the per chunk results
+_COMBINE = {
+    'sum': 'sum',
+    'count': 'sum',
+    'min': 'min',
+    'max': 'max',
+}
+
+def _summarize_chunk_safe(args, kwargs):
+    return all(how in _COMBINE or how == 'mean' for _, how in kwargs.values())
+
+def _summarize_stream(chunks, **aggs):
+    """ Partial aggregates per chunk, combined at the end """
+    import pandas as pd
+    partials = []
+    for chunk in chunks:
+        row = {}
+        for name, (col, how) in aggs.items():
+            if how == 'mean':
+                row[name + '__sum'] = chunk[col].sum()
+                row[name + '__count'] = chunk[col].count()
+            else:
+                row[name] = getattr(chunk[col], how)()
+        partials.append(row)
+    partials = pd.DataFrame(partials)
+
+    out = {}
+    for name, (col, how) in aggs.items():
+        if how == 'mean':
+            out[name] = partials[name + '__sum'].sum() \
+                / partials[name + '__count'].sum()
+        else:
+            out[name] = getattr(partials[name], _COMBINE[how])()
+    yield pd.DataFrame([out])
+
+@pipe_func(chunk_safe=_summarize_chunk_safe, stream=_summarize_stream,
+           kind='aggregate',
+           uses=lambda args, kwargs: [col for col, _ in kwargs.values()])
+def summarize(df, **aggs):
+    """ summarize(total=('mpg', 'sum'), avg=('hp', 'mean')) """
+    import pandas as pd
+    out = {name: getattr(df[col], how)() for name, (col, how) in aggs.items()}
+    return pd.DataFrame([out])
+
 dsl = DSL()
 
-def add_dsl(dsl):
+def add_dsl(dsl, ip=None):
+    from IPython.core.inputtransformer import CoroutineInputTransformer
+    from naginpy.inputsplitter import get_splitters
+
+    splitter, transformer_manager = get_splitters(ip)
     splitter.logical_line_transforms = splitter.__logical_line_transforms__ + \
             [CoroutineInputTransformer.wrap(dsl.logical_line_transform)(),
             CoroutineInputTransformer.wrap(another_one)()]
     transformer_manager.logical_line_transforms = transformer_manager.__logical_line_transforms__ + \
             [CoroutineInputTransformer.wrap(dsl.logical_line_transform)()]
 
-add_dsl(dsl)
+def load_ipython_extension(ip):
+    ip.push(PIPE_NS)
+    add_dsl(dsl, ip)
@@ -1,14 +1,8 @@
-from IPython.core.inputsplitter import IPythonInputSplitter
 from functools import partial
 
-ip = get_ipython()
-
 overrides = ['push', 'push_accepts_more', 'physical_line_transforms',
              'logical_line_transforms']
 
-transformer_manager = ip.input_transformer_manager
-splitter = ip.input_splitter
-
 def backup(obj, name):
     old_name = '__{0}__'.format(name)
     if hasattr(obj, old_name):
@@ -19,11 +13,27 @@ def backup(obj, name):
 def backup_attributes(obj, overrides):
     list(map(partial(backup, obj), overrides))
 
-backup_attributes(splitter, overrides)
-backup_attributes(transformer_manager, overrides)
+def get_splitters(ip=None):
+    """
+    Return the (input_splitter, input_transformer_manager) of the IPython
+    shell, backing up the attributes we override.
+
+    Nothing is touched at import time. This is only called when an
+    integration is explicitly activated.
+    """
+    if ip is None:
+        from IPython import get_ipython
+        ip = get_ipython()
+
+    transformer_manager = ip.input_transformer_manager
+    splitter = ip.input_splitter
+
+    backup_attributes(splitter, overrides)
+    backup_attributes(transformer_manager, overrides)
+    return splitter, transformer_manager
 
 # don't think I need these anymore
-def _():
+def _(splitter):
     def push(self, line):
         out = self.__push__(line)
         return out
@@ -17,20 +17,42 @@ cell_manager.add_handler('python_handler', test_handle_cell)
 cell_manager.add_handler('any_handler', test_any_handle_cell)
 ```
 
+Transformed cells are memoized by the raw cell's hash and the handler set,
+along with the parsed AST of the result. Re-running a cell skips the
+handlers and the parse, and the AST is handed to IPython so it doesn't
+parse the cell again. Handlers are assumed to be pure functions of the
+cell. Pass `memoize=False` if they aren't.
 """
 import ast
+from collections import OrderedDict
 
-def _patch_run_cell(func):
-    ip = get_ipython()
+from naginpy import hashing
+
+def _patch_run_cell(func, ip=None):
+    if ip is None:
+        from IPython import get_ipython
+        ip = get_ipython()
     # save original
     if not hasattr(ip, '__run_cell__'):
         ip.__run_cell__ = ip.run_cell
     ip.run_cell = func.__get__(ip)
 
+def _cell_key(cell):
+    # IPython adds a trailing newline to the cells it runs
+    return hashing.digest(cell.rstrip('\n'))
+
 class RunCellManager(object):
-    def __init__(self):
+    # number of memoized cells
+    cache_size = 256
+
+    def __init__(self, memoize=True):
         self.any_handlers = {}
         self.python_handlers = {}
+        self.memoize = memoize
+        # (raw cell digest, handler signature) => transformed cell
+        self.cells = OrderedDict()
+        # transformed cell digest => AST
+        self.trees = OrderedDict()
 
     def add_handler(self, name, handler, valid_python=True):
         if valid_python:
@@ -40,10 +62,38 @@ class RunCellManager(object):
 
         handlers[name] = handler
 
+    def handler_signature(self):
+        """ changes whenever a handler is added or replaced """
+        return (tuple((k, id(v)) for k, v in self.any_handlers.items()),
+                tuple((k, id(v)) for k, v in self.python_handlers.items()))
+
+    def _remember(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
     def handle_cell(self, raw_cell):
         if (not raw_cell) or raw_cell.isspace():
             return raw_cell
 
+        if not self.memoize:
+            return self._handle_cell(raw_cell)[0]
+
+        key = (hashing.digest(raw_cell), self.handler_signature())
+        cell = self.cells.get(key, None)
+        if cell is not None:
+            self.cells.move_to_end(key)
+            return cell
+
+        cell, tree = self._handle_cell(raw_cell)
+        self._remember(self.cells, key, cell)
+        if tree is not None:
+            self._remember(self.trees, _cell_key(cell), tree)
+        return cell
+
+    def _handle_cell(self, raw_cell):
+        """ Return the transformed cell and its AST if it is python """
         def process_handlers(handlers, raw_cell):
             for name, handler in handlers.items():
                 temp = handler(raw_cell)
@@ -61,38 +111,64 @@ class RunCellManager(object):
         raw_cell = process_handlers(self.any_handlers, raw_cell)
 
         try:
-            ast.parse(raw_cell)
+            tree = ast.parse(raw_cell)
         except SyntaxError:
             # not valid python, don't try the python handlers
-            return raw_cell
+            return raw_cell, None
 
         # note we are assuming that the python handlers are
         # well behaved and return valid python
-        raw_cell = process_handlers(self.python_handlers, raw_cell)
-        return raw_cell
+        cell = process_handlers(self.python_handlers, raw_cell)
+        if cell != raw_cell:
+            try:
+                tree = ast.parse(cell)
+            except SyntaxError:
+                tree = None
+        return cell, tree
+
+    def cached_tree(self, cell):
+        """
+        AST of a transformed cell, or None. Returns a new Module since
+        IPython appends to the body when running it.
+        """
+        tree = self.trees.get(_cell_key(cell), None)
+        if tree is None:
+            return None
+        return ast.Module(body=list(tree.body), type_ignores=[])
+
+    def patch_ast_parse(self, ip):
+        """
+        Hand our parsed AST to IPython's compiler instead of letting it parse
+        the cell again. Only when there are no ast_transformers, since those
+        may modify the tree in place.
+        """
+        compiler = ip.compile
+        if hasattr(compiler, '__ast_parse__'):
+            return
+        compiler.__ast_parse__ = compiler.ast_parse
+        mgr = self
+
+        def ast_parse(source, filename='<unknown>', symbol='exec'):
+            if symbol == 'exec' and not ip.ast_transformers:
+                tree = mgr.cached_tree(source)
+                if tree is not None:
+                    return tree
+            return compiler.__ast_parse__(source, filename, symbol)
+        compiler.ast_parse = ast_parse
 
-    def patch_run_cell(self):
+    def patch_run_cell(self, ip=None):
         """
         Monkey patch InteractiveShell.run_cell so we can preprocess the
         raw_cell.
         """
+        if ip is None:
+            from IPython import get_ipython
+            ip = get_ipython()
+
         mgr = self
         def run_cell(self, raw_cell, *args, **kwargs):
             raw_cell = mgr.handle_cell(raw_cell)
             return self.__run_cell__(raw_cell, *args, **kwargs)
-        _patch_run_cell(run_cell)
-
-def test_any_handle_cell(cell):
-    print('2any handle', cell)
-    return cell
-
-def test_handle_cell(cell):
-    print('boo', cell)
-    cell += "\nprint('hi')\n"
-    return cell
-
-cell_manager = RunCellManager()
-cell_manager.patch_run_cell()
-cell_manager.add_handler('python_handler', test_handle_cell)
-cell_manager.add_handler('any_handler', test_any_handle_cell)
-
+        _patch_run_cell(run_cell, ip)
+        if self.memoize:
+            self.patch_ast_parse(ip)
@@ -0,0 +1,384 @@
+"""
+Pipe chains as a unit.
+
+`mtcars %>% filter('hp > 100') %>% select('mpg', 'cyl') %>% head(10)` is
+captured by dplr as
+
+```
+Chain(mtcars, [Stage(filter, 'hp > 100'), Stage(select, 'mpg', 'cyl'),
+               Stage(head, 10)]).run()
+```
+
+instead of running each stage eagerly on the full object.
+
+Functions carry metadata registered with `pipe_func` or `register_pipe`.
+Stages that are chunk_safe (filters, elementwise maps, partial aggregates)
+work on row chunks, so the chain is run as a series of generators. Each stage
+only holds one chunk at a time. A blocking stage, like a sort, forces the
+chunks upstream of it to be concatenated. Chunking only happens when the
+source is larger than `chunksize` rows or is already an iterator of chunks,
+like `pd.read_csv(path, chunksize=n)`.
+
+Before running, the chain goes through a small rule based optimizer driven
+by the same metadata:
+
+- filters move ahead of more expensive row by row maps that don't produce
+  the columns they use
+- adjacent projections are merged
+- columns that no later stage uses are dropped right at the source
+
+See `optimize`.
+"""
+import sys
+
+CHUNKSIZE = 2 ** 17
+
+# func => PipeMeta, for functions we can't set attributes on
+_REGISTRY = {}
+
+
+# kinds that pass through the columns they don't touch
+PASSTHROUGH_KINDS = ('filter', 'map', 'order', 'limit')
+
+class PipeMeta(object):
+    """
+    chunk_safe : bool or callable(args, kwargs)
+        Whether running the function per row chunk and concatenating gives
+        the same result as running it on the whole object.
+    stream : generator function(chunks, *args, **kwargs)
+        Optional. Custom chunk handling, e.g. partial aggregates that
+        combine at the end or a head that stops reading early. Defaults to
+        mapping the function over each chunk.
+
+    The rest is for the optimizer.
+
+    kind : str
+        filter    drops rows
+        map       adds or replaces columns row by row
+        order     reorders rows
+        limit     keeps the first rows
+        project   keeps only the `uses` columns
+        aggregate output only depends on the `uses` columns
+        other     unknown. nothing is moved across it.
+    uses : callable(args, kwargs)
+        Columns the stage reads. None if unknown.
+    produces : callable(args, kwargs)
+        Columns a map adds or replaces.
+    cost : number
+        Relative cost per row. Filters only move ahead of costlier stages.
+    merge : callable(stage, next_stage)
+        Return one Stage doing both, or None.
+    """
+    def __init__(self, chunk_safe=False, stream=None, kind='other',
+                 uses=None, produces=None, cost=1, merge=None):
+        self.chunk_safe = chunk_safe
+        self.stream = stream
+        self.kind = kind
+        self.uses = uses
+        self.produces = produces
+        self.cost = cost
+        self.merge = merge
+
+    def is_chunk_safe(self, args, kwargs):
+        if callable(self.chunk_safe):
+            return self.chunk_safe(args, kwargs)
+        return self.chunk_safe
+
+# single arg ufuncs are elementwise
+_UFUNC_META = PipeMeta(chunk_safe=True, kind='map')
+_DEFAULT_META = PipeMeta()
+
+def register_pipe(func, **meta):
+    _REGISTRY[func] = PipeMeta(**meta)
+    return func
+
+def pipe_func(**meta):
+    """ Decorator version of register_pipe """
+    def decorator(func):
+        func.__pipe__ = PipeMeta(**meta)
+        return func
+    return decorator
+
+def get_meta(func):
+    meta = getattr(func, '__pipe__', None)
+    if isinstance(meta, PipeMeta):
+        return meta
+    try:
+        meta = _REGISTRY.get(func, None)
+    except TypeError:
+        # unhashable
+        meta = None
+    if meta is not None:
+        return meta
+    if type(func).__name__ == 'ufunc' and getattr(func, 'nin', None) == 1:
+        return _UFUNC_META
+    return _DEFAULT_META
+
+
+class Stage(object):
+    """ func(data, *args, **kwargs) """
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    @property
+    def meta(self):
+        return get_meta(self.func)
+
+    @property
+    def chunk_safe(self):
+        return self.meta.is_chunk_safe(self.args, self.kwargs)
+
+    @property
+    def kind(self):
+        return self.meta.kind
+
+    @property
+    def uses(self):
+        """ set of columns read, None if unknown """
+        uses = self.meta.uses
+        if uses is None:
+            return None
+        uses = uses(self.args, self.kwargs)
+        return None if uses is None else set(uses)
+
+    @property
+    def produces(self):
+        produces = self.meta.produces
+        if produces is None:
+            return set()
+        return set(produces(self.args, self.kwargs))
+
+    def __call__(self, data):
+        return self.func(data, *self.args, **self.kwargs)
+
+    def stream(self, chunks):
+        custom = self.meta.stream
+        if custom is not None:
+            return custom(chunks, *self.args, **self.kwargs)
+        return (self(chunk) for chunk in chunks)
+
+    def __repr__(self):
+        name = getattr(self.func, '__name__', repr(self.func))
+        return "Stage({0}, args={1}, kwargs={2})".format(name, self.args,
+                                                         self.kwargs)
+
+
+def _is_pandas(data):
+    pd = sys.modules.get('pandas', None)
+    return pd is not None and isinstance(data, (pd.DataFrame, pd.Series))
+
+def _is_ndarray(data):
+    np = sys.modules.get('numpy', None)
+    return np is not None and isinstance(data, np.ndarray) and data.ndim > 0
+
+def chunkable(data):
+    return _is_pandas(data) or _is_ndarray(data)
+
+def is_chunk_iter(data):
+    """ Iterator of chunks, like read_csv(chunksize=n) """
+    return hasattr(data, '__next__')
+
+def iter_chunks(data, chunksize):
+    if _is_pandas(data):
+        for start in range(0, len(data), chunksize):
+            yield data.iloc[start:start+chunksize]
+        return
+    for start in range(0, len(data), chunksize):
+        yield data[start:start+chunksize]
+
+def concat(chunks):
+    chunks = list(chunks)
+    if not chunks:
+        return None
+    first = chunks[0]
+    if len(chunks) == 1:
+        return first
+    if _is_pandas(first):
+        import pandas as pd
+        return pd.concat(chunks)
+    if _is_ndarray(first):
+        import numpy as np
+        return np.concatenate(chunks)
+    return chunks
+
+
+# optimizer
+
+def push_filters(stages, columns=None):
+    """
+    Move filters ahead of costlier maps. Only when the map is chunk_safe,
+    so it gives the same rows on fewer rows, and we know it doesn't
+    produce a column the filter reads.
+    """
+    stages = list(stages)
+    for i in range(1, len(stages)):
+        j = i
+        stage = stages[j]
+        if stage.kind != 'filter' or stage.uses is None:
+            continue
+        while j > 0:
+            prev = stages[j-1]
+            if prev.kind != 'map' or prev.meta.cost <= stage.meta.cost:
+                break
+            if not prev.chunk_safe:
+                break
+            if prev.produces & stage.uses:
+                break
+            stages[j-1], stages[j] = stage, prev
+            j -= 1
+    return stages
+
+def merge_stages(stages, columns=None):
+    """ Merge adjacent stages that know how, e.g. select after select """
+    out = []
+    for stage in stages:
+        merge = stage.meta.merge
+        if out and merge is not None:
+            merged = merge(out[-1], stage)
+            if merged is not None:
+                out[-1] = merged
+                continue
+        out.append(stage)
+    return out
+
+def _needed_before(stage, needed):
+    """
+    Columns needed going into stage, given those needed after it.
+    """
+    uses = stage.uses
+    if uses is None:
+        return None
+    if stage.kind in ('project', 'aggregate'):
+        return uses
+    if stage.kind in PASSTHROUGH_KINDS:
+        if needed is None:
+            return None
+        return (needed - stage.produces) | uses
+    return None
+
+def required_columns(stages):
+    """
+    Columns of the input needed to run stages. None when every column is
+    needed or we can't tell.
+    """
+    needed = None
+    for stage in reversed(stages):
+        needed = _needed_before(stage, needed)
+    return needed
+
+def prune_columns(stages, columns=None):
+    """
+    Drop chunk_safe maps whose output is never used, and project the
+    source down to the columns the chain uses when the source columns are
+    known. Other maps are kept, e.g. a precomputed column of the wrong
+    length has to fail like it would unoptimized.
+    """
+    kept = []
+    needed = None
+    for stage in reversed(stages):
+        produces = stage.produces
+        if stage.kind == 'map' and needed is not None and produces \
+           and not produces & needed and stage.chunk_safe:
+            continue
+        kept.append(stage)
+        needed = _needed_before(stage, needed)
+    kept.reverse()
+
+    if columns is None or needed is None:
+        return kept
+    keep = [col for col in columns if col in needed]
+    if len(keep) == len(columns):
+        return kept
+    return [Stage(_project, *keep)] + kept
+
+RULES = [push_filters, merge_stages, prune_columns, merge_stages]
+
+def optimize(stages, columns=None, rules=None):
+    """
+    columns : list
+        Source columns, if known.
+    """
+    if rules is None:
+        rules = RULES
+    for rule in rules:
+        stages = rule(stages, columns)
+    return stages
+
+def merge_projections(stage, next_stage):
+    """ A projection right after another only needs the second one """
+    if stage.kind != 'project' or stage.uses is None:
+        return None
+    uses = next_stage.uses
+    if uses is None or not uses <= stage.uses:
+        return None
+    return next_stage
+
+def _project(df, *columns):
+    return df[list(columns)]
+
+register_pipe(_project, chunk_safe=True, kind='project', cost=0,
+              uses=lambda args, kwargs: args, merge=merge_projections)
+
+
+class Chain(object):
+    def __init__(self, source, stages, chunksize=None, optimize=True):
+        self.source = source
+        self.stages = list(stages)
+        if chunksize is None:
+            chunksize = CHUNKSIZE
+        self.chunksize = chunksize
+        self.optimize = optimize
+
+    def source_columns(self):
+        columns = getattr(self.source, 'columns', None)
+        if columns is None or is_chunk_iter(self.source):
+            return None
+        return list(columns)
+
+    def plan(self):
+        """ The stages that will run """
+        if not self.optimize:
+            return self.stages
+        return optimize(self.stages, self.source_columns())
+
+    def _should_chunk(self, data, stages):
+        if not stages or not stages[0].chunk_safe:
+            return False
+        return chunkable(data) and len(data) > self.chunksize
+
+    def run(self):
+        data = self.source
+        stream = None
+        if is_chunk_iter(data):
+            stream, data = data, None
+
+        stages = self.plan()
+        for i, stage in enumerate(stages):
+            if stream is None and self._should_chunk(data, stages[i:]):
+                stream = iter_chunks(data, self.chunksize)
+                data = None
+
+            if stream is not None and stage.chunk_safe:
+                stream = stage.stream(stream)
+                continue
+
+            if stream is not None:
+                # blocking stage
+                data = concat(stream)
+                stream = None
+            data = stage(data)
+
+        if stream is not None:
+            data = concat(stream)
+        return data
+
+    def __repr__(self):
+        return "Chain({0!r}, {1!r})".format(type(self.source).__name__,
+                                           self.stages)
+
+
+def chain(source, *stages):
+    """ What dplr rewrites `%>%` chains into """
+    return Chain(source, stages).run()
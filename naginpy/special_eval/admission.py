@@ -0,0 +1,172 @@
+"""
+Learn which expressions are worth caching.
+
+```
+manager = ComputationManager(admission=AdmissionPolicy('~/.naginpy/stats'))
+```
+
+For every expression key, the ComputationManager reports each execution,
+with its exec_time and result size, and each reuse of a cached value. Once
+an expression has run `min_samples` times, it is only admitted to the cache
+if recomputing it is not cheap and its values actually get reused.
+
+Statistics are moving averages, so an expression that gets more expensive
+or starts being reused is picked up again. Rejected expressions are still
+admitted every `probe_interval` lookups to keep their statistics fresh.
+
+With a path, the statistics are loaded on start and saved at exit, so what
+was learned carries across sessions.
+"""
+import atexit
+import json
+import os
+
+STATS_NAME = 'admission.json'
+
+# weight of the newest observation in the moving averages
+_ALPHA = 0.2
+
+
+class ExprStats(object):
+    """
+    execs : int
+        Times the expression was computed.
+    hits : int
+        Times a cached value was reused, or would have been.
+    exec_time : float
+        Moving average, seconds.
+    size : float
+        Moving average of the result size in bytes.
+    """
+    def __init__(self, execs=0, hits=0, exec_time=0.0, size=0.0, skipped=0):
+        self.execs = execs
+        self.hits = hits
+        self.exec_time = exec_time
+        self.size = size
+        self.skipped = skipped
+
+    def record(self, exec_time, size):
+        if self.execs == 0:
+            self.exec_time = exec_time
+            self.size = size
+        else:
+            self.exec_time += _ALPHA * (exec_time - self.exec_time)
+            self.size += _ALPHA * (size - self.size)
+        self.execs += 1
+
+    @property
+    def reuse(self):
+        """ Fraction of lookups served from the cache """
+        total = self.execs + self.hits
+        if not total:
+            return 0.0
+        return self.hits / total
+
+    def decay(self, max_count):
+        """ Keep counts bounded so recent behaviour dominates """
+        if self.execs + self.hits > max_count:
+            self.execs = (self.execs + 1) // 2
+            self.hits //= 2
+
+    def to_list(self):
+        return [self.execs, self.hits, self.exec_time, self.size]
+
+    def __repr__(self):
+        return ("ExprStats(execs={0}, hits={1}, exec_time={2:.6f}, "
+                "size={3:.0f})".format(self.execs, self.hits, self.exec_time,
+                                       self.size))
+
+
+class AdmissionPolicy(object):
+    """
+    path : str
+        Optional directory to persist statistics in.
+    min_samples : int
+        Executions before an expression can be rejected.
+    min_time : float
+        Expressions faster than this to recompute are not cached.
+    min_reuse : float
+        Expressions whose reuse fraction is lower are not cached.
+    probe_interval : int
+        Rejected expressions are still admitted once every this many
+        lookups.
+    max_count : int
+        Counts are halved past this, see ExprStats.decay.
+    """
+    def __init__(self, path=None, min_samples=3, min_time=1e-4,
+                 min_reuse=0.1, probe_interval=20, max_count=1000):
+        self.min_samples = min_samples
+        self.min_time = min_time
+        self.min_reuse = min_reuse
+        self.probe_interval = probe_interval
+        self.max_count = max_count
+        self.stats = {}
+
+        self.path = None
+        if path is not None:
+            self.path = os.path.expanduser(path)
+            os.makedirs(self.path, exist_ok=True)
+            self.load()
+            atexit.register(self.close)
+
+    def get(self, key):
+        stats = self.stats.get(key, None)
+        if stats is None:
+            stats = ExprStats()
+            self.stats[key] = stats
+        return stats
+
+    def record(self, key, exec_time, size):
+        stats = self.get(key)
+        stats.record(exec_time, size)
+        stats.decay(self.max_count)
+
+    def hit(self, key):
+        stats = self.get(key)
+        stats.hits += 1
+        stats.decay(self.max_count)
+
+    def worth_caching(self, stats):
+        if stats.execs < self.min_samples:
+            # still learning
+            return True
+        if stats.exec_time < self.min_time:
+            return False
+        return stats.reuse >= self.min_reuse
+
+    def admit(self, key):
+        """ Whether values of the expression should be cached """
+        stats = self.stats.get(key, None)
+        if stats is None or self.worth_caching(stats):
+            return True
+        stats.skipped += 1
+        # probe now and then in case it changed
+        return stats.skipped % self.probe_interval == 0
+
+    # persistence
+
+    @property
+    def stats_path(self):
+        return os.path.join(self.path, STATS_NAME)
+
+    def load(self):
+        try:
+            with open(self.stats_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, values in data.items():
+            self.stats[key] = ExprStats(*values)
+
+    def save(self):
+        if self.path is None:
+            return
+        data = {key: stats.to_list() for key, stats in self.stats.items()}
+        tmp_path = self.stats_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.stats_path)
+
+    def close(self):
+        self.save()
+        atexit.unregister(self.close)
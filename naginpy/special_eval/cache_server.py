@@ -0,0 +1,465 @@
+"""
+Content addressed result cache shared between kernels.
+
+Stateless Manifests have a key that means the same thing in every process,
+so their values can be computed once and shared. Results are stored by
+`Manifest.hash_key` in a `LocalStore` and synced against a `CacheServer`
+over a socket.
+
+```
+secret = os.environ['NAGINPY_CACHE_SECRET']
+
+# shared box
+server = CacheServer(LocalStore('/data/naginpy-cache'),
+                     ('cachebox.internal', 7447), secret=secret)
+server.serve_forever()
+
+# each kernel
+shared = SharedCache(LocalStore('~/.naginpy/cache'),
+                     CacheClient(('cachebox.internal', 7447), secret=secret))
+manager = ComputationManager(shared=shared)
+```
+
+Values are pickled, so a blob is code. Server and clients share a secret:
+
+- a connection starts with the server sending a nonce and the client
+  answering with HMAC(secret, nonce). Otherwise the server hangs up.
+- blobs end with HMAC(secret, key | body), added by the kernel that
+  computed the value. The server checks it on PUT and clients check it on
+  GET. Blobs that don't verify are never published to the receiving
+  store, so nothing that came over the network is loaded unless it was
+  written by a holder of the secret, even if the server's disk was
+  tampered with.
+
+The server binds to localhost unless told otherwise.
+
+Only blobs missing from the local store go over the wire. `fetch` asks for
+many keys in one request and blobs are streamed in chunks straight into the
+local store, so large results never sit in memory twice.
+
+Protocol, all integers little endian:
+
+    handshake: server sends nonce(16), client replies mac(32)
+    request  : op(1) | payload length(uint32) | newline separated keys
+    HAS      : reply is one byte per key, 1 if present
+    GET      : reply per key is size(uint64) then size bytes.
+               MISSING size means the server doesn't have it.
+    PUT      : one key, followed by size(uint64) and size bytes.
+               reply 1 byte, 1 if the blob verified and was stored
+    blob     : body | mac(32)
+"""
+import hashlib
+import hmac
+import os
+import pickle
+import socket
+import socketserver
+import struct
+import threading
+from contextlib import contextmanager
+
+from . import mmap_store
+
+OP_HAS = b'H'
+OP_GET = b'G'
+OP_PUT = b'P'
+
+_REQ = struct.Struct('<cI')
+_SIZE = struct.Struct('<Q')
+MISSING = 2 ** 64 - 1
+
+# 1MB chunks for streaming blobs
+CHUNK_SIZE = 2 ** 20
+
+NONCE_SIZE = 16
+MAC_SIZE = hashlib.sha256().digest_size
+_AUTH_CONTEXT = b'naginpy-cache-auth'
+
+
+def _secret_bytes(secret):
+    if not secret:
+        raise ValueError("A shared secret is required")
+    if isinstance(secret, str):
+        secret = secret.encode('utf-8')
+    return secret
+
+def _blob_mac(secret, key):
+    """ HMAC over a blob body, fed as it streams """
+    mac = hmac.new(secret, digestmod=hashlib.sha256)
+    mac.update(key.encode('utf-8'))
+    mac.update(b'\0')
+    return mac
+
+def sign_blob(path, key, secret, chunk_size=CHUNK_SIZE):
+    """ Append the mac trailer to a written blob """
+    mac = _blob_mac(secret, key)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            mac.update(chunk)
+    with open(path, 'ab') as f:
+        f.write(mac.digest())
+
+
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        read = sock.recv_into(view[pos:])
+        if not read:
+            raise ConnectionError("connection closed")
+        pos += read
+    return bytes(buf)
+
+def _recv_to_file(sock, size, f, mac, chunk_size=CHUNK_SIZE):
+    """ Stream a blob into f. Returns whether its mac trailer verified. """
+    buf = bytearray(min(size, chunk_size) or 1)
+    view = memoryview(buf)
+    body_size = size - MAC_SIZE
+    pos = 0
+    trailer = bytearray()
+    while pos < size:
+        read = sock.recv_into(view[:min(size - pos, chunk_size)])
+        if not read:
+            raise ConnectionError("connection closed")
+        f.write(view[:read])
+        body = max(0, min(read, body_size - pos))
+        mac.update(view[:body])
+        trailer += view[body:read]
+        pos += read
+    return body_size >= 0 and hmac.compare_digest(bytes(trailer),
+                                                  mac.digest())
+
+def _send_file(sock, path, chunk_size=CHUNK_SIZE):
+    size = os.path.getsize(path)
+    sock.sendall(_SIZE.pack(size))
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sock.sendall(chunk)
+
+def _send_request(sock, op, keys):
+    payload = '\n'.join(keys).encode('utf-8')
+    sock.sendall(_REQ.pack(op, len(payload)) + payload)
+
+def _recv_request(sock):
+    op, length = _REQ.unpack(_recv_exact(sock, _REQ.size))
+    payload = _recv_exact(sock, length).decode('utf-8')
+    keys = payload.split('\n') if payload else []
+    return op, keys
+
+
+class LocalStore(object):
+    """
+    Directory of blobs keyed by hash key. Writes go to a temp file and are
+    moved into place, so readers never see a partial blob.
+    """
+    suffix = '.blob'
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+
+    def blob_path(self, key):
+        if os.sep in key or '\n' in key:
+            raise ValueError("Invalid key {0}".format(key))
+        return os.path.join(self.path, key + self.suffix)
+
+    def __contains__(self, key):
+        return os.path.exists(self.blob_path(key))
+
+    def missing(self, keys):
+        return [key for key in keys if key not in self]
+
+    def keys(self):
+        for name in os.listdir(self.path):
+            if name.endswith(self.suffix):
+                yield name[:-len(self.suffix)]
+
+    @contextmanager
+    def writer(self, key):
+        """
+        File to write a blob into. Only published on success, and not if
+        `f.discard` was set.
+        """
+        path = self.blob_path(key)
+        tmp_path = '{0}.{1}.{2}'.format(path, os.getpid(),
+                                        threading.get_ident())
+        try:
+            with open(tmp_path, 'wb') as f:
+                yield f
+            if not getattr(f, 'discard', False):
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def remove(self, key):
+        os.remove(self.blob_path(key))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """ One connection. Serves requests until the client hangs up. """
+    def handle(self):
+        nonce = os.urandom(NONCE_SIZE)
+        try:
+            self.request.sendall(nonce)
+            answer = _recv_exact(self.request, MAC_SIZE)
+        except ConnectionError:
+            return
+        if not hmac.compare_digest(answer, self.server.auth_mac(nonce)):
+            # wrong or no secret
+            return
+        while True:
+            try:
+                op, keys = _recv_request(self.request)
+            except ConnectionError:
+                return
+            self.server.dispatch(self.request, op, keys)
+
+
+class CacheServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Reference server around a LocalStore. Use port 0 to pick a free port,
+    the bound address is in `server_address`.
+
+    secret : str or bytes
+        Shared with the clients. Required.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, store, address=('127.0.0.1', 0),
+                 chunk_size=CHUNK_SIZE, *, secret):
+        self.store = store
+        self.secret = _secret_bytes(secret)
+        self.chunk_size = chunk_size
+        self._thread = None
+        super().__init__(address, _Handler)
+
+    def auth_mac(self, nonce):
+        return hmac.new(self.secret, _AUTH_CONTEXT + nonce,
+                        hashlib.sha256).digest()
+
+    def dispatch(self, sock, op, keys):
+        if op == OP_HAS:
+            sock.sendall(bytes(key in self.store for key in keys))
+        elif op == OP_GET:
+            for key in keys:
+                if key not in self.store:
+                    sock.sendall(_SIZE.pack(MISSING))
+                    continue
+                _send_file(sock, self.store.blob_path(key), self.chunk_size)
+        elif op == OP_PUT:
+            key, = keys
+            size, = _SIZE.unpack(_recv_exact(sock, _SIZE.size))
+            with self.store.writer(key) as f:
+                ok = _recv_to_file(sock, size, f, _blob_mac(self.secret, key),
+                                   self.chunk_size)
+                f.discard = not ok
+            sock.sendall(b'\x01' if ok else b'\x00')
+        else:
+            raise ValueError("Unknown op {0}".format(op))
+
+    def start(self):
+        """ Serve from a background thread """
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class CacheClient(object):
+    """
+    Talks to a CacheServer. Connections are kept in a pool and reused, a
+    connection that errors is dropped instead of going back to the pool.
+
+    secret : str or bytes
+        Same as the server's. Required.
+    """
+    def __init__(self, address, pool_size=4, timeout=30,
+                 chunk_size=CHUNK_SIZE, *, secret):
+        self.address = address
+        self.secret = _secret_bytes(secret)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._pool = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            sock = self._pool.pop() if self._pool else None
+        if sock is None:
+            sock = socket.create_connection(self.address, self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                self._authenticate(sock)
+            except BaseException:
+                sock.close()
+                raise
+
+        try:
+            yield sock
+        except BaseException:
+            sock.close()
+            raise
+
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(sock)
+                sock = None
+        if sock is not None:
+            sock.close()
+
+    def _authenticate(self, sock):
+        nonce = _recv_exact(sock, NONCE_SIZE)
+        sock.sendall(hmac.new(self.secret, _AUTH_CONTEXT + nonce,
+                              hashlib.sha256).digest())
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, []
+        for sock in pool:
+            sock.close()
+
+    def contains(self, keys):
+        """ Return the set of keys the server has """
+        keys = list(keys)
+        if not keys:
+            return set()
+        with self.connection() as sock:
+            _send_request(sock, OP_HAS, keys)
+            flags = _recv_exact(sock, len(keys))
+        return {key for key, flag in zip(keys, flags) if flag}
+
+    def fetch(self, keys, store):
+        """
+        Stream the blobs for keys into store in one request. Keys already in
+        store are not requested. Returns the keys that were transferred.
+        """
+        keys = store.missing(dict.fromkeys(keys))
+        if not keys:
+            return []
+
+        fetched = []
+        with self.connection() as sock:
+            _send_request(sock, OP_GET, keys)
+            for key in keys:
+                size, = _SIZE.unpack(_recv_exact(sock, _SIZE.size))
+                if size == MISSING:
+                    continue
+                with store.writer(key) as f:
+                    ok = _recv_to_file(sock, size, f,
+                                       _blob_mac(self.secret, key),
+                                       self.chunk_size)
+                    # never publish a blob we can't vouch for
+                    f.discard = not ok
+                if ok:
+                    fetched.append(key)
+        return fetched
+
+    def push(self, keys, store):
+        """
+        Upload blobs from store that the server is missing. Returns the keys
+        that were transferred.
+        """
+        keys = [key for key in dict.fromkeys(keys) if key in store]
+        remote = self.contains(keys)
+        keys = [key for key in keys if key not in remote]
+        pushed = []
+        with self.connection() as sock:
+            for key in keys:
+                _send_request(sock, OP_PUT, [key])
+                _send_file(sock, store.blob_path(key), self.chunk_size)
+                if _recv_exact(sock, 1) == b'\x01':
+                    pushed.append(key)
+        return pushed
+
+
+def _manifest_key(manifest):
+    if not manifest.stateless:
+        raise ValueError("Only stateless Manifests can be shared")
+    return manifest.hash_key
+
+def dump_value(value, f):
+    """
+    Arrays and frames use the mmap format so loading them is zero-copy.
+    Everything else is pickled.
+    """
+    if mmap_store.supported(value):
+        mmap_store.dump(value, f.name)
+        return
+    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_value(path):
+    with open(path, 'rb') as f:
+        if f.read(len(mmap_store.MAGIC)) != mmap_store.MAGIC:
+            f.seek(0)
+            return pickle.load(f)
+    return mmap_store.load(path)
+
+
+class SharedCache(object):
+    """
+    Values of stateless Manifests, backed by a LocalStore and optionally a
+    CacheClient. Misses in the local store are fetched from the server.
+
+    secret : str or bytes
+        Signs the blobs written here. Defaults to the client's.
+    """
+    def __init__(self, local, client=None, secret=None):
+        self.local = local
+        self.client = client
+        if secret is None and client is not None:
+            secret = client.secret
+        self.secret = None if secret is None else _secret_bytes(secret)
+
+    def fetch(self, manifests):
+        """ Bulk pull the values for manifests into the local store """
+        keys = [_manifest_key(m) for m in manifests if m.stateless]
+        if self.client is None:
+            return []
+        return self.client.fetch(keys, self.local)
+
+    def __contains__(self, manifest):
+        if not manifest.stateless:
+            return False
+        key = manifest.hash_key
+        if key in self.local:
+            return True
+        return self.client is not None and key in self.client.contains([key])
+
+    def get(self, manifest):
+        """ Raises KeyError if neither the local store or server have it """
+        key = _manifest_key(manifest)
+        if key not in self.local and self.client is not None:
+            self.client.fetch([key], self.local)
+        if key not in self.local:
+            raise KeyError(key)
+        return load_value(self.local.blob_path(key))
+
+    def put(self, manifest, value):
+        key = _manifest_key(manifest)
+        if key not in self.local:
+            with self.local.writer(key) as f:
+                dump_value(value, f)
+                f.flush()
+                if self.secret is not None:
+                    sign_blob(f.name, key, self.secret)
+        if self.client is not None:
+            self.client.push([key], self.local)
+        return key
@@ -0,0 +1,202 @@
+"""
+Deferred column expressions for non-standard evaluation.
+
+With `@nse(columns=True)`, `filter(df, hp > 100)` doesn't evaluate
+`hp > 100` in the caller. NSEEngine hands filter a ColumnExpr instead, and
+filter calls it with the frame:
+
+```
+expr(df) # hp > 100 with hp bound to df['hp']
+```
+
+The whole expression runs as array operations over the columns, with no
+per row Python loop. Each distinct expression source is compiled once and
+shared. If numexpr is installed and the expression only uses arithmetic,
+comparisons and boolean operators, it's evaluated as one fused numexpr
+kernel over the column arrays.
+
+Like R, `and`, `or` and `not` mean the elementwise `&`, `|` and `~`.
+
+Names that are not columns are looked up in the namespace the expression
+was captured in, so `filter(df, hp > threshold)` works.
+"""
+import ast
+
+from asttools import ast_source
+
+# source => CompiledExpr
+_COMPILED = {}
+
+_NUMEXPR_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Name,
+    ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod,
+    ast.USub, ast.UAdd, ast.Invert, ast.BitAnd, ast.BitOr, ast.Eq,
+    ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+class _ElementwiseBool(ast.NodeTransformer):
+    """ and/or/not => &/|/~ """
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        out = node.values[0]
+        for value in node.values[1:]:
+            out = ast.BinOp(left=out, op=op, right=value)
+        return out
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+def _numexpr_ok(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) \
+               or not isinstance(node.value, (int, float)):
+                return False
+            continue
+        if not isinstance(node, _NUMEXPR_NODES):
+            return False
+        if isinstance(node, ast.Compare) and len(node.ops) != 1:
+            return False
+    return True
+
+# combine their inputs value by value
+_ELEMENTWISE_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare,
+    ast.Name, ast.Constant, ast.expr_context, ast.operator, ast.unaryop,
+    ast.boolop, ast.cmpop,
+)
+
+def _lookup(node, env):
+    if isinstance(node, ast.Name):
+        return env.get(node.id, None)
+    if isinstance(node, ast.Attribute):
+        obj = _lookup(node.value, env)
+        return getattr(obj, node.attr, None)
+    return None
+
+def elementwise(tree, env=None):
+    """
+    Whether each value of the result only depends on the values at the same
+    position: operators, comparisons, constants and calls to numpy ufuncs
+    found in env. Anything else, like a method call or an aggregate, may
+    look at other rows.
+    """
+    if env is None:
+        env = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Call):
+            func = _lookup(node.func, env)
+            if node.keywords or type(func).__name__ != 'ufunc':
+                return False
+            stack.extend(node.args)
+            continue
+        if not isinstance(node, _ELEMENTWISE_NODES):
+            return False
+        stack.extend(ast.iter_child_nodes(node))
+    return True
+
+def _numexpr():
+    try:
+        import numexpr
+    except ImportError:
+        return None
+    return numexpr
+
+
+class CompiledExpr(object):
+    def __init__(self, source):
+        self.source = source
+        tree = ast.parse(source.strip(), mode='eval')
+        tree = ast.fix_missing_locations(_ElementwiseBool().visit(tree))
+        self.tree = tree
+        self.code = compile(tree, '<nse:{0}>'.format(source), 'eval')
+        self.names = frozenset(node.id for node in ast.walk(tree)
+                               if isinstance(node, ast.Name))
+        self.numexpr_ok = _numexpr_ok(tree)
+        self.numexpr_source = ast_source(tree.body)
+
+def compile_expr(source):
+    """ Compiled once per distinct source """
+    compiled = _COMPILED.get(source, None)
+    if compiled is None:
+        compiled = CompiledExpr(source)
+        _COMPILED[source] = compiled
+    return compiled
+
+
+def _is_numeric_array(value):
+    dtype = getattr(value, 'dtype', None)
+    return dtype is not None and getattr(dtype, 'kind', None) in 'biuf'
+
+class ColumnExpr(object):
+    """
+    A captured expression. Call with a frame to evaluate it against the
+    frame's columns.
+    """
+    def __init__(self, source, env=None):
+        self.compiled = compile_expr(source)
+        if env is None:
+            env = {}
+        self.env = env
+
+    @property
+    def source(self):
+        return self.compiled.source
+
+    @property
+    def rowwise(self):
+        """ Can be evaluated per row chunk """
+        return elementwise(self.compiled.tree, self.env)
+
+    @property
+    def names(self):
+        """ Names that could be columns """
+        return set(self.compiled.names)
+
+    def columns(self, frame):
+        return [name for name in self.compiled.names if name in frame]
+
+    def __call__(self, frame):
+        compiled = self.compiled
+        columns = self.columns(frame)
+
+        numexpr = _numexpr() if compiled.numexpr_ok else None
+        if numexpr is not None:
+            local_dict = self._numexpr_locals(frame)
+            if local_dict is not None:
+                return numexpr.evaluate(compiled.numexpr_source,
+                                        local_dict=local_dict,
+                                        global_dict={})
+
+        # columns shadow the captured namespace
+        local_ns = {name: frame[name] for name in columns}
+        return eval(compiled.code, self.env, local_ns)
+
+    def _numexpr_locals(self, frame):
+        """
+        Values for the numexpr kernel. None if any of them is not numeric
+        or not found. Unknown names are left to eval to raise NameError.
+        """
+        local_dict = {}
+        for name in self.compiled.names:
+            if name in frame:
+                value = frame[name].to_numpy()
+            elif name in self.env:
+                value = self.env[name]
+            else:
+                return None
+            if not (_is_numeric_array(value)
+                    or isinstance(value, (int, float))):
+                return None
+            local_dict[name] = value
+        return local_dict
+
+    def __repr__(self):
+        return "ColumnExpr({0})".format(self.source)
@@ -1,17 +1,73 @@
 import ast
-
-from earthdragon.tools.timer import Timer
+import time
+from collections import OrderedDict
 
 from asttools import ast_source, _eval
-from .manifest import Manifest, Expression, _manifest
-from .exec_context import ExecutionContext
+from .manifest import Manifest, Expression, _manifest, intern_manifest
+from .exec_context import (
+    ContextObject,
+    ScalarObject,
+    ModuleContext
+)
+from .manifest_log import result_size
+from .ranges import RangeIndex, sub_slice
+
+# manifests of evicted entries remembered to notice would-be hits
+_EVICTED_SIZE = 1024
+
+def _guard_obj(item):
+    """
+    Return the namespace object that `_contextify` wrapped to create item.
+    """
+    if type(item) in (ContextObject, ScalarObject, ModuleContext):
+        return item.obj
+    return item
+
+class CacheSlot(object):
+    """
+    Pre-resolved handle to a Computable's value.
+
+    The getter node calls the slot with the current values of the context
+    variables. If they are the same objects the Computable was created
+    with, the cached value is returned directly. Otherwise we fall back to
+    a full ComputationManager lookup.
+    """
+    def __init__(self, manager, entry):
+        self.manager = manager
+        self.entry = entry
+        self.names = tuple(entry.context.keys())
+        self.objects = tuple(_guard_obj(entry.context[k]) for k in self.names)
+        # the first call after the slot is handed out was already counted
+        # by the ComputationManager.get that found the entry
+        self.fresh = True
+
+    def __call__(self, *args):
+        for arg, obj in zip(args, self.objects):
+            if arg is not obj:
+                return self.miss(args)
+        if self.fresh:
+            self.fresh = False
+        else:
+            # e.g. a loop body. never goes through get
+            self.manager.hit(self.entry)
+        return self.entry.value
+
+    def miss(self, args):
+        ns = dict(zip(self.names, args))
+        entry = self.manager.get(self.entry.expression.code, ns)
+        return self.manager.execute(entry)
 
 class Computable(object):
+    __slots__ = ('manifest', 'value', 'exec_time', 'executed', 'hits', 'lock')
+
     def __init__(self, manifest):
         self.manifest = manifest
         self.value = None
         self.exec_time = None
         self.executed = False
+        self.hits = 0
+        # set when another thread may execute this entry. see warmup.py
+        self.lock = None
 
     @property
     def expression(self):
@@ -33,48 +89,197 @@ class ComputationManager(object):
 
     Note, all computables are Deferable, though that does not mean we 
     use this manager for deferment. 
+
+    shared : SharedCache
+        Optional. Values of stateless Manifests are looked up in and
+        published to the shared cache.
+    log : ManifestLog
+        Optional. Every executed Manifest is recorded.
+    admission : AdmissionPolicy
+        Optional. Learns per expression whether caching pays off. Values
+        of expressions it rejects are not kept after they execute.
     """
 
-    def __init__(self):
+    def __init__(self, shared=None, log=None, admission=None):
         self.cache = {}
         self.value_map = {}
+        self.slots = {}
+        self.shared = shared
+        self.log = log
+        self.admission = admission
+        # hash_key => None, LRU of evicted manifests
+        self.evicted = OrderedDict()
+        # cached iloc/loc slices
+        self.ranges = RangeIndex()
 
     def get(self, code, context):
         # trick to get hashable key
         manifest = _manifest(code, context)
-        cache_entry = Computable(manifest)
-        cache_entry = self.cache.setdefault(manifest, cache_entry)
+        cache_entry = self.cache.get(manifest, None)
+        if cache_entry is None:
+            # interned once, when the entry is created. lookups only need
+            # the structural hash, not hash_key
+            manifest = intern_manifest(manifest)
+            cache_entry = self.cache.setdefault(manifest,
+                                                Computable(manifest))
+        if cache_entry.executed:
+            self.hit(cache_entry)
+        elif self.admission is not None and self.evicted:
+            key = manifest.hash_key
+            if key in self.evicted:
+                # would have been a hit if we had kept it
+                del self.evicted[key]
+                self.admission.hit(manifest.expression.key)
         return cache_entry
 
-    def value(self, source_hash, **kwargs):
-        """
-        Return the value returned by Manifest matching
-        tuple(source_hash, context)
+    def hit(self, entry):
+        """ Count a reuse of entry's value """
+        entry.hits += 1
+        if self.log is not None:
+            self.log.hit(entry)
+        if self.admission is not None:
+            self.admission.hit(entry.expression.key)
 
-        This is only called by the getter_node.
-        """
-        context = ExecutionContext.from_ns(kwargs)
-        key = tuple([source_hash, context])
-        if key not in self.cache:
-            raise Exception("Should not reach a cold cache"+str(key))
-        entry = self.cache[key]
-        return entry.value
+    def admits(self, code):
+        """ Whether the admission policy wants code cached """
+        if self.admission is None:
+            return True
+        return self.admission.admit(Expression(code).key)
 
     def by_value(self, val):
         """ Return the Computable by value """
         return self.value_map.get(id(val))
 
-    def execute(self, entry, override=False):
+    def execute(self, entry, override=False, compute=None):
+        """
+        compute : callable
+            Optional. Produces the value instead of `entry.manifest.eval()`.
+            For callers that can build the value more cheaply than the
+            Manifest expression, e.g. from other cached entries.
+        """
         # execute if need be
-        if not entry.executed or override:
-            with Timer(verbose=False) as t:
-                res = entry.manifest.eval()
-            entry.value = res
-            entry.exec_time = t.interval
-            entry.executed = True
-            self.value_map[id(entry.value)] = entry
+        if entry.executed and not override:
+            return entry.value
+
+        lock = entry.lock
+        if lock is None:
+            return self._execute(entry, override, compute)
+        with lock:
+            return self._execute(entry, override, compute)
+
+    def _execute(self, entry, override, compute=None):
+        if entry.executed and not override:
+            # executed while we waited on the lock
+            return entry.value
+
+        if not override:
+            from_range = self.range_compute(entry)
+            if from_range is not None:
+                # recorded like an execution, only cheaper
+                compute = from_range
+            elif self.load_shared(entry):
+                return entry.value
+
+        if compute is None:
+            compute = entry.manifest.eval
+
+        start = time.perf_counter()
+        res = compute()
+        entry.value = res
+        entry.exec_time = time.perf_counter() - start
+        entry.executed = True
+
+        if not self.admitted(entry):
+            # still usable by whoever asked, but not kept
+            self.evict(entry)
+            if self.log is not None:
+                self.log.record(entry)
+            return entry.value
+
+        self.value_map[id(entry.value)] = entry
+        self.ranges.add(entry)
+
+        if self.log is not None:
+            self.log.record(entry)
+
+        if self.shared is not None and entry.manifest.stateless:
+            self.shared.put(entry.manifest, entry.value)
         return entry.value
 
+    def admitted(self, entry):
+        """ Record the execution and decide whether to keep the value """
+        admission = self.admission
+        if admission is None:
+            return True
+        key = entry.expression.key
+        admission.record(key, entry.exec_time, result_size(entry.value))
+        return admission.worth_caching(admission.get(key))
+
+    def evict(self, entry):
+        manifest = entry.manifest
+        if self.cache.get(manifest, None) is entry:
+            del self.cache[manifest]
+        self.slots.pop(manifest, None)
+        self.ranges.remove(entry)
+        self.evicted[manifest.hash_key] = None
+        if len(self.evicted) > _EVICTED_SIZE:
+            self.evicted.popitem(last=False)
+
+    def invalidate(self, obj):
+        """
+        Drop the entries whose context holds obj itself. Called when obj
+        is mutated in place, since its key is its id.
+        """
+        dropped = []
+        for manifest, entry in list(self.cache.items()):
+            items = manifest.context.values()
+            if any(_guard_obj(item) is obj for item in items):
+                del self.cache[manifest]
+                self.slots.pop(manifest, None)
+                self.value_map.pop(id(entry.value), None)
+                self.ranges.remove(entry)
+                dropped.append(entry)
+        return dropped
+
+    def _cached(self, entry):
+        return self.cache.get(entry.manifest, None) is entry
+
+    def range_compute(self, entry):
+        """
+        Callable that slices entry's value out of a cached slice of the same
+        object that covers it, or None. See ranges.py.
+        """
+        if not self.ranges.groups:
+            return None
+        found = self.ranges.find(entry.manifest, valid=self._cached)
+        if found is None:
+            return None
+
+        cached_key, cached, wanted = found
+
+        def compute():
+            self.hit(cached)
+            return sub_slice(cached.value, cached_key, wanted)
+        return compute
+
+    def load_shared(self, entry):
+        """ Fill entry from the shared cache. Returns True on a hit. """
+        if self.shared is None or not entry.manifest.stateless:
+            return False
+        try:
+            entry.value = self.shared.get(entry.manifest)
+        except KeyError:
+            return False
+        entry.executed = True
+        self.value_map[id(entry.value)] = entry
+        return True
+
+    def prefetch(self, entries):
+        """ Pull the shared values for entries in one batch """
+        if self.shared is None:
+            return []
+        return self.shared.fetch([entry.manifest for entry in entries])
+
     def generate_getter_node(self, entry, context=None):
         """
         Given a Computable, we will return an AST node and namespace update
@@ -83,37 +288,34 @@ class ComputationManager(object):
         The namespace update dict should be the only additional context
         variables needed to plug in the Computed value.
         """
+        slot = self.slots.get(entry.manifest, None)
+        if slot is None or slot.entry is not entry:
+            slot = CacheSlot(self, entry)
+            if self.cache.get(entry.manifest, None) is entry:
+                # evicted entries only serve the current line
+                self.slots[entry.manifest] = slot
 
-        context = entry.context
-        source_hash = entry.expression.key
-
-        return self._generate_getter_node(source_hash, context)
+        slot.fresh = True
+        return self._generate_getter_node(slot)
 
-    def _generate_getter_node(self, source_hash, context):
+    def _generate_getter_node(self, slot):
         """
         This getter strategy replaces the expression with
 
         ```
-        __defer_manager__.value(source_hash, key1=key1, key2=key, ...)
+        __cache_slot_{id}__(key1, key2, ...)
         ```
 
-        The idea here is that the **kwargs will serve as the ExecutionContext
-        during the lookup.
+        where the slot is bound in the namespace. A cache hit is an identity
+        check on the args and an attribute lookup. No ExecutionContext is
+        built on the hot path.
         """
+        name = '__cache_slot_{0}__'.format(id(slot))
+        func = ast.Name(id=name, ctx=ast.Load())
+        args = [ast.Name(id=k, ctx=ast.Load()) for k in slot.names]
 
-        func = ast.Attribute(
-            value=ast.Name(id="__defer_manager__", ctx=ast.Load()),
-            attr="value", ctx=ast.Load()
-        )
-        args = [ast.Str(s=source_hash)]
-        keywords = [ast.keyword(
-            arg=k,
-            value=ast.Name(id=k, ctx=ast.Load()))
-            for k in context.keys()
-        ]
-
-        getter = ast.Call(func=func, args=args, keywords=keywords, 
+        getter = ast.Call(func=func, args=args, keywords=[],
                           starargs=None, kwargs=None)
 
-        ns_update = {'__defer_manager__': self}
+        ns_update = {name: slot}
         return ast.fix_missing_locations(getter), ns_update
@@ -1,14 +1,80 @@
 import ast
+import types
 from collections import OrderedDict
 
 from asttools import ast_print, replace_node, is_load_name
 
+from .computation import CacheSlot
 from .engine import Engine
+from .exec_context import _is_scalar
+from .purity import (
+    Traits,
+    TRIVIAL,
+    CHEAP,
+    DEFAULT_TRAITS,
+    get_traits,
+    method_traits,
+)
+
+# elementwise work on fewer elements than this isn't worth a cache lookup
+MIN_SIZE = 2 ** 16
+
+_STATIC_SLICES = (ast.Constant, ast.Slice, ast.Tuple, ast.UnaryOp,
+                  ast.unaryop, ast.expr_context)
+
+
+def _is_static(node):
+    """ Name or attribute chain of names. Resolving it calls nothing. """
+    while isinstance(node, ast.Attribute):
+        node = node.value
+    return isinstance(node, ast.Name)
+
+def _static_slice(node):
+    """ Constant index or slice, e.g. `df['a']` or `arr[:10, 2]` """
+    return all(isinstance(sub, _STATIC_SLICES) for sub in ast.walk(node))
+
+def _inplace_kwarg(keywords):
+    """ `inplace=True` or `out=arr` """
+    for keyword in keywords:
+        if keyword.arg not in ('inplace', 'out'):
+            continue
+        value = getattr(keyword.value, 'value', True)
+        if value not in (False, None):
+            return True
+    return False
+
+def _size(obj):
+    """ Number of elements. None if unknown. """
+    if isinstance(obj, CacheSlot):
+        obj = obj.entry.value
+    size = getattr(obj, 'size', None)
+    if isinstance(size, int):
+        return size
+    if _is_scalar(obj):
+        return 1
+    if isinstance(obj, (types.ModuleType, type)) or callable(obj):
+        return 0
+    try:
+        return len(obj)
+    except TypeError:
+        return None
 
 
 class DataCacheEngine(Engine):
-    def __init__(self, defer_manager):
+    """
+    Caches the BinOp, Call, Subscript and Compare nodes of a line in the
+    ComputationManager and swaps them for getters.
+
+    Nodes are only cached where it can pay off, see purity.py. Impure nodes
+    and anything containing them are left alone, TRIVIAL ones too. CHEAP
+    ones, like elementwise ops, are cached when their inputs have at least
+    `min_size` elements. The manager's admission policy, if any, has the
+    last word. Nodes that don't run exactly once per line, like those in a
+    def body or loop, are never cached.
+    """
+    def __init__(self, defer_manager, min_size=MIN_SIZE):
         self.defer_manager = defer_manager
+        self.min_size = min_size
         self.sections = []
 
     def should_handle_line(self, line, load_names):
@@ -41,13 +107,99 @@ class DataCacheEngine(Engine):
                 sections.append(context)
         return node
 
+    def _func(self, node, context):
+        if not _is_static(node):
+            return None
+        try:
+            return context.mgr.obj(node)
+        except (NameError, AttributeError):
+            return None
+
+    def node_traits(self, context):
+        node = context.node
+        if isinstance(node, ast.Subscript):
+            if _static_slice(node.slice):
+                return Traits(cost=TRIVIAL)
+            return Traits(cost=CHEAP)
+
+        if not isinstance(node, ast.Call):
+            # elementwise
+            return Traits(cost=CHEAP)
+
+        func = self._func(node.func, context)
+        if func is not None:
+            traits = get_traits(func)
+        elif isinstance(node.func, ast.Attribute):
+            traits = method_traits(node.func.attr)
+        else:
+            traits = DEFAULT_TRAITS
+
+        if _inplace_kwarg(node.keywords):
+            traits = Traits(pure=False, inplace=True, cost=traits.cost)
+        return traits
+
+    def mutated(self, context):
+        """ Object an in-place call mutates, None if we can't tell """
+        node = context.node
+        func = self._func(node.func, context)
+        receiver = getattr(func, '__self__', None)
+        if receiver is not None \
+           and not isinstance(receiver, types.ModuleType):
+            return receiver
+        if isinstance(node.func, ast.Attribute):
+            return self._func(node.func.value, context)
+        if node.args:
+            return self._func(node.args[0], context)
+        return None
+
+    def input_size(self, node, ns):
+        total = 0
+        for name in filter(is_load_name, ast.walk(node)):
+            size = _size(ns.get(name.id, None))
+            if size is None:
+                return float('inf')
+            total = max(total, size)
+        return total
+
+    def should_cache(self, context, traits, impure, ns):
+        if not traits.cacheable:
+            return False
+        # a def body or loop runs after its slot is gone from ns, or
+        # needs a fresh value every time
+        if context.deferred:
+            return False
+
+        node = context.node
+        inner = set(map(id, ast.walk(node)))
+        if any(id(other) in inner for other in impure):
+            return False
+
+        if traits.cost == TRIVIAL:
+            return False
+        if traits.cost == CHEAP \
+           and self.input_size(node, ns) < self.min_size:
+            return False
+        # observed timings, if the manager tracks them
+        return self.defer_manager.admits(node)
+
     def post_node_loop(self, line, ns):
         sections = self.sections
+        self.sections = []
         dm = self.defer_manager
         # add defer manager to ns. definitely doesn't feel right. revisit
 
+        # decide before nodes get swapped for getters
+        traits = {context: self.node_traits(context) for context in sections}
+        impure = [context.node for context in sections
+                  if not traits[context].cacheable]
+        mutated = [self.mutated(context) for context in sections
+                   if traits[context].inplace]
+
         # start from the smaller bits and move out.
         for context in sorted(sections, key=lambda x: x.depth, reverse=True):
+            if not self.should_cache(context, traits[context], impure, ns):
+                continue
+
             node = context.node
 
             # grab the variables referenced by this piece code
@@ -66,7 +218,15 @@ class DataCacheEngine(Engine):
                 context.field_index,
                 new_node
             )
-            ns.update(ns_update)
+            # only for this line. a slot left in ns would keep its value
+            # alive after the entry is evicted
+            for name, value in ns_update.items():
+                context.mgr.bind(name, value)
+
+        for obj in mutated:
+            if obj is not None:
+                # its id based entries are about to be stale
+                dm.invalidate(obj)
 
     def line_postprocess(self, line, ns):
         ast_print(line)
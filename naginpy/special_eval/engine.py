@@ -1,4 +1,6 @@
-from asttools import _eval, _exec
+import ast
+
+from asttools import _eval
 
 class Engine(object):
     """
@@ -14,8 +16,21 @@ class Engine(object):
     line_postprocess
         Fire after all lines have been processed by all engines. This is
         more for clean up. It was created primarily for NormalEval
+    bulk_postprocess
+        Fires instead of `line_postprocess` for a run of consecutive lines
+        that no engine handles. Defaults to calling `line_postprocess` per
+        line.
+
+    static : Bool
+        Engine only looks at the AST and never at node objects. Static
+        engines can run ahead of execution, which lets the import hook cache
+        their output.
+    version : str
+        Bump when the transform changes. Part of the import hook cache key.
     """
     _allow_missing = False
+    static = False
+    version = None
 
     def should_handle_line(self, line, load_names):
         return False
@@ -32,10 +47,47 @@ class Engine(object):
     def line_postprocess(self, line, ns):
         pass
 
+    def bulk_postprocess(self, lines, ns):
+        for line in lines:
+            self.line_postprocess(line, ns)
+
 class NormalEval(Engine):
-    def should_handle_line(self, line, load_names):
-        return True
+    """
+    Executes lines. NormalEval has no node handling of its own so it never
+    claims a line. That lets lines untouched by other engines go through
+    the `bulk_postprocess` fast path.
+
+    filename : str
+        Filename given to compiled lines. Shows up in tracebacks.
+    flags : int
+        Compiler flags, i.e. from `__future__` imports at the top of a
+        module. Each line is compiled separately, so they would otherwise
+        be lost after the first line.
+    """
+    filename = '<special_eval>'
+    flags = 0
+
+    def __init__(self, filename=None, flags=None):
+        if filename is not None:
+            self.filename = filename
+        if flags is not None:
+            self.flags = flags
 
     def line_postprocess(self, line, ns):
-        res = _exec(line, ns)
-        return res
+        return self._exec([line], ns)
+
+    def bulk_postprocess(self, lines, ns):
+        """
+        Compile the run of lines as one code object and exec it once.
+        """
+        if len(lines) == 1:
+            return self.line_postprocess(lines[0], ns)
+        return self._exec(lines, ns)
+
+    def _exec(self, lines, ns):
+        module = ast.Module(body=list(lines))
+        module.type_ignores = []
+        ast.fix_missing_locations(module)
+        code = compile(module, self.filename, 'exec', flags=self.flags,
+                       dont_inherit=True)
+        exec(code, ns)
@@ -1,10 +1,12 @@
 import ast
+import numbers
+import sys
 import types
 
-import numpy as np
 from asttools import (ast_source, _eval, is_load_name,
                               _convert_to_expression)
 
+from naginpy import hashing
 from naginpy.special_eval.manifest_abc import ManifestABC
 
 def _hashable(item):
@@ -14,8 +16,18 @@ def _hashable(item):
         return False
     return True
 
+# same as numpy.ScalarType minus the numpy types
+_SCALAR_TYPES = (int, float, complex, bool, bytes, str, memoryview)
+
 def _is_scalar(val):
-    return np.isscalar(val)
+    """
+    Equivalent of np.isscalar that does not require importing numpy. If
+    numpy has not been imported, there can't be any numpy scalars around.
+    """
+    if type(val) in _SCALAR_TYPES or isinstance(val, numbers.Number):
+        return True
+    np = sys.modules.get('numpy', None)
+    return np is not None and isinstance(val, np.generic)
 
 def _obj(val):
     if _is_scalar(val):
@@ -36,6 +48,8 @@ def _contextify(obj):
 
 class ContextObject(object):
     """ Represents an input arg to an Expression """
+    # there are a lot of these. no per instance __dict__
+    __slots__ = ('obj', '__weakref__')
     stateless = False
 
     def __init__(self, obj):
@@ -48,6 +62,11 @@ class ContextObject(object):
     def key(self):
         return str(id(self.obj))
 
+    @property
+    def hash_key(self):
+        """ Fixed length stable version of key """
+        return hashing.hash_key(self.key)
+
     def __hash__(self):
         return hash(self.key)
 
@@ -92,6 +111,7 @@ def _get_versions(mod):
 
 
 class ModuleContext(ContextObject):
+    __slots__ = ()
     stateless = True
 
     @property
@@ -112,6 +132,7 @@ class ScalarObject(ContextObject):
     """
     Context object to wrap scalars which are stateless.
     """
+    __slots__ = ()
     stateless = True
 
     def __init__(self, obj):
@@ -131,18 +152,51 @@ def get_source_key(source):
 class SourceObject(ContextObject):
     """
     Simple Stateless object that can take in a dict
+
+    Only stateless when the source has a `source_key` or one is given.
+    Otherwise the key falls back to id(source), which means nothing in
+    another process.
     """
-    stateless = True
+    __slots__ = ('source', '_obj_key', 'source_key', 'stateless')
 
     def __init__(self, source, key, source_key=None):
         self.source = source
         self._obj_key = key
+        self.stateless = source_key is not None \
+            or hasattr(source, 'source_key')
         if source_key is None:
             source_key = get_source_key(source)
         self.source_key = source_key
 
-    def get_obj(self):
-        return self.source.get(self._obj_key)
+    def get_obj(self, columns=None, filters=None):
+        """
+        columns : list
+            Only read these columns. Ignored if the source does not support
+            projection.
+        filters : list of (column, op, value)
+            Only read rows matching all filters. Ignored if the source does
+            not support predicates.
+        """
+        kwargs = {}
+        if columns is not None and self.supports_projection:
+            kwargs['columns'] = columns
+        if filters and self.supports_predicates:
+            kwargs['filters'] = filters
+        return self.source.get(self._obj_key, **kwargs)
+
+    @property
+    def supports_projection(self):
+        return getattr(self.source, 'supports_projection', False)
+
+    @property
+    def supports_predicates(self):
+        return getattr(self.source, 'supports_predicates', False)
+
+    def columns(self):
+        """ Column names available without reading the data """
+        if not self.supports_projection:
+            return None
+        return self.source.columns(self._obj_key)
 
     @property
     def key(self):
@@ -181,6 +235,8 @@ class ExecutionContext(object):
     Though this is more of a question of whether to automatically pickle
     small objects that don't explicitly handle special_eval
     """
+    __slots__ = ('data', 'mutable', '_hash', '_hash_key', '__weakref__')
+
     def __init__(self, data=None, mutable=False):
         if data is None:
             data = {}
@@ -195,6 +251,9 @@ class ExecutionContext(object):
 
         self.data = data
         self.mutable = mutable
+        # cached when immutable
+        self._hash = None
+        self._hash_key = None
 
     def copy(self, mutable=False):
         data = self.data.copy()
@@ -217,7 +276,13 @@ class ExecutionContext(object):
         return ns_hashset(self.data)
 
     def __hash__(self):
-        return hash(self.hashset())
+        if self._hash is not None:
+            return self._hash
+        h = hash(self.hashset())
+        if not self.mutable:
+            # nested Manifests hash their contexts over and over
+            self._hash = h
+        return h
 
     def __eq__(self, other):
         if isinstance(other, ExecutionContext):
@@ -290,12 +355,28 @@ class ExecutionContext(object):
 
         del self.data[key]
 
-    def extract(self):
+    def extract(self, projections=None, filters=None):
         """
         Get the actual values from execution context
+
+        projections : dict
+            var name => list of columns. Sources that support projection
+            will only read those columns.
+        filters : dict
+            var name => list of (column, op, value). Sources that support
+            predicates will only read matching rows.
         """
+        if projections is None:
+            projections = {}
+        if filters is None:
+            filters = {}
+
         out = {}
         for k, v in self.data.items():
+            if k in projections or k in filters:
+                out[k] = v.get_obj(columns=projections.get(k, None),
+                                   filters=filters.get(k, None))
+                continue
             out[k] = _obj(v)
 
         return out
@@ -308,6 +389,25 @@ class ExecutionContext(object):
         _dict_string = ", ".join(bits)
         return _dict_string
 
+    @property
+    def hash_key(self):
+        """
+        Fixed length stable version of key. Items are streamed in so large
+        contexts are never joined into one string.
+        """
+        if self._hash_key is not None:
+            return self._hash_key
+        hasher = hashing.Hasher()
+        for k in sorted(self.data):
+            hasher.update(k)
+            hasher.update('=')
+            hasher.update(self.data[k].hash_key)
+            hasher.update(',')
+        key = hasher.key()
+        if not self.mutable:
+            self._hash_key = key
+        return key
+
     def __repr__(self):
         class_name = self.__class__.__name__
         key = self.key
@@ -0,0 +1,625 @@
+"""
+R style model formulas.
+
+```
+fit = lm(y ~ x1 + x2 * g, data=mydata)
+```
+
+`~` is not a binary operator in Python, so `formula_transform` rewrites the
+source before it is parsed. Every `lhs ~ rhs` becomes
+
+```
+__formula__('y ~ x1 + x2 * g')
+```
+
+which returns a Formula: the parsed ModelSpec plus the namespace it was
+written in. Each distinct formula string is only parsed once.
+
+Supported terms:
+
+    a + b       both terms
+    a - b       drop term b. `- 1` drops the intercept
+    a:b         interaction
+    a * b       a + b + a:b
+    (a + b)^2   all interactions up to order 2
+    0, 1        no intercept / intercept
+    .           every column not on the left hand side
+    I(x ** 2)   anything else is a factor evaluated against the columns
+
+Numeric factors are one column. Strings, bools and categoricals get one
+indicator column per level, minus the first level when there is an
+intercept.
+
+DesignBuilder builds the design matrices with whole-column array operations
+and caches them in a ComputationManager. Factors, terms and the full matrix
+are each a Computable keyed by their source, the data and the names they
+read from the formula's namespace. When the data is a value the manager
+computed, its Manifest is the key. Fitting many models that share terms
+only builds each term once.
+
+Other data is keyed by identity, so the builder holds on to it. Call
+`DesignBuilder.invalidate(data)` after mutating it in place. `lm` only
+caches when given a builder.
+"""
+import ast
+import io
+import keyword
+import sys
+import tokenize
+
+from asttools import ast_source
+
+from .column_expr import compile_expr, ColumnExpr
+from .computation import ComputationManager
+
+FORMULA_NAME = '__formula__'
+
+# context names used in the design Manifests
+_MODULE_NAME = '__design__'
+_DATA_NAME = '__data__'
+
+# parse once per distinct formula
+_SPECS = {}
+
+# right hand side `.`
+DOT = '.'
+_DOT_NAME = '__dot__'
+
+# names always available to factors
+def I(value):
+    """ Protect an expression, `I(x ** 2)` """
+    return value
+
+_FACTOR_ENV = {'I': I}
+
+# operand tokens that can come right before a binary `~`
+_CLOSERS = (')', ']', '}', '.')
+_OPENERS = {'(': ')', '[': ']', '{': '}'}
+_VALUE_KEYWORDS = ('True', 'False', 'None')
+# keywords that can be part of an expression
+_EXPR_KEYWORDS = ('and', 'or', 'not', 'is', 'if', 'else') + _VALUE_KEYWORDS
+_STOP_OPS = (',', '=', ';', ':=')
+
+
+def _offsets(source):
+    line_starts = [0]
+    for line in source.splitlines(True):
+        line_starts.append(line_starts[-1] + len(line))
+
+    def offset(pos):
+        row, col = pos
+        return line_starts[row - 1] + col
+    return offset
+
+def _tokens(source):
+    skip = (tokenize.NL, tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT,
+            tokenize.ENCODING)
+    return [tok for tok in
+            tokenize.generate_tokens(io.StringIO(source).readline)
+            if tok.type not in skip]
+
+def _ends_operand(tok):
+    if tok.type == tokenize.NAME:
+        return not keyword.iskeyword(tok.string) \
+            or tok.string in _VALUE_KEYWORDS
+    if tok.type in (tokenize.NUMBER, tokenize.STRING):
+        return True
+    return tok.type == tokenize.OP and tok.string in _CLOSERS
+
+def _is_pipe(tokens, i):
+    """ tokens[i] starts or ends a `%>%` """
+    strings = [tok.string for tok in tokens[max(i-2, 0):i+3]]
+    return '%>%' in ''.join(strings) and tokens[i].string in ('%', '>')
+
+def _stops(tokens, i):
+    tok = tokens[i]
+    if tok.type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+        return True
+    if tok.type == tokenize.NAME and keyword.iskeyword(tok.string):
+        return tok.string not in _EXPR_KEYWORDS
+    if tok.type != tokenize.OP:
+        return False
+    return tok.string in _STOP_OPS or _is_pipe(tokens, i)
+
+def _formula_bounds(tokens, i):
+    """ First and last token of the formula around the `~` at i """
+    depth = 0
+    start = i
+    while start > 0:
+        prev = tokens[start - 1]
+        if prev.string in _OPENERS.values():
+            depth += 1
+        elif prev.string in _OPENERS:
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0 and _stops(tokens, start - 1):
+            break
+        start -= 1
+
+    depth = 0
+    end = i + 1
+    while end < len(tokens):
+        tok = tokens[end]
+        if tok.string in _OPENERS:
+            depth += 1
+        elif tok.string in _OPENERS.values():
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0 and _stops(tokens, end):
+            break
+        end += 1
+    return start, end - 1
+
+def formula_spans(source):
+    """ (start, end) offsets of every `lhs ~ rhs` in source """
+    offset = _offsets(source)
+    tokens = _tokens(source)
+    spans = []
+    last = -1
+    for i, tok in enumerate(tokens):
+        if tok.string != '~' or i == 0 or i <= last:
+            continue
+        if not _ends_operand(tokens[i-1]):
+            # unary invert
+            continue
+        start, last = _formula_bounds(tokens, i)
+        if last <= i:
+            continue
+        spans.append((offset(tokens[start].start), offset(tokens[last].end)))
+    return spans
+
+def formula_transform(source):
+    """
+    Rewrite `lm(y ~ x, data=df)` into
+
+        lm(__formula__('y ~ x'), data=df)
+
+    Source without formulas is returned unchanged.
+    """
+    try:
+        spans = formula_spans(source)
+    except (tokenize.TokenError, SyntaxError):
+        return source
+
+    for start, end in reversed(spans):
+        text = ' '.join(source[start:end].split())
+        source = "{0}{1}({2!r}){3}".format(source[:start], FORMULA_NAME,
+                                           text, source[end:])
+    return source
+
+
+# parsing
+
+def _python_rhs(rhs):
+    """ R operators to python ones the ast can carry """
+    offset = _offsets(rhs)
+    tokens = _tokens(rhs)
+    edits = []
+    depth = 0
+    for i, tok in enumerate(tokens):
+        if tok.string in _OPENERS:
+            depth += 1
+        elif tok.string in _OPENERS.values():
+            depth -= 1
+        if tok.type != tokenize.OP or depth != 0:
+            continue
+
+        new = None
+        if tok.string == ':':
+            new = '@'
+        elif tok.string == '^':
+            new = '**'
+        elif tok.string == '.' and (i == 0 or not _ends_operand(tokens[i-1])):
+            new = _DOT_NAME
+        if new is not None:
+            edits.append((offset(tok.start), offset(tok.end), new))
+
+    for start, end, new in reversed(edits):
+        rhs = rhs[:start] + new + rhs[end:]
+    return rhs
+
+def _interact(left, right):
+    """ a:b of two lists of terms """
+    terms = []
+    for a in left:
+        for b in right:
+            terms.append(tuple(dict.fromkeys(a + b)))
+    return terms
+
+def _union(*groups):
+    seen = set()
+    terms = []
+    for group in groups:
+        for term in group:
+            if frozenset(term) in seen:
+                continue
+            seen.add(frozenset(term))
+            terms.append(term)
+    return terms
+
+
+class _TermParser(object):
+    """
+    Terms are tuples of factor sources. The intercept is the empty term.
+    """
+    def __init__(self):
+        self.intercept = True
+
+    def terms(self, node):
+        if isinstance(node, ast.BinOp):
+            left = self.terms(node.left)
+            op = node.op
+            if isinstance(op, ast.Pow):
+                return self.power(left, node.right)
+            right = self.terms(node.right)
+            if isinstance(op, ast.Add):
+                return _union(left, right)
+            if isinstance(op, ast.Sub):
+                if () in right:
+                    self.intercept = False
+                drop = set(frozenset(term) for term in right)
+                return [term for term in left if frozenset(term) not in drop]
+            if isinstance(op, ast.MatMult):
+                return _interact(left, right)
+            if isinstance(op, ast.Mult):
+                return _union(left, right, _interact(left, right))
+
+        if isinstance(node, ast.Constant) and type(node.value) is int:
+            if node.value == 0:
+                self.intercept = False
+                return []
+            if node.value == 1:
+                return [()]
+
+        if isinstance(node, ast.Name) and node.id == _DOT_NAME:
+            return [(DOT,)]
+
+        return [(ast_source(node),)]
+
+    def power(self, terms, exponent):
+        if not isinstance(exponent, ast.Constant) \
+           or type(exponent.value) is not int or exponent.value < 1:
+            raise SyntaxError("Formula powers must be positive integers")
+        out = terms
+        for _ in range(exponent.value - 1):
+            out = _union(out, _interact(out, terms))
+        return out
+
+
+class ModelSpec(object):
+    """
+    Parsed formula. Doesn't depend on any data.
+
+    lhs : str
+        Source of the response, None for one sided formulas.
+    terms : tuple of tuples
+        Factor sources per term, intercept excluded.
+    """
+    def __init__(self, formula, lhs, terms, intercept):
+        self.formula = formula
+        self.lhs = lhs
+        self.terms = tuple(terms)
+        self.intercept = intercept
+
+    @property
+    def factors(self):
+        factors = [self.lhs] if self.lhs else []
+        for term in self.terms:
+            factors.extend(term)
+        return list(dict.fromkeys(factors))
+
+    def expand_dot(self, columns):
+        """ Terms with `.` replaced by the columns """
+        if (DOT,) not in self.terms:
+            return self.terms
+        lhs_names = set()
+        if self.lhs:
+            lhs_names = compile_expr(self.lhs).names
+        dot = [(col,) for col in columns if col not in lhs_names]
+        terms = []
+        for term in self.terms:
+            terms.extend(dot if term == (DOT,) else [term])
+        return tuple(_union(terms))
+
+    def __repr__(self):
+        return "ModelSpec({0})".format(self.formula)
+
+def parse_formula(formula):
+    """ ModelSpec for a formula string. Each string is parsed once. """
+    spec = _SPECS.get(formula, None)
+    if spec is not None:
+        return spec
+
+    tokens = _tokens(formula)
+    depth = 0
+    split = None
+    for tok in tokens:
+        if tok.string in _OPENERS:
+            depth += 1
+        elif tok.string in _OPENERS.values():
+            depth -= 1
+        elif tok.string == '~' and depth == 0:
+            split = _offsets(formula)(tok.start)
+            break
+    if split is None:
+        raise SyntaxError("Formula has no ~: {0}".format(formula))
+
+    lhs = formula[:split].strip() or None
+    rhs = formula[split+1:].strip()
+    if lhs is not None:
+        # validate
+        compile_expr(lhs)
+
+    parser = _TermParser()
+    tree = ast.parse(_python_rhs(rhs), mode='eval')
+    terms = parser.terms(tree.body)
+    terms = [term for term in terms if term]
+
+    spec = ModelSpec(' '.join(formula.split()), lhs, terms, parser.intercept)
+    _SPECS[formula] = spec
+    return spec
+
+
+class Formula(object):
+    """ A ModelSpec and the namespace its names are looked up in """
+    def __init__(self, spec, env=None):
+        if isinstance(spec, str):
+            spec = parse_formula(spec)
+        if env is None:
+            env = {}
+        self.spec = spec
+        self.env = env
+
+    def __repr__(self):
+        return "Formula({0})".format(self.spec.formula)
+
+def _caller_env(depth):
+    frame = sys._getframe(depth + 1)
+    env = dict(frame.f_globals)
+    env.update(frame.f_locals)
+    return env
+
+def formula(text, env=None):
+    """ What `formula_transform` rewrites `y ~ x` into """
+    if env is None:
+        env = _caller_env(1)
+    return Formula(parse_formula(text), env)
+
+FORMULA_NS = {FORMULA_NAME: formula}
+
+
+# building
+
+def _is_categorical(values):
+    dtype = getattr(values, 'dtype', None)
+    if dtype is None:
+        return True
+    return getattr(dtype, 'kind', 'O') in 'bOSU' or dtype.name == 'category'
+
+def factor_values(data, source, env):
+    """ Evaluate one factor against the columns of data """
+    import pandas as pd
+    values = ColumnExpr(source, dict(_FACTOR_ENV, **env))(data)
+    if not isinstance(values, pd.Series):
+        values = pd.Series(values, index=data.index)
+    return values
+
+def factor_block(values, source):
+    """ Columns for one factor. Categoricals get every level. """
+    import numpy as np
+    import pandas as pd
+    if not _is_categorical(values):
+        return pd.DataFrame({source: values.astype(float)})
+
+    cat = pd.Categorical(values)
+    codes = cat.codes
+    indicators = codes[:, None] == np.arange(len(cat.categories))
+    names = ['{0}[{1}]'.format(source, level) for level in cat.categories]
+    return pd.DataFrame(indicators.astype(float), index=values.index,
+                        columns=names)
+
+def interact(blocks, drop_first):
+    """
+    Elementwise product of every combination of block columns.
+
+    drop_first : list of bool
+        Drop the first column of the matching block. Full rank coding for
+        categoricals when there is an intercept.
+    """
+    import numpy as np
+    import pandas as pd
+    arrays = []
+    names = []
+    for block, drop in zip(blocks, drop_first):
+        if drop:
+            block = block.iloc[:, 1:]
+        arrays.append(block.to_numpy())
+        names.append(list(block.columns))
+
+    out = arrays[0]
+    out_names = names[0]
+    for array, array_names in zip(arrays[1:], names[1:]):
+        n = len(out)
+        out = (out[:, :, None] * array[:, None, :]).reshape(n, -1)
+        out_names = ['{0}:{1}'.format(a, b) for a in out_names
+                     for b in array_names]
+    return pd.DataFrame(out, index=blocks[0].index, columns=out_names)
+
+def _term_block(values, term, intercept):
+    blocks = [factor_block(v, factor) for v, factor in zip(values, term)]
+    drop_first = [intercept and _is_categorical(v) for v in values]
+    return interact(blocks, drop_first)
+
+def term_block(data, term, intercept, env):
+    """ Design columns for one term, uncached """
+    values = [factor_values(data, factor, env) for factor in term]
+    return _term_block(values, term, intercept)
+
+def assemble(spec, index, term_blocks):
+    import numpy as np
+    import pandas as pd
+    blocks = list(term_blocks)
+    if spec.intercept:
+        blocks.insert(0, pd.DataFrame({'Intercept': np.ones(len(index))},
+                                      index=index))
+    if not blocks:
+        return pd.DataFrame(index=index)
+    return pd.concat(blocks, axis=1)
+
+def design_matrix(data, formula, env):
+    """ (y, X) for a formula string, uncached """
+    spec = parse_formula(formula)
+    terms = spec.expand_dot(data.columns)
+    X = assemble(spec, data.index,
+                 [term_block(data, term, spec.intercept, env)
+                  for term in terms])
+    y = None
+    if spec.lhs:
+        y = factor_values(data, spec.lhs, env)
+    return y, X
+
+
+class DesignBuilder(object):
+    """
+    Cached design matrices.
+
+    ```
+    builder = DesignBuilder()
+    y, X = builder.build(formula, data)
+    ```
+
+    manager : ComputationManager
+        Where factors, terms and matrices are cached.
+
+    Data is keyed by identity. Call `invalidate` after mutating it.
+    """
+    def __init__(self, manager=None):
+        if manager is None:
+            manager = ComputationManager()
+        self.manager = manager
+
+    def invalidate(self, data):
+        """ Drop everything built from data """
+        return self.manager.invalidate(data)
+
+    def _data_ns(self, data):
+        """ data's Manifest if the manager computed it """
+        entry = self.manager.by_value(data)
+        if entry is not None and entry.value is data:
+            return {_DATA_NAME: entry.manifest}
+        return {_DATA_NAME: data}
+
+    def _entry(self, call, data, names, env):
+        """
+        Computable for `__design__.<call>` with the data and the
+        namespace names it reads as context.
+        """
+        ns = self._data_ns(data)
+        ns[_MODULE_NAME] = sys.modules[__name__]
+        env_keys = []
+        for name in sorted(names):
+            if name in env and name not in data:
+                ns[name] = env[name]
+                env_keys.append(name)
+        env_source = '{' + ', '.join('{0!r}: {0}'.format(name)
+                                     for name in env_keys) + '}'
+        source = "{0}.{1}".format(_MODULE_NAME,
+                                  call.format(data=_DATA_NAME,
+                                              env=env_source))
+        return self.manager.get(source, ns)
+
+    def _names(self, sources):
+        names = set()
+        for source in sources:
+            names |= compile_expr(source).names
+        return names
+
+    def factor(self, data, source, env):
+        """ Evaluated factor, cached """
+        call = "factor_values({data}, " + repr(source) + ", {env})"
+        entry = self._entry(call, data, self._names([source]), env)
+        return self.manager.execute(
+            entry, compute=lambda: factor_values(data, source, env))
+
+    def term(self, data, term, intercept, env):
+        """ Design columns for one term, cached """
+        def compute():
+            values = [self.factor(data, factor, env) for factor in term]
+            return _term_block(values, term, intercept)
+
+        call = "term_block({data}, " + repr(tuple(term)) + ", " \
+            + repr(intercept) + ", {env})"
+        entry = self._entry(call, data, self._names(term), env)
+        return self.manager.execute(entry, compute=compute)
+
+    def build(self, formula, data, env=None):
+        """
+        (y, X) for formula, a Formula or formula string. y is None for
+        one sided formulas.
+        """
+        if not isinstance(formula, Formula):
+            formula = Formula(formula, env)
+        if env is None:
+            env = formula.env
+        spec = formula.spec
+
+        def compute():
+            terms = spec.expand_dot(data.columns)
+            X = assemble(spec, data.index,
+                         [self.term(data, term, spec.intercept, env)
+                          for term in terms])
+            y = None
+            if spec.lhs:
+                y = self.factor(data, spec.lhs, env)
+            return y, X
+
+        call = "design_matrix({data}, " + repr(spec.formula) + ", {env})"
+        entry = self._entry(call, data, self._names(spec.factors) - {DOT},
+                            env)
+        return self.manager.execute(entry, compute=compute)
+
+
+# modeling
+
+class LinearModel(object):
+    def __init__(self, formula, coef, y, X):
+        self.formula = formula
+        self.coef = coef
+        self.y = y
+        self.X = X
+
+    def predict(self, X=None):
+        if X is None:
+            X = self.X
+        return X.dot(self.coef)
+
+    @property
+    def residuals(self):
+        return self.y - self.predict()
+
+    def __repr__(self):
+        return "LinearModel({0})\n{1}".format(self.formula.spec.formula,
+                                              self.coef)
+
+def lm(formula, data, builder=None):
+    """
+    Least squares fit of a formula, `lm(y ~ x1 + x2, data=df)`
+
+    builder : DesignBuilder
+        Optional. Caches the design matrices across fits.
+    """
+    import numpy as np
+    import pandas as pd
+    if not isinstance(formula, Formula):
+        formula = Formula(formula, _caller_env(1))
+    if builder is None:
+        y, X = design_matrix(data, formula.spec.formula, formula.env)
+    else:
+        y, X = builder.build(formula, data)
+    if y is None:
+        raise ValueError("lm needs a response, {0}".format(formula))
+    coef, _, _, _ = np.linalg.lstsq(X.to_numpy(), y.to_numpy(dtype=float),
+                                    rcond=None)
+    return LinearModel(formula, pd.Series(coef, index=X.columns), y, X)
@@ -0,0 +1,212 @@
+"""
+Run SpecialEval engines over imported modules.
+
+```
+from naginpy.special_eval.import_hook import install
+install([SomeStaticEngine()], modules=['mylab'])
+
+import mylab.analysis # engines run over the module source
+```
+
+When every engine is static, the transformed module is compiled into a
+single code object and stored in `__pycache__` as a `.ngp` file. The
+cache entry is keyed by the source hash, the engine set and the engine
+versions, so later imports skip parsing and AST transformation entirely.
+
+Engines that need the kernel objects cannot run ahead of execution. If any
+configured engine is not static, the module is executed line by line through
+SpecialEval like an IPython cell and nothing is cached.
+"""
+import __future__
+import ast
+import copy
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import marshal
+import os
+import sys
+
+from .. import hashing
+from .special_eval import SpecialEval
+from .engine import NormalEval
+
+# bump when the cache file layout changes
+CACHE_VERSION = b'NGP2'
+CACHE_SUFFIX = '.ngp'
+_HEADER_SIZE = len(CACHE_VERSION) + len(importlib.util.MAGIC_NUMBER) + 16
+
+def engine_signature(engines):
+    """
+    Stable string representing the engine set and versions.
+    """
+    bits = []
+    for engine in engines:
+        klass = engine.__class__
+        bits.append("{0}.{1}={2}".format(klass.__module__, klass.__qualname__,
+                                         engine.version))
+    return ", ".join(bits)
+
+def cache_key(source_bytes, engines):
+    """
+    Digest of the source and the engines that transform it.
+    """
+    hasher = hashing.Hasher(source_bytes)
+    hasher.update(engine_signature(engines))
+    return hasher.digest()
+
+def is_static(engines):
+    return all(engine.static for engine in engines)
+
+def future_flags(tree):
+    """
+    Compiler flags for the `from __future__` imports at the top of a module.
+    """
+    body = tree.body
+    if ast.get_docstring(tree, clean=False) is not None:
+        body = body[1:]
+
+    flags = 0
+    for node in body:
+        if not isinstance(node, ast.ImportFrom) \
+                or node.module != '__future__':
+            break
+        for alias in node.names:
+            flags |= getattr(__future__, alias.name).compiler_flag
+    return flags
+
+def cache_path(source_path, engines):
+    """
+    Engine set is part of the file name so switching between engine sets
+    does not thrash a single cache file.
+
+    The file lives in __pycache__ but does not end in .pyc. It is not a
+    bytecode file, so the normal loader must never pick it up.
+    """
+    engine_hash = hashing.hexdigest(engine_signature(engines))
+    pyc_path = importlib.util.cache_from_source(source_path)
+    base = os.path.splitext(pyc_path)[0]
+    return '{0}.naginpy-{1}{2}'.format(base, engine_hash[:8], CACHE_SUFFIX)
+
+def transform(tree, engines):
+    """
+    Run static engines over a module AST. Nothing is executed.
+    """
+    se = SpecialEval(tree, ns={}, engines=engines)
+    se.process()
+    return ast.fix_missing_locations(se.grapher.code)
+
+
+class SpecialEvalLoader(importlib.machinery.SourceFileLoader):
+    def __init__(self, fullname, path, engines):
+        super().__init__(fullname, path)
+        self.engines = engines
+
+    def exec_module(self, module):
+        if is_static(self.engines):
+            # goes through get_code
+            return super().exec_module(module)
+
+        source = importlib.util.decode_source(self.get_data(self.path))
+        tree = ast.parse(source, self.path)
+        flags = future_flags(tree)
+        engines = []
+        for engine in self.engines:
+            if isinstance(engine, NormalEval):
+                engine = copy.copy(engine)
+                engine.filename = self.path
+                engine.flags = flags
+            engines.append(engine)
+        if not any(isinstance(engine, NormalEval) for engine in engines):
+            engines.append(NormalEval(filename=self.path, flags=flags))
+        se = SpecialEval(tree, ns=module.__dict__, engines=engines)
+        se.process()
+
+    def get_code(self, fullname):
+        source_bytes = self.get_data(self.path)
+        key = cache_key(source_bytes, self.engines)
+        path = cache_path(self.path, self.engines)
+
+        code = self.load_cached(path, key)
+        if code is not None:
+            return code
+
+        source = importlib.util.decode_source(source_bytes)
+        tree = transform(ast.parse(source, self.path), self.engines)
+        code = compile(tree, self.path, 'exec', dont_inherit=True)
+        self.store_cached(path, key, code)
+        return code
+
+    def load_cached(self, path, key):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        header = CACHE_VERSION + importlib.util.MAGIC_NUMBER + key
+        if data[:_HEADER_SIZE] != header:
+            return None
+
+        try:
+            return marshal.loads(data[_HEADER_SIZE:])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def store_cached(self, path, key, code):
+        if sys.dont_write_bytecode:
+            return
+
+        data = CACHE_VERSION + importlib.util.MAGIC_NUMBER + key \
+            + marshal.dumps(code)
+        tmp_path = '{0}.{1}'.format(path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # same as importlib, failing to write the cache is not an error
+            pass
+
+
+class SpecialEvalFinder(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that hands modules under `modules` to SpecialEvalLoader.
+    """
+    def __init__(self, engines, modules):
+        self.engines = engines
+        self.modules = list(modules)
+
+    def handles(self, fullname):
+        for name in self.modules:
+            if fullname == name or fullname.startswith(name + '.'):
+                return True
+        return False
+
+    def find_spec(self, fullname, path, target=None):
+        if not self.handles(fullname):
+            return None
+
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec is None:
+            return None
+
+        if not isinstance(spec.loader, importlib.machinery.SourceFileLoader):
+            return spec
+
+        spec.loader = SpecialEvalLoader(fullname, spec.origin, self.engines)
+        return spec
+
+
+def install(engines, modules):
+    """
+    Add a SpecialEvalFinder to sys.meta_path and return it.
+    """
+    finder = SpecialEvalFinder(engines, modules)
+    sys.meta_path.insert(0, finder)
+    return finder
+
+def uninstall(finder):
+    if finder in sys.meta_path:
+        sys.meta_path.remove(finder)
@@ -18,9 +18,8 @@ to do caching of intermediate entries.
 Where the concepts start and end are still up in the air at this point.
 """
 import ast
-import binascii
 import copy
-import hashlib
+import weakref
 
 from asttools import (
     ast_source,
@@ -32,11 +31,13 @@ from asttools import (
     _eval,
     _convert_to_expression
 )
+from naginpy import hashing
 from naginpy.special_eval.manifest_abc import ManifestABC
 
 from .exec_context import (
     ExecutionContext,
 )
+from .pushdown import column_projections, predicate_pushdowns
 
 def _manifest(code, context):
     """
@@ -53,10 +54,87 @@ def _manifest(code, context):
     manifest = Manifest(expression, context)
     return manifest
 
+# hash => interned object. Weak, so objects nothing else uses are freed.
+# Keyed by the structural hash rather than hash_key, since that is what
+# __eq__ compares and it is already computed for the cache lookup. hash()
+# is only 64 bits, so a found object is checked against the full key
+# before it is shared. Colliding objects are just not shared.
+_EXPRESSIONS = weakref.WeakValueDictionary()
+_CONTEXTS = weakref.WeakValueDictionary()
+_MANIFESTS = weakref.WeakValueDictionary()
+
+def intern_expression(expression):
+    """
+    Return the one shared, immutable Expression equal to expression.
+    """
+    h = hash(expression)
+    found = _EXPRESSIONS.get(h, None)
+    if found is not None and found.key == expression.key:
+        return found
+    if expression.mutable:
+        expression = expression.copy()
+    if found is None:
+        _EXPRESSIONS[h] = expression
+    return expression
+
+def _intern_item(item):
+    # plain context items aren't interned. a table entry costs more than
+    # the item, see benchmarks/bench_memory.py
+    if isinstance(item, Manifest):
+        return intern_manifest(item)
+    return item
+
+def intern_context(context):
+    """
+    Return the one shared, immutable ExecutionContext equal to context.
+    Nested Manifests in it are interned as well.
+    """
+    h = hash(context)
+    found = _CONTEXTS.get(h, None)
+    if found is not None and found.hash_key == context.hash_key:
+        return found
+    data = {k: _intern_item(v) for k, v in context.items()}
+    if context.mutable \
+            or any(data[k] is not v for k, v in context.items()):
+        context = ExecutionContext(data)
+    if found is None:
+        _CONTEXTS[h] = context
+    return context
+
+def intern_manifest(manifest):
+    """
+    Hash-consing for Manifests. Structurally equal Manifests intern to
+    the same immutable object, so they can be compared with `is`, and
+    share their Expression and ExecutionContext.
+
+    The objects are kept alive by their users, not by the intern tables.
+    Context items refer to their objects, so an id based key can't be
+    reused while its Manifest is alive.
+
+    Immutable parts are shared as they are, but the caller's Manifest is
+    never flagged. The interned one is always a new object.
+    """
+    if manifest.interned:
+        return manifest
+    h = hash(manifest)
+    found = _MANIFESTS.get(h, None)
+    if found is not None and found.hash_key == manifest.hash_key:
+        return found
+    shared = Manifest(intern_expression(manifest.expression),
+                      intern_context(manifest.context))
+    shared._hash = h
+    # still interned on a collision, so it never compares equal to found
+    shared.interned = True
+    if found is None:
+        _MANIFESTS[h] = shared
+    return shared
+
 class Expression(object):
     """
     For now default to just using ast fragments.
     """
+    __slots__ = ('code', 'mutable', '_key', '__weakref__')
+
     def __init__(self, code, mutable=False):
         if isinstance(code, str):
             code = ast.parse(code, '<expr>', 'eval')
@@ -68,22 +146,23 @@ class Expression(object):
                             "{0}".format(ast_source(code)))
         self.code = code
         self.mutable = mutable
+        self._key = None
 
     def __hash__(self):
         return hash(self.key)
 
-    _key = None
     @property
     def key(self):
         if self._key is None:
-            source_string = self.get_source().encode('utf-8')
-            self._key = hashlib.md5(source_string).hexdigest()
+            self._key = hashing.hash_key(self.get_source())
         return self._key
 
     def get_source(self):
         return ast_source(self.code)
 
     def __eq__(self, other):
+        if other is self:
+            return True
         if isinstance(other, Expression):
             return hash(self) == hash(other)
         if isinstance(other, ast.AST):
@@ -108,11 +187,24 @@ class Expression(object):
         working_ast = copy.deepcopy(self.code)
         return self.__class__(working_ast, mutable=mutable)
 
+class _Splice(ast.NodeTransformer):
+    """ Replace loads of variables with the given expression bodies """
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def visit_Name(self, node):
+        if not is_load_name(node):
+            return node
+        return self.bodies.get(node.id, node)
+
 class Manifest(object):
     """
     Technically, a manifest can masquerade as the evaluated object since
     we have all we need to create the object.
     """
+    __slots__ = ('expression', 'context', '_hash', '_hash_key', 'interned',
+                 '__weakref__')
+
     def __init__(self, expression, context):
 
         if not isinstance(expression, Expression):
@@ -123,6 +215,11 @@ class Manifest(object):
 
         self.expression = expression
         self.context = context
+        # cached once frozen
+        self._hash = None
+        self._hash_key = None
+        # shared instance from intern_manifest
+        self.interned = False
 
     @property
     def key(self):
@@ -130,10 +227,37 @@ class Manifest(object):
         context_key = self.context.key
         return "{0}({1})".format(expr_key, context_key)
 
+    @property
+    def frozen(self):
+        return not (self.expression.mutable or self.context.mutable)
+
+    @property
+    def hash_key(self):
+        """ Fixed length stable version of key """
+        if self._hash_key is not None:
+            return self._hash_key
+        hasher = hashing.Hasher(self.expression.key)
+        hasher.update(self.context.hash_key)
+        key = hasher.key()
+        if self.frozen:
+            self._hash_key = key
+        return key
+
     def __hash__(self):
-        return hash(tuple([self.expression, self.context]))
+        if self._hash is not None:
+            return self._hash
+        h = hash(tuple([self.expression, self.context]))
+        if self.frozen:
+            # nested Manifests would otherwise rehash every level below
+            self._hash = h
+        return h
 
     def __eq__(self, other):
+        if other is self:
+            return True
+        if isinstance(other, Manifest) and self.interned and other.interned:
+            return False
+
         if isinstance(other, tuple):
             other_expression, other_context = other
         elif isinstance(other, Manifest):
@@ -144,7 +268,7 @@ class Manifest(object):
                             "or tuple(expression, context)")
 
         # note due to how expression is built, other_expression can be
-        # the md5 checksum of the source
+        # the hash_key of the source
         if self.expression != other_expression:
             return False
 
@@ -154,7 +278,23 @@ class Manifest(object):
         return True
 
     def eval(self):
-        return _eval(self.expression.code, self.context.extract())
+        code = self.expression.code
+        context = self.context
+
+        pushdowns = {}
+        if any(getattr(v, 'supports_predicates', False)
+               for v in context.values()):
+            # pushdown rewrites the filter subscripts
+            code = copy.deepcopy(code)
+            pushdowns = predicate_pushdowns(code, context)
+
+        projections = column_projections(code, context)
+        filters = {}
+        for var, (columns, var_filters) in pushdowns.items():
+            projections[var] = columns
+            filters[var] = var_filters
+
+        return _eval(code, context.extract(projections, filters))
 
     def eval_with(self, items, ignore_var_names=False):
         """
@@ -196,7 +336,7 @@ class Manifest(object):
         wm = Manifest(working_ast, working_ns)
         return wm
 
-    def expand(self):
+    def expand(self, memo=None):
         """
         Takes a Manifest with Manifests in its ExecutionContext
         and substitutes in the sub Manifest.
@@ -213,28 +353,38 @@ class Manifest(object):
         Manifest1.expand():
             A + (C + D)
             {A: 1, C:2, D:3}
-        """
-        wm = self.copy(mutable=True)
-
-        for k, v in self.context.items():
-            if not isinstance(v, Manifest):
-                continue
-
-            var = ast.parse(k, mode='eval')
-            key = _manifest(var, {k: v})
-            matches = wm.subset(key)
 
-            # replace with expanded partial. that partial might have its own
-            v = v.expand()
-            for match in matches:
-                new_node = v.expression.code.body
-                wm.expression.replace(new_node, **match['location'])
-                wm.context.update(v.context)
-
-            if k not in v.context:
-                del wm.context[k]
-
-        return wm
+        Nested Manifests form a DAG. memo maps each sub Manifest to its
+        expansion, so a sub Manifest shared by several parents is only
+        expanded once and its expression is spliced in without copying.
+        The expanded AST shares those nodes, copy() it before mutating.
+        A Manifest without sub Manifests is its own expansion.
+        """
+        if memo is None:
+            memo = {}
+        expanded = memo.get(self, None)
+        if expanded is not None:
+            return expanded
+
+        children = {k: v for k, v in self.context.items()
+                    if isinstance(v, Manifest)}
+        if not children:
+            memo[self] = self
+            return self
+
+        context = {k: v for k, v in self.context.items()
+                   if k not in children}
+        bodies = {}
+        for k, v in children.items():
+            v = v.expand(memo)
+            bodies[k] = v.expression.code.body
+            context.update(v.context)
+
+        code = copy.deepcopy(self.expression.code)
+        code = _Splice(bodies).visit(code)
+        expanded = Manifest(Expression(code), ExecutionContext(context))
+        memo[self] = expanded
+        return expanded
 
     @property
     def stateless(self):
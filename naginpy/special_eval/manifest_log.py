@@ -0,0 +1,402 @@
+"""
+Append-only log of executed Manifests.
+
+```
+log = ManifestLog('~/.naginpy/log')
+manager = ComputationManager(log=log)
+...
+for record in log.lookup(manifest.hash_key):
+    print(record.source, record.exec_time, record.result_size)
+```
+
+Every Manifest that the ComputationManager executes is recorded with its
+expression source, context keys, timing and result size. Cache hits are
+recorded as HIT records. `record` only queues a tuple. A background thread
+serializes and writes records in batches, so the log is cheap enough to
+leave on.
+
+Files:
+
+    manifests.log : records, each `length(uint32) | crc32(uint32) | payload`
+    manifests.idx : `digest(16) | offset(uint64)` per record
+
+The index maps a Manifest.hash_key to the offsets of its records. If the
+index is behind the log (crash between writes), the missing part is rebuilt
+by scanning the log on open. A torn record at the end of the log is
+truncated.
+
+Stateless context items are stored with enough information to rebuild the
+Manifest later, see `replay`.
+"""
+import atexit
+import heapq
+import importlib
+import marshal
+import math
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from naginpy import hashing
+
+from .exec_context import ScalarObject, ModuleContext, SourceObject
+from .manifest import _manifest
+from .versioned import VersionedSourceObject
+
+LOG_NAME = 'manifests.log'
+INDEX_NAME = 'manifests.idx'
+
+# bump if the payload layout changes
+LOG_VERSION = 1
+# marshal format is fixed by version
+_MARSHAL_VERSION = 4
+
+_REC = struct.Struct('<II')
+_FIXED = struct.Struct('<BBddQ?')
+_IDX = struct.Struct('<16sQ')
+
+# record kinds
+EXEC = 0
+# ComputationManager.get returned an already executed entry
+HIT = 1
+
+# context item kinds
+CTX_SCALAR = 's'
+CTX_MODULE = 'm'
+CTX_SOURCE = 'r'
+CTX_OBJECT = 'o'
+
+LogRecord = namedtuple('LogRecord', ['key', 'kind', 'timestamp', 'exec_time',
+                                     'result_size', 'stateless', 'source',
+                                     'context'])
+
+
+def result_size(value):
+    """ Rough size in bytes. Doesn't follow object pointers. """
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    memory_usage = getattr(value, 'memory_usage', None)
+    if callable(memory_usage):
+        try:
+            usage = memory_usage(index=True)
+            return int(getattr(usage, 'sum', lambda: usage)())
+        except Exception:
+            pass
+    return sys.getsizeof(value)
+
+def _marshalable(value):
+    try:
+        marshal.dumps(value, _MARSHAL_VERSION)
+    except ValueError:
+        return False
+    return True
+
+def _context_item(name, obj):
+    if type(obj) is ScalarObject:
+        value = obj.obj
+        if hasattr(value, 'item'):
+            # numpy scalar
+            value = value.item()
+        if isinstance(value, memoryview):
+            value = value.tobytes()
+        if not _marshalable(value):
+            # e.g. Fraction or datetime. kept for display, can't be replayed
+            return (name, CTX_OBJECT, obj.key, repr(value))
+        return (name, CTX_SCALAR, obj.key, value)
+    if type(obj) is ModuleContext:
+        return (name, CTX_MODULE, obj.key, obj.obj.__name__)
+    if isinstance(obj, VersionedSourceObject):
+        value = (obj.source_key, obj._obj_key, obj.version)
+        return (name, CTX_SOURCE, obj.key, value)
+    if isinstance(obj, SourceObject):
+        return (name, CTX_SOURCE, obj.key, (obj.source_key, obj._obj_key))
+    return (name, CTX_OBJECT, obj.key, None)
+
+def encode(kind, timestamp, manifest, exec_time, size):
+    if exec_time is None:
+        exec_time = math.nan
+    context = tuple(_context_item(k, v) for k, v in manifest.context.items())
+    body = marshal.dumps((LOG_VERSION, manifest.hash_key,
+                          manifest.expression.get_source(), context),
+                         _MARSHAL_VERSION)
+    fixed = _FIXED.pack(LOG_VERSION, kind, timestamp, exec_time, size,
+                        manifest.stateless)
+    return manifest.hash_key, fixed + body
+
+def decode(payload):
+    version, kind, timestamp, exec_time, size, stateless = \
+        _FIXED.unpack_from(payload)
+    if version != LOG_VERSION:
+        raise ValueError("Unknown log version {0}".format(version))
+    _, key, source, context = marshal.loads(payload[_FIXED.size:])
+    if math.isnan(exec_time):
+        exec_time = None
+    return LogRecord(key, kind, timestamp, exec_time, size, stateless,
+                     source, context)
+
+def _frame(payload):
+    return _REC.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class ManifestLog(object):
+    """
+    batch_size : int
+        Max records per write.
+    flush_interval : float
+        Seconds the writer waits to fill a batch.
+
+    Records that fail to encode are skipped and counted in `dropped`. The
+    last error is kept in `error`. The writer itself never stops on one.
+    """
+    def __init__(self, path, batch_size=512, flush_interval=0.5):
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.log_path = os.path.join(self.path, LOG_NAME)
+        self.index_path = os.path.join(self.path, INDEX_NAME)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.index = {}
+        self.dropped = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._load_index()
+
+        self._log = open(self.log_path, 'ab')
+        self._idx = open(self.index_path, 'ab')
+        self.queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _add_index(self, digest, offset):
+        self.index.setdefault(digest, []).append(offset)
+
+    def _load_index(self):
+        """ Read the index file and catch it up with the log """
+        indexed_end = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            # drop a torn entry
+            usable = len(data) - len(data) % _IDX.size
+            for digest, offset in _IDX.iter_unpack(data[:usable]):
+                self._add_index(digest, offset)
+                indexed_end = max(indexed_end, offset)
+            if usable != len(data):
+                with open(self.index_path, 'r+b') as f:
+                    f.truncate(usable)
+
+        if not os.path.exists(self.log_path):
+            return
+
+        missing = []
+        with open(self.log_path, 'r+b') as f:
+            end = indexed_end
+            last = self._read_at(f, indexed_end) if self.index else None
+            if last is not None:
+                # skip past the last indexed record
+                end = indexed_end + _REC.size + last[0]
+            for offset, payload in self._scan(f, end):
+                missing.append((offset, payload))
+                end = offset + _REC.size + len(payload)
+            # torn write at the end
+            f.truncate(end)
+
+        with open(self.index_path, 'ab') as f:
+            for offset, payload in missing:
+                key = decode(payload).key
+                digest = hashing.digest(key)
+                self._add_index(digest, offset)
+                f.write(_IDX.pack(digest, offset))
+
+    def _read_at(self, f, offset):
+        f.seek(offset)
+        header = f.read(_REC.size)
+        if len(header) < _REC.size:
+            return None
+        length, crc = _REC.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return None
+        return length, payload
+
+    def _scan(self, f, offset=0):
+        while True:
+            read = self._read_at(f, offset)
+            if read is None:
+                return
+            length, payload = read
+            yield offset, payload
+            offset += _REC.size + length
+
+    # writing
+
+    def record(self, entry, kind=EXEC):
+        """ Queue a Computable. Called on the hot path. """
+        self.queue.put((kind, time.time(), entry.manifest, entry.exec_time,
+                        result_size(entry.value)))
+
+    def hit(self, entry):
+        self.record(entry, kind=HIT)
+
+    def _writer(self):
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            stop = batch[-1] is None
+            records = [item for item in batch if item is not None]
+            try:
+                self._write(records)
+            except Exception as e:
+                # e.g. disk full. the batch is lost, the writer carries on
+                self.dropped += len(records)
+                self.error = e
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, records):
+        if not records:
+            return
+        frames = []
+        index = []
+        with self._lock:
+            offset = self._log.tell()
+            for record in records:
+                try:
+                    key, payload = encode(*record)
+                except Exception as e:
+                    self.dropped += 1
+                    self.error = e
+                    continue
+                frame = _frame(payload)
+                frames.append(frame)
+                index.append((hashing.digest(key), offset))
+                offset += len(frame)
+
+            self._log.write(b''.join(frames))
+            self._log.flush()
+            self._idx.write(b''.join(_IDX.pack(*item) for item in index))
+            self._idx.flush()
+            for digest, offset in index:
+                self._add_index(digest, offset)
+
+    def flush(self):
+        """ Block until everything queued is written """
+        self.queue.join()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._log.close()
+        self._idx.close()
+        atexit.unregister(self.close)
+
+    # reading
+
+    def keys(self):
+        with self._lock:
+            digests = list(self.index)
+        for digest in digests:
+            # the key string lives in the record
+            yield self._read(self.index[digest][0]).key
+
+    def _read(self, offset):
+        with open(self.log_path, 'rb') as f:
+            read = self._read_at(f, offset)
+        if read is None:
+            raise ValueError("Corrupt record at {0}".format(offset))
+        return decode(read[1])
+
+    def records(self, last=None):
+        """
+        Every record in write order. With `last`, only the most recent
+        `last` records. Their offsets come from the index, so the older
+        part of the log is not read.
+        """
+        if not os.path.exists(self.log_path):
+            return
+        start = 0
+        if last is not None:
+            with self._lock:
+                offsets = [offset for offsets in self.index.values()
+                           for offset in offsets]
+            if len(offsets) > last:
+                start = heapq.nlargest(last, offsets)[-1]
+        with open(self.log_path, 'rb') as f:
+            for offset, payload in self._scan(f, start):
+                yield decode(payload)
+
+    def lookup(self, key):
+        """ Records for a Manifest.hash_key, oldest first """
+        with self._lock:
+            offsets = list(self.index.get(hashing.digest(key), []))
+        records = [self._read(offset) for offset in offsets]
+        return [record for record in records if record.key == key]
+
+    def __contains__(self, key):
+        return hashing.digest(key) in self.index
+
+
+def replay(record, sources=None):
+    """
+    Rebuild the Manifest for a record.
+
+    sources : dict
+        source_key => source, for records that read from SourceObjects.
+
+    Raises ValueError if the record depends on stateful objects.
+    """
+    if sources is None:
+        sources = {}
+
+    context = {}
+    for name, kind, key, value in record.context:
+        if kind == CTX_SCALAR:
+            context[name] = value
+        elif kind == CTX_MODULE:
+            context[name] = importlib.import_module(value)
+        elif kind == CTX_SOURCE:
+            source_key, obj_key = value[:2]
+            if source_key not in sources:
+                raise ValueError("Missing source {0}".format(source_key))
+            source = sources[source_key]
+            if len(value) == 3:
+                # pinned to a version of an append-only source
+                context[name] = VersionedSourceObject(
+                    source, obj_key, value[2], source_key=source_key)
+                continue
+            context[name] = SourceObject(source, obj_key,
+                                         source_key=source_key)
+        else:
+            raise ValueError("{0} is stateful and can't be rebuilt"
+                             .format(name))
+
+    manifest = _manifest(record.source, context)
+    if manifest.hash_key != record.key:
+        raise ValueError("Rebuilt manifest does not match the record. "
+                         "Module versions may have changed.")
+    return manifest
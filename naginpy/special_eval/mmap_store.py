@@ -0,0 +1,348 @@
+"""
+Zero-copy value format for cached arrays and frames.
+
+Numeric results are not pickled. ndarrays and DataFrame column blocks are
+written as raw, aligned buffers behind a small header. Loading memory maps
+the file and hands out read-only views into the map, so opening a 20GB
+intermediate only reads the header. Pages fault in when they are touched.
+
+Layout:
+
+    MAGIC | uint64 header length | header | pad | buffer | pad | buffer ...
+
+The header is a pickled dict of labels and the buffer table. Buffer offsets
+are relative to the first aligned byte after the header.
+
+DataFrames are split into one block per numpy dtype. Each block is stored
+as (ncols, nrows) which is the layout pandas uses internally, so the frame
+is rebuilt around the mapped memory without a copy. Columns that can't be
+mapped (object, extension types) are pickled.
+"""
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b'NGPYBUF1'
+ALIGN = 64
+_LEN = struct.Struct('<Q')
+_PREFIX_SIZE = len(MAGIC) + _LEN.size
+
+# numpy kinds that are plain fixed width memory
+_MAPPABLE_KINDS = 'biufcmM'
+
+def _pd():
+    # pandas is only needed when we are handed pandas objects
+    import pandas as pd
+    return pd
+
+def _is_pandas(value, name):
+    pd = sys.modules.get('pandas', None)
+    return pd is not None and isinstance(value, getattr(pd, name))
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def mappable(arr):
+    return isinstance(arr, np.ndarray) and arr.dtype.kind in _MAPPABLE_KINDS \
+        and not arr.dtype.hasobject
+
+def supported(value):
+    """ Whether value gets stored as raw buffers """
+    if isinstance(value, np.ndarray):
+        return mappable(value)
+    return _is_pandas(value, 'DataFrame') or _is_pandas(value, 'Series')
+
+
+class _Writer(object):
+    """ Collects buffers and lays them out with alignment """
+    def __init__(self):
+        self.buffers = []
+        self.size = 0
+
+    def add(self, arr):
+        arr = np.ascontiguousarray(arr)
+        offset = self.size
+        self.buffers.append((offset, arr))
+        self.size = _aligned(offset + arr.nbytes)
+        return {'offset': offset, 'dtype': arr.dtype.str, 'shape': arr.shape}
+
+    def write(self, f, header):
+        header_bytes = pickle.dumps(header, protocol=4)
+        f.write(MAGIC)
+        f.write(_LEN.pack(len(header_bytes)))
+        f.write(header_bytes)
+
+        data_start = _aligned(_PREFIX_SIZE + len(header_bytes))
+        f.write(b'\0' * (data_start - f.tell()))
+
+        for offset, arr in self.buffers:
+            pos = data_start + offset
+            f.write(b'\0' * (pos - f.tell()))
+            # raw bytes. memoryview does not understand datetime64
+            f.write(arr.reshape(-1).view(np.uint8).data)
+
+    def write_into(self, buf, header_bytes):
+        """
+        Write into a preallocated buffer of at least `total_size` bytes.
+        MAGIC is written last so readers never see a partial value.
+        """
+        buf = memoryview(buf)
+        _LEN.pack_into(buf, len(MAGIC), len(header_bytes))
+        buf[_PREFIX_SIZE:_PREFIX_SIZE+len(header_bytes)] = header_bytes
+
+        data_start = _aligned(_PREFIX_SIZE + len(header_bytes))
+        for offset, arr in self.buffers:
+            pos = data_start + offset
+            buf[pos:pos+arr.nbytes] = arr.reshape(-1).view(np.uint8).data
+        buf[:len(MAGIC)] = MAGIC
+
+    def total_size(self, header_bytes):
+        return _aligned(_PREFIX_SIZE + len(header_bytes)) + self.size
+
+
+def _dump_index(index, writer):
+    pd = _pd()
+    if isinstance(index, pd.RangeIndex):
+        return {'kind': 'range', 'start': index.start, 'stop': index.stop,
+                'step': index.step, 'name': index.name}
+
+    # tz aware and extension indexes have non numpy dtypes
+    if isinstance(index.dtype, np.dtype) and mappable(index.values) \
+       and not isinstance(index, pd.MultiIndex):
+        return {'kind': 'buffer', 'buffer': writer.add(index.values),
+                'name': index.name, 'freq': getattr(index, 'freq', None)}
+
+    return {'kind': 'pickle', 'index': index}
+
+def _dump_frame(frame, writer):
+    """
+    Columns are grouped into one block per numpy dtype, the same way pandas
+    consolidates. placement holds the column positions of the block.
+    """
+    groups = {}
+    blocks = []
+    for i, dtype in enumerate(frame.dtypes):
+        if isinstance(dtype, np.dtype) and dtype.kind in _MAPPABLE_KINDS:
+            groups.setdefault(dtype, []).append(i)
+            continue
+        blocks.append({'kind': 'pickle', 'placement': [i],
+                       'values': frame.iloc[:, i].array})
+
+    for dtype, placement in groups.items():
+        # (ncols, nrows) is how pandas lays out its blocks
+        block = frame.iloc[:, placement].to_numpy().T
+        blocks.append({'kind': 'buffer', 'buffer': writer.add(block),
+                       'placement': placement})
+
+    return {
+        'kind': 'frame',
+        'blocks': blocks,
+        'columns': frame.columns,
+        'index': _dump_index(frame.index, writer),
+    }
+
+def _dump_series(series, writer):
+    values = series.values
+    header = {
+        'kind': 'series',
+        'name': series.name,
+        'index': _dump_index(series.index, writer),
+    }
+    if isinstance(series.dtype, np.dtype) and mappable(values):
+        header['values'] = {'kind': 'buffer', 'buffer': writer.add(values)}
+    else:
+        header['values'] = {'kind': 'pickle', 'values': series.array}
+    return header
+
+def _prepare(value):
+    writer = _Writer()
+    if isinstance(value, np.ndarray):
+        if not mappable(value):
+            raise TypeError("Only fixed width ndarrays can be mapped")
+        header = {'kind': 'ndarray', 'buffer': writer.add(value)}
+    elif _is_pandas(value, 'DataFrame'):
+        header = _dump_frame(value, writer)
+    elif _is_pandas(value, 'Series'):
+        header = _dump_series(value, writer)
+    else:
+        raise TypeError("Unsupported type {0}".format(type(value)))
+    return writer, header
+
+def dump(value, path):
+    """
+    Write value to path. Raises TypeError for values that are not
+    ndarrays or pandas objects.
+    """
+    writer, header = _prepare(value)
+    with open(path, 'wb') as f:
+        writer.write(f, header)
+
+def dump_into(value, allocate):
+    """
+    Write value into memory from `allocate(nbytes)`, which returns a
+    writable buffer. Used for shared memory segments.
+    """
+    writer, header = _prepare(value)
+    header_bytes = pickle.dumps(header, protocol=4)
+    buf = allocate(writer.total_size(header_bytes))
+    writer.write_into(buf, header_bytes)
+
+
+class _Reader(object):
+    def __init__(self, buf, data_start):
+        self.buf = buf
+        self.data_start = data_start
+
+    def array(self, spec):
+        dtype = np.dtype(spec['dtype'])
+        return np.ndarray(spec['shape'], dtype=dtype, buffer=self.buf,
+                          offset=self.data_start + spec['offset'])
+
+def _load_index(spec, reader):
+    pd = _pd()
+    kind = spec['kind']
+    if kind == 'range':
+        return pd.RangeIndex(spec['start'], spec['stop'], spec['step'],
+                             name=spec['name'])
+    if kind == 'buffer':
+        values = reader.array(spec['buffer'])
+        if spec['freq'] is not None:
+            return pd.DatetimeIndex(values, freq=spec['freq'],
+                                    name=spec['name'], copy=False)
+        return pd.Index(values, name=spec['name'], copy=False)
+    return spec['index']
+
+def _frame_from_blocks(blocks, columns, index):
+    """
+    Build a DataFrame around existing block values without copying.
+    """
+    pd = _pd()
+    try:
+        from pandas.core.internals import BlockManager
+        from pandas.core.internals.api import make_block
+    except ImportError:
+        make_block = None
+
+    if make_block is None:
+        # no block api, build column by column. this will copy
+        data = {}
+        for values, placement in blocks:
+            for row, pos in enumerate(placement):
+                data[pos] = values[row] if values.ndim == 2 else values
+        frame = pd.DataFrame(data, index=index)
+        frame = frame[sorted(data)]
+        frame.columns = columns
+        return frame
+
+    mgr = BlockManager([make_block(values, placement=placement, ndim=2)
+                        for values, placement in blocks],
+                       [columns, index])
+    if hasattr(pd.DataFrame, '_from_mgr'):
+        return pd.DataFrame._from_mgr(mgr, axes=mgr.axes)
+    return pd.DataFrame(mgr)
+
+def _load_frame(header, reader):
+    index = _load_index(header['index'], reader)
+    blocks = []
+    for block in header['blocks']:
+        if block['kind'] == 'buffer':
+            values = reader.array(block['buffer'])
+        else:
+            values = block['values']
+            if isinstance(values, np.ndarray):
+                values = values.reshape(1, -1)
+            # pandas wraps numpy values in PandasArray
+            elif hasattr(values, 'to_numpy') \
+                    and type(values).__name__ in ('PandasArray',
+                                                  'NumpyExtensionArray'):
+                values = values.to_numpy().reshape(1, -1)
+        blocks.append((values, block['placement']))
+
+    return _frame_from_blocks(blocks, header['columns'], index)
+
+def _load_series(header, reader):
+    pd = _pd()
+    index = _load_index(header['index'], reader)
+    spec = header['values']
+    if spec['kind'] == 'buffer':
+        values = reader.array(spec['buffer'])
+    else:
+        values = spec['values']
+    return pd.Series(values, index=index, name=header['name'], copy=False)
+
+def load(path):
+    """
+    Memory map path and return the stored value. Arrays are read-only views
+    into the map. The map stays open as long as any view is alive.
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buf[:len(MAGIC)] != MAGIC:
+        raise ValueError("{0} is not a naginpy buffer file".format(path))
+    return load_buffer(buf)
+
+def is_complete(buf):
+    """ Whether buf holds a fully written value """
+    return len(buf) >= _PREFIX_SIZE and bytes(buf[:len(MAGIC)]) == MAGIC
+
+def load_buffer(buf):
+    """
+    Same as load but for any buffer. Views are only read-only if buf is.
+    """
+    if not is_complete(buf):
+        raise ValueError("buffer does not hold a naginpy value")
+
+    header_len, = _LEN.unpack_from(buf, len(MAGIC))
+    header = pickle.loads(buf[_PREFIX_SIZE:_PREFIX_SIZE+header_len])
+    reader = _Reader(buf, _aligned(_PREFIX_SIZE + header_len))
+
+    kind = header['kind']
+    if kind == 'ndarray':
+        return reader.array(header['buffer'])
+    if kind == 'frame':
+        return _load_frame(header, reader)
+    if kind == 'series':
+        return _load_series(header, reader)
+    raise ValueError("Unknown value kind {0}".format(kind))
+
+
+class MMapStore(object):
+    """
+    Directory of mapped values keyed by a stable key like Manifest.hash_key
+    """
+    suffix = '.ngbuf'
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def keys(self):
+        for name in os.listdir(self.path):
+            if name.endswith(self.suffix):
+                yield name[:-len(self.suffix)]
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = '{0}.{1}'.format(path, os.getpid())
+        dump(value, tmp_path)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise KeyError(key)
+        return load(path)
+
+    def remove(self, key):
+        os.remove(self._path(key))
@@ -1,13 +1,86 @@
 import ast
+import builtins
+import copy
 
 from asttools import ast_repr
 
 _missing = object()
 
+# nodes whose value NodeContextManager knows how to resolve piecemeal
+_RESOLVABLE = (ast.Name, ast.Attribute, ast.Subscript, ast.Call)
+
+def _contains_missing(value):
+    if value is _missing:
+        return True
+    if isinstance(value, slice):
+        value = (value.start, value.stop, value.step)
+    if isinstance(value, tuple):
+        return any(_contains_missing(item) for item in value)
+    return False
+
+def _is_index(node):
+    # ast.Index only exists pre-3.9. Check by name to avoid deprecation noise
+    return node.__class__.__name__ == 'Index'
+
+_COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+# fields of control flow nodes that run exactly once when the node does.
+# everything else in them runs later, repeatedly or maybe not at all.
+# (field, index) only counts the item at index.
+_ONCE_FIELDS = {
+    ast.FunctionDef: ('decorator_list', 'args', 'returns'),
+    ast.AsyncFunctionDef: ('decorator_list', 'args', 'returns'),
+    ast.Lambda: ('args',),
+    ast.For: ('iter',),
+    ast.AsyncFor: ('iter',),
+    ast.While: (),
+    ast.If: ('test',),
+    ast.IfExp: ('test',),
+    ast.BoolOp: (('values', 0),),
+    ast.Try: ('body', 'finalbody'),
+    ast.comprehension: ('iter',),
+}
+for _comp in _COMPREHENSIONS:
+    # only the outermost iterable is evaluated up front
+    _ONCE_FIELDS[_comp] = (('generators', 0),)
+# newer syntax
+if hasattr(ast, 'TryStar'):
+    _ONCE_FIELDS[ast.TryStar] = _ONCE_FIELDS[ast.Try]
+if hasattr(ast, 'Match'):
+    _ONCE_FIELDS[ast.Match] = ('subject',)
+
+def runs_once(node, field, index=None):
+    """
+    Whether the code in `node.<field>[index]` runs exactly once each time
+    node runs.
+    """
+    once = _ONCE_FIELDS.get(type(node), None)
+    if once is None:
+        return True
+    return field in once or (field, index) in once
+
+def deferred_nodes(line):
+    """
+    Nodes of line that don't run exactly once when line runs, e.g. the body
+    of a def, lambda, loop or conditional branch.
+    """
+    deferred = set()
+    for node in ast.walk(line):
+        for field, value in ast.iter_fields(node):
+            children = value if isinstance(value, list) else [value]
+            for i, child in enumerate(children):
+                if not isinstance(child, ast.AST) or child in deferred:
+                    continue
+                if node in deferred or not runs_once(node, field, i):
+                    deferred.update(ast.walk(child))
+    return deferred
+
 class NodeContext(object):
     """
     Note that child refers to the AST. So reverse what is intuitive.
     """
+    __slots__ = ('node', 'parent', 'child', 'field', 'field_index', 'line',
+                 'depth', 'ns', 'mgr')
     # not every ast node has a referring python obj
     _invalid = object()
 
@@ -26,11 +99,23 @@ class NodeContext(object):
     def obj(self):
         return self.mgr.obj(self.node)
 
+    @property
+    def deferred(self):
+        """
+        Node doesn't run exactly once at line level. Values swapped in for
+        it would be stale or missing by the time it runs.
+        """
+        return self.mgr.deferred(self.node, self.line)
+
 class NodeContextManager(object):
     def __init__(self, ns):
         self.ns = ns
         self.contexts = {}
         self.objects = {}
+        # names put in ns for the current line
+        self.bound = set()
+        # (line, its deferred nodes)
+        self._deferred = (None, set())
         self.engine = None
 
     def __contains__(self, key):
@@ -54,18 +139,21 @@ class NodeContextManager(object):
         Grab the value corresponding to this node. 
         Name(id=id, ctx=Load): var in namespace
         Attribute(): attribute of var in namespace
+        Subscript(): item of resolved value
         Call(): result of call
 
+        Every node is evaluated at most once. The value is memoized in
+        `self.objects` and child nodes are resolved through the same memo,
+        so `df.iloc[x]` will only ever access `df.iloc` once no matter how
+        many engines ask for it.
+
         Note:
             So what I would prefer is for attribute access to never occur
             twice, since python is so dynamic.
 
-            However, while I can prevent the NodeContext system from not
-            accessing twice, the corresponding engine would have to
-            replace the Attribute node.
-
-            So I'm not sure if there's a good way to enforce my access once
-            mandate globally. More like coordination it seems.
+            The final exec gets around this by having SpecialEval replace
+            every resolved node with its value. See
+            `SpecialEval.replace_resolved`.
         """
         assert self.engine is not None, 'Engine should be set before obj called'
         obj = self._obj(node)
@@ -74,18 +162,162 @@ class NodeContextManager(object):
                             "{0}".format(ast_repr(node)))
         return obj
 
+    def resolved(self, node):
+        """ Whether node has a usable memoized value """
+        obj = self.objects.get(node, _missing)
+        return obj is not _missing and obj is not NodeContext._invalid
+
+    def getter(self, node):
+        """
+        Return a Name node and namespace update that will grab the memoized
+        value of node.
+        """
+        name = '__node_obj_{0}__'.format(id(node))
+        getter = ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
+        return getter, {name: self.objects[node]}
+
+    def deferred(self, node, line):
+        """ Whether node doesn't run exactly once when line runs """
+        if self._deferred[0] is not line:
+            self._deferred = (line, deferred_nodes(line))
+        return node in self._deferred[1]
+
+    def bind(self, name, value):
+        """
+        Put value in ns for the current line only. Engines use this for the
+        names they swap into a line. Removed by `clear`.
+        """
+        self.ns[name] = value
+        self.bound.add(name)
+
+    def clear(self):
+        """
+        Drop memoized objects and bound names. Called once a line has been
+        executed.
+        """
+        self.objects.clear()
+        self._deferred = (None, set())
+        for name in self.bound:
+            self.ns.pop(name, None)
+        self.bound.clear()
+
     def _obj(self, node):
         if node in self.objects:
-            obj = self.objects[node]
+            return self.objects[node]
+
+        obj = self._resolve(node)
+        self.objects[node] = obj
+        return obj
+
+    def _builtins(self):
+        ns_builtins = self.ns.get('__builtins__', builtins)
+        if isinstance(ns_builtins, dict):
+            return ns_builtins
+        return vars(ns_builtins)
 
-        obj = NodeContext._invalid
+    def _resolve(self, node):
         if isinstance(node, ast.Name):
             obj = self.ns.get(node.id, _missing)
+            if obj is _missing:
+                obj = self._builtins().get(node.id, _missing)
+            return obj
+
+        if not isinstance(node, _RESOLVABLE):
+            return NodeContext._invalid
 
         if isinstance(node, ast.Attribute):
-            child_obj = self.get(node.value).obj()
-            obj = getattr(child_obj, node.attr)
+            child_obj = self._value(node.value)
+            if child_obj is _missing:
+                return _missing
+            return getattr(child_obj, node.attr)
 
-        self.objects[node] = obj
-        return obj
+        if isinstance(node, ast.Subscript):
+            child_obj = self._value(node.value)
+            if child_obj is _missing:
+                return _missing
+            index = self._slice_value(node.slice)
+            if _contains_missing(index):
+                return _missing
+            return child_obj[index]
+
+        # ast.Call
+        func = self._value(node.func)
+        if func is _missing:
+            return _missing
+
+        # don't call with an argument we couldn't resolve
+        args = []
+        for arg in node.args:
+            starred = isinstance(arg, ast.Starred)
+            value = self._value(arg.value if starred else arg)
+            if value is _missing:
+                return _missing
+            if starred:
+                args.extend(value)
+            else:
+                args.append(value)
+
+        kwargs = {}
+        for keyword in node.keywords:
+            value = self._value(keyword.value)
+            if value is _missing:
+                return _missing
+            if keyword.arg is None:
+                kwargs.update(value)
+            else:
+                kwargs[keyword.arg] = value
+
+        return func(*args, **kwargs)
+
+    def _value(self, node):
+        """
+        Value of a child node. Resolvable nodes go through the memo, anything
+        else is evaluated with previously resolved sub nodes plugged in.
+        """
+        if isinstance(node, _RESOLVABLE):
+            return self._obj(node)
+
+        placeholders = {}
+        working = self._substitute(node, placeholders)
+        expr = ast.fix_missing_locations(ast.Expression(body=working))
+        code = compile(expr, '<node_context>', 'eval')
+        return eval(code, self.ns, placeholders)
+
+    def _slice_value(self, node):
+        if _is_index(node):
+            return self._slice_value(node.value)
+
+        if isinstance(node, ast.Slice):
+            bits = [None if part is None else self._value(part)
+                    for part in (node.lower, node.upper, node.step)]
+            return slice(*bits)
+
+        # ExtSlice pre-3.9, Tuple of slices afterwards
+        dims = getattr(node, 'dims', None)
+        if dims is None and isinstance(node, ast.Tuple):
+            dims = node.elts
+        if dims is not None:
+            return tuple(self._slice_value(dim) for dim in dims)
+
+        return self._value(node)
+
+    def _substitute(self, node, placeholders):
+        """
+        Return a copy of node where already resolved nodes are replaced
+        with a placeholder Name pointing to the memoized value.
+        """
+        if self.resolved(node):
+            getter, ns_update = self.getter(node)
+            placeholders.update(ns_update)
+            return getter
 
+        new_node = copy.copy(node)
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                value = [self._substitute(item, placeholders)
+                         if isinstance(item, ast.AST) else item
+                         for item in value]
+            elif isinstance(value, ast.AST):
+                value = self._substitute(value, placeholders)
+            setattr(new_node, field, value)
+        return new_node
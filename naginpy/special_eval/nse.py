@@ -1,19 +1,52 @@
 """
 Non-Standard Evaluation
+
+```
+@nse
+def string_func(var):
+    return var
+
+string_func(x + 1) # 'x + 1'
+
+@nse(columns=True)
+def filter(df, cond):
+    return df[cond(df)]
+
+filter(df, hp > 100) # cond is a ColumnExpr
+```
+
+With `columns=True`, every argument after the first (the data) is passed
+as a ColumnExpr. String constants are passed through untouched. The same
+applies to pipe stages, `__pipe_stage__(filter, hp > 100)`.
 """
 import ast
 
 from asttools import ast_print, ast_source
 
+from naginpy import hashing
+from naginpy.pipeline import Stage
+
+from .column_expr import ColumnExpr
 from .engine import Engine
 
-def nse(func):
-    func.__nse__ = True
-    return func
+COLUMNS = 'columns'
+
+def nse(func=None, columns=False):
+    def decorator(func):
+        func.__nse__ = COLUMNS if columns else True
+        return func
+
+    if func is None:
+        return decorator
+    return decorator(func)
+
+def _is_str(node):
+    return isinstance(node, ast.Constant) and isinstance(node.value, str)
 
 class NSEEngine(Engine):
     def should_handle_line(self, line, load_names):
-        return True
+        # nse only happens through calls
+        return any(isinstance(node, ast.Call) for node in ast.walk(line))
 
     def should_handle_node(self, node, context):
         parent = context.parent
@@ -22,8 +55,7 @@ class NSEEngine(Engine):
         handled = False
         if isinstance(parent, ast.Call) and field == 'func':
             func = context.obj()
-            if getattr(func, '__nse__', None):
-                print('woooo')
+            if getattr(func, '__nse__', None) or func is Stage:
                 handled = True
 
         if isinstance(parent, ast.Attribute) and field == 'value':
@@ -32,23 +64,53 @@ class NSEEngine(Engine):
         if isinstance(node, ast.Call):
             handled = True
 
-        print('*'*10)
-        print(context.obj())
-        ast_print('node:', node)
-        ast_print('parent:', parent)
-        print('field: ', field)
-        print('handled :', handled)
-        print('*'*10)
-
         return handled
 
     def handle_node(self, node, context):
-        if isinstance(node, ast.Call):
-            print('*'*10)
-            print(ast.dump(node))
-            print('*'*10)
-            for i, arg in enumerate(node.args):
-                # TODO grab source from original source text
-                str_rep = ast_source(arg)
-                node.args[i] = ast.Str(s=str_rep, lineno=0, col_offset=3)
+        if not isinstance(node, ast.Call):
+            return node
+
+        mgr = context.mgr
+        func = mgr.obj(node.func)
+        if func is Stage:
+            if not node.args:
+                return node
+            # __pipe_stage__(func, *args). data is passed in later
+            func = mgr.obj(node.args[0])
+
+        mode = getattr(func, '__nse__', None)
+        if mode == COLUMNS:
+            self.column_args(node, context)
+            return node
+
+        if not mode:
+            return node
+
+        for i, arg in enumerate(node.args):
+            # TODO grab source from original source text
+            str_rep = ast_source(arg)
+            node.args[i] = ast.Str(s=str_rep, lineno=0, col_offset=3)
         return node
+
+    def column_args(self, node, context):
+        """
+        Replace the args after the first with ColumnExpr getters.
+        """
+        for i, arg in enumerate(node.args[1:], 1):
+            node.args[i] = self.column_getter(arg, context)
+        for keyword in node.keywords:
+            keyword.value = self.column_getter(keyword.value, context)
+
+    def column_getter(self, arg, context):
+        if _is_str(arg) or isinstance(arg, ast.Starred):
+            return arg
+        source = ast_source(arg)
+        name = '__nse_col_{0}__'.format(hashing.hexdigest(source)[:16])
+        if context.deferred:
+            # a def or lambda body can run long after the line. the name
+            # comes from the source, so repeats share one ColumnExpr
+            context.ns[name] = ColumnExpr(source, context.ns)
+            context.mgr.bound.discard(name)
+        elif name not in context.ns:
+            context.mgr.bind(name, ColumnExpr(source, context.ns))
+        return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), arg)
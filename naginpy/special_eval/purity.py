@@ -0,0 +1,234 @@
+"""
+Purity and cost metadata for functions and types.
+
+```
+@declare(pure=False)
+def read_sensor():
+    ...
+
+register(MyFrame, 'compact', inplace=True)
+register(MyModel, cost=EXPENSIVE)
+```
+
+DataCacheEngine uses this to decide which nodes are worth caching:
+
+- impure calls are never cached, and neither is anything containing one
+- in-place calls are impure. They also drop the cached entries that
+  depend on the object they mutate
+- TRIVIAL calls are never cached, the cache lookup costs more
+- CHEAP calls are only cached when their inputs are large
+- EXPENSIVE calls are always cached
+
+Anything not declared is assumed pure and EXPENSIVE, which is how every
+node was treated before. Defaults for builtins, numpy and pandas are
+registered the first time they are needed, and only for modules that are
+already imported.
+"""
+import sys
+
+# never worth a cache lookup
+TRIVIAL = 0
+# linear in the input size. worth caching for large inputs
+CHEAP = 1
+# always worth caching
+EXPENSIVE = 2
+
+# obj => Traits, or (type, method name) => Traits
+_REGISTRY = {}
+# method name => Traits, for receivers that can't be resolved ahead of time
+_METHODS = {}
+# modules whose defaults are registered
+_LOADED = set()
+
+
+class Traits(object):
+    """
+    pure : bool
+        Same inputs give the same output, with no side effects.
+    inplace : bool
+        Mutates its receiver or arguments.
+    cost : int
+        TRIVIAL, CHEAP or EXPENSIVE.
+    """
+    def __init__(self, pure=True, inplace=False, cost=EXPENSIVE):
+        self.pure = pure
+        self.inplace = inplace
+        self.cost = cost
+
+    @property
+    def cacheable(self):
+        return self.pure and not self.inplace
+
+    def __repr__(self):
+        return "Traits(pure={0}, inplace={1}, cost={2})".format(
+            self.pure, self.inplace, self.cost)
+
+DEFAULT_TRAITS = Traits()
+_UFUNC_TRAITS = Traits(cost=CHEAP)
+
+def _traits(inplace=False, pure=True, cost=EXPENSIVE):
+    # in-place is a side effect
+    return Traits(pure=pure and not inplace, inplace=inplace, cost=cost)
+
+def register(obj, method=None, **traits):
+    """
+    Declare traits for a function or type. For a type, `method` names one
+    of its methods. Traits registered for the type itself apply to every
+    method that isn't registered, for the type or through register_method.
+    """
+    key = obj if method is None else (obj, method)
+    _REGISTRY[key] = _traits(**traits)
+    return obj
+
+def register_method(name, **traits):
+    """ Traits for a method name on any receiver, e.g. `append` """
+    _METHODS[name] = _traits(**traits)
+
+def declare(**traits):
+    """ Decorator version of register """
+    def decorator(func):
+        func.__traits__ = _traits(**traits)
+        return func
+    return decorator
+
+
+def _lookup(key):
+    try:
+        return _REGISTRY.get(key, None)
+    except TypeError:
+        # unhashable
+        return None
+
+def _type_traits(cls, name):
+    for base in cls.__mro__:
+        traits = _lookup((base, name))
+        if traits is not None:
+            return traits
+    # before the type itself. `list` is registered as a cheap pure call,
+    # that says nothing about `[].append`
+    traits = _METHODS.get(name, None)
+    if traits is not None:
+        return traits
+    for base in cls.__mro__:
+        traits = _lookup(base)
+        if traits is not None:
+            return traits
+    return None
+
+def get_traits(func):
+    """ Traits for a callable. DEFAULT_TRAITS if nothing is known. """
+    load_defaults()
+    traits = getattr(func, '__traits__', None)
+    if isinstance(traits, Traits):
+        return traits
+
+    traits = _lookup(func)
+    if traits is not None:
+        return traits
+
+    receiver = getattr(func, '__self__', None)
+    name = getattr(func, '__name__', None)
+    if receiver is not None and name is not None \
+       and not isinstance(receiver, type(sys)):
+        traits = _type_traits(type(receiver), name)
+        if traits is not None:
+            return traits
+
+    if type(func).__name__ == 'ufunc':
+        return _UFUNC_TRAITS
+    return DEFAULT_TRAITS
+
+def method_traits(name):
+    """ Traits for `<unknown>.name(...)` """
+    load_defaults()
+    return _METHODS.get(name, DEFAULT_TRAITS)
+
+
+# defaults
+
+def _builtin_defaults():
+    import builtins
+    import random
+    import time
+    for func in (len, abs, min, max, isinstance, type, str, int, float,
+                 bool, tuple, repr, hash, getattr, hasattr, range, round,
+                 divmod):
+        register(func, cost=TRIVIAL)
+    for func in (sorted, sum, any, all, list, dict, set, frozenset):
+        register(func, cost=CHEAP)
+    for func in (builtins.print, builtins.input, builtins.open, next, id,
+                 setattr, delattr, exec, eval):
+        register(func, pure=False)
+    for func in (time.time, time.perf_counter, time.monotonic, time.sleep):
+        register(func, pure=False, cost=TRIVIAL)
+    register(random.Random, pure=False)
+
+    for name in ('append', 'extend', 'insert', 'pop', 'popitem', 'remove',
+                 'clear', 'update', 'setdefault', 'add', 'discard', 'sort',
+                 'reverse', 'fill', 'resize', 'put', 'itemset', 'setflags'):
+        register_method(name, inplace=True)
+
+def _numpy_defaults(np):
+    random = np.random
+    for cls in (random.RandomState, getattr(random, 'Generator', None)):
+        if cls is not None:
+            register(cls, pure=False)
+    register(random.seed, pure=False, cost=TRIVIAL)
+
+    for name in ('sort', 'fill', 'resize', 'put', 'itemset', 'setflags',
+                 'partition', 'byteswap'):
+        register(np.ndarray, name, inplace=True)
+    for name in ('reshape', 'view', 'ravel', 'transpose', 'squeeze',
+                 'swapaxes', 'item', 'tolist'):
+        register(np.ndarray, name, cost=TRIVIAL)
+    for name in ('sum', 'mean', 'min', 'max', 'prod', 'any', 'all', 'copy',
+                 'astype', 'cumsum', 'clip', 'round', 'argmin', 'argmax'):
+        register(np.ndarray, name, cost=CHEAP)
+
+    for func in (np.shape, np.ndim, np.size, np.asarray, np.reshape,
+                 np.ravel, np.transpose, np.squeeze):
+        register(func, cost=TRIVIAL)
+    for func in (np.sum, np.mean, np.min, np.max, np.where, np.concatenate,
+                 np.arange, np.zeros, np.ones, np.full, np.array, np.copy,
+                 np.clip, np.cumsum, np.diff, np.isnan, np.any, np.all):
+        register(func, cost=CHEAP)
+
+def _pandas_defaults(pd):
+    for cls in (pd.DataFrame, pd.Series, pd.Index):
+        for name in ('head', 'tail', 'rolling', 'expanding', 'ewm',
+                     'groupby', 'resample', 'keys', 'items', 'iteritems',
+                     'get', 'xs', 'squeeze', 'to_numpy', 'ravel'):
+            register(cls, name, cost=TRIVIAL)
+        for name in ('copy', 'astype', 'isnull', 'isna', 'notnull', 'notna',
+                     'fillna', 'abs', 'round', 'clip', 'shift', 'diff',
+                     'cumsum', 'sum', 'mean', 'min', 'max', 'count', 'any',
+                     'all', 'rename', 'drop', 'assign', 'where', 'mask',
+                     'between', 'isin', 'reindex'):
+            register(cls, name, cost=CHEAP)
+        for name in ('insert', 'pop', 'update'):
+            register(cls, name, inplace=True)
+        for name in ('to_csv', 'to_parquet', 'to_pickle', 'to_sql',
+                     'to_excel', 'to_hdf', 'to_json', 'to_feather',
+                     'to_clipboard', 'plot', 'hist', 'info'):
+            register(cls, name, pure=False)
+
+_DEFAULTS = {
+    'numpy': _numpy_defaults,
+    'pandas': _pandas_defaults,
+}
+
+def load_defaults():
+    """ Register defaults for builtins and any imported numpy/pandas """
+    if 'builtins' not in _LOADED:
+        _LOADED.add('builtins')
+        _builtin_defaults()
+    if len(_LOADED) > len(_DEFAULTS):
+        return
+    for name, defaults in _DEFAULTS.items():
+        if name in _LOADED:
+            continue
+        mod = sys.modules.get(name, None)
+        if mod is None:
+            continue
+        _LOADED.add(name)
+        defaults(mod)
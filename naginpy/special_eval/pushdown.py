@@ -0,0 +1,309 @@
+"""
+Column projection and predicate pushdown into SourceObject reads.
+
+When a Manifest only uses `df.a` and `df.b`, `column_projections` lets the
+source read just those columns.
+
+For expressions like
+
+    df[df.date >= start].price
+    df.loc[(df.a > 5) & (df.b != 0)]
+
+where `df` is a SourceObject whose source supports predicates, we pass the
+filter down to the source instead of reading the whole frame and masking
+it. The source can skip chunks/row groups that can't match and only the
+filtered rows are ever materialized.
+
+Filters are a list of (column, op, value) tuples that are AND'd together,
+the same format pyarrow uses.
+
+Note: `df.iloc[mask]` is left alone. iloc does not take a boolean Series so
+pushing it down would change what the expression does.
+"""
+import ast
+import operator
+
+from asttools import is_load_name
+
+from .exec_context import _obj
+
+OPS = {
+    ast.Eq: '==',
+    ast.NotEq: '!=',
+    ast.Lt: '<',
+    ast.LtE: '<=',
+    ast.Gt: '>',
+    ast.GtE: '>=',
+}
+
+# value OP df.col => df.col FLIPPED value
+FLIPPED = {
+    '==': '==',
+    '!=': '!=',
+    '<': '>',
+    '<=': '>=',
+    '>': '<',
+    '>=': '<=',
+}
+
+OP_FUNCS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def apply_filters(frame, filters):
+    """ Mask frame with filters. For sources that filter after reading. """
+    mask = None
+    for col, op, value in filters:
+        col_mask = OP_FUNCS[op](frame[col], value)
+        mask = col_mask if mask is None else mask & col_mask
+    if mask is None:
+        return frame
+    return frame[mask]
+
+
+def _const_str(node):
+    if node.__class__.__name__ == 'Index':
+        # pre 3.9 subscript
+        node = node.value
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if node.__class__.__name__ == 'Str':
+        return node.s
+    return None
+
+def _column_access(node, parent, columns):
+    """
+    Return the columns selected if parent is a column access of node.
+    `df.a`, `df['a']` and `df[['a', 'b']]` are column accesses.
+    """
+    if isinstance(parent, ast.Attribute) and parent.value is node:
+        if parent.attr in columns:
+            return [parent.attr]
+        return None
+
+    if isinstance(parent, ast.Subscript) and parent.value is node:
+        key = parent.slice
+        if key.__class__.__name__ == 'Index':
+            key = key.value
+        if isinstance(key, ast.List):
+            selected = [_const_str(elt) for elt in key.elts]
+        else:
+            selected = [_const_str(key)]
+        if all(col in columns for col in selected):
+            return selected
+
+    return None
+
+def column_projections(code, context):
+    """
+    Find the columns used for each SourceObject that supports projection.
+
+    A source var only gets a projection if every use of it in code is a
+    column access. Anything else like `df.sum()` or `func(df)` needs the
+    whole object.
+
+    Returns dict of var name => list of columns.
+    """
+    candidates = {}
+    for k, v in context.items():
+        columns = getattr(v, 'columns', None)
+        if not callable(columns) or not getattr(v, 'supports_projection',
+                                                False):
+            continue
+        candidates[k] = set(columns())
+
+    if not candidates:
+        return {}
+
+    used = {k: [] for k in candidates}
+    for parent in ast.walk(code):
+        for child in ast.iter_child_nodes(parent):
+            if not is_load_name(child) or child.id not in used:
+                continue
+            selected = _column_access(child, parent, candidates[child.id])
+            if selected is None:
+                # needs the full object
+                del used[child.id]
+                continue
+            for col in selected:
+                if col not in used[child.id]:
+                    used[child.id].append(col)
+
+    return used
+
+def _column_ref(node, var, columns):
+    """
+    Return (column, [name nodes]) if node is `var.col` or `var['col']`
+    """
+    base = getattr(node, 'value', None)
+    if not (is_load_name(base) and base.id == var):
+        return None
+
+    if isinstance(node, ast.Attribute):
+        col = node.attr
+    elif isinstance(node, ast.Subscript):
+        col = _const_str(node.slice)
+    else:
+        return None
+
+    if col not in columns:
+        return None
+    return col, [base]
+
+def _names(node):
+    return [n for n in ast.walk(node) if is_load_name(n)]
+
+def _parse_predicate(node, var, columns):
+    """
+    Parse a filter expression into [(column, op, value_node)] along with the
+    var Name nodes that it uses. Returns None if it is not a pushable filter.
+    """
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitAnd):
+        left = _parse_predicate(node.left, var, columns)
+        right = _parse_predicate(node.right, var, columns)
+        if left is None or right is None:
+            return None
+        return left[0] + right[0], left[1] + right[1]
+
+    if not isinstance(node, ast.Compare) or len(node.ops) != 1:
+        return None
+
+    op = OPS.get(type(node.ops[0]), None)
+    if op is None:
+        return None
+
+    left, right = node.left, node.comparators[0]
+    ref = _column_ref(left, var, columns)
+    value = right
+    if ref is None:
+        ref = _column_ref(right, var, columns)
+        value = left
+        op = FLIPPED[op]
+
+    if ref is None:
+        return None
+
+    # value side has to be computable without the source
+    if any(n.id == var for n in _names(value)):
+        return None
+
+    col, var_nodes = ref
+    return [(col, op, value)], var_nodes
+
+def _filter_subscript(node, candidates):
+    """
+    Return (var, base var Name node) if node is `var[pred]` or
+    `var.loc[pred]`.
+    """
+    if not isinstance(node, ast.Subscript):
+        return None
+
+    base = node.value
+    if isinstance(base, ast.Attribute) and base.attr == 'loc':
+        base = base.value
+
+    if is_load_name(base) and base.id in candidates:
+        return base.id, base
+    return None
+
+def _parents(code):
+    parents = {}
+    for parent in ast.walk(code):
+        for field, value in ast.iter_fields(parent):
+            if isinstance(value, list):
+                for i, child in enumerate(value):
+                    if isinstance(child, ast.AST):
+                        parents[child] = (parent, field, i)
+            elif isinstance(value, ast.AST):
+                parents[value] = (parent, field, None)
+    return parents
+
+def _eval_value(node, context):
+    ns = {}
+    for name in _names(node):
+        if name.id in context:
+            ns[name.id] = _obj(context[name.id])
+    expr = ast.fix_missing_locations(ast.Expression(body=node))
+    return eval(compile(expr, '<pushdown>', 'eval'), ns)
+
+def _replace(parents, node, new_node):
+    parent, field, index = parents[node]
+    if index is None:
+        setattr(parent, field, new_node)
+    else:
+        getattr(parent, field)[index] = new_node
+
+
+def predicate_pushdowns(code, context):
+    """
+    Find filter subscripts on SourceObjects that support predicates.
+
+    A var is only pushed down when every use of it is inside one filter
+    subscript. The filter subscript in code is replaced with the bare var,
+    so the var should then be bound to the filtered read.
+
+    Note: code is modified in place, pass in a copy.
+
+    Returns dict of var name => (columns, filters). columns is None when
+    every column is needed.
+    """
+    candidates = {}
+    for k, v in context.items():
+        if not getattr(v, 'supports_predicates', False):
+            continue
+        candidates[k] = set(v.columns())
+
+    if not candidates:
+        return {}
+
+    found = {}
+    accounted = set()
+    for node in ast.walk(code):
+        match = _filter_subscript(node, candidates)
+        if match is None:
+            continue
+        var, base = match
+        parsed = _parse_predicate(node.slice, var, candidates[var])
+        if parsed is None:
+            continue
+        filters, var_nodes = parsed
+        found.setdefault(var, []).append((node, filters))
+        accounted.add(base)
+        accounted.update(var_nodes)
+
+    pushable = {}
+    for var, matches in found.items():
+        uses = [n for n in _names(code) if n.id == var]
+        if len(matches) != 1 or any(n not in accounted for n in uses):
+            continue
+        pushable[var] = matches[0]
+
+    if not pushable:
+        return {}
+
+    parents = _parents(code)
+    pushdowns = {}
+    for var, (node, filters) in pushable.items():
+        filters = [(col, op, _eval_value(value, context))
+                   for col, op, value in filters]
+
+        columns = None
+        parent = parents[node][0]
+        selected = _column_access(node, parent, candidates[var])
+        if selected is not None:
+            columns = list(selected)
+            for col, _, _ in filters:
+                if col not in columns:
+                    columns.append(col)
+
+        _replace(parents, node, ast.copy_location(
+            ast.Name(id=var, ctx=ast.Load()), node))
+        pushdowns[var] = (columns, filters)
+
+    return pushdowns
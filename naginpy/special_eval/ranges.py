@@ -0,0 +1,234 @@
+"""
+Serve slices from cached larger slices.
+
+```
+head = df.iloc[:100000]             # computed and cached
+part = df.iloc[:50000]              # head.iloc[:50000]
+
+year = df.loc['2015':'2016']        # computed and cached
+half = df.loc['2015-06':'2015-12']  # year.loc['2015-06':'2015-12']
+```
+
+Manifests whose expression is `<base>.iloc[lo:hi]` or `<base>.loc[lo:hi]`
+are indexed by their base Manifest, the accessor and the slice bounds. The
+base Manifest is the base expression with the same context, so it keys on
+the same objects. A later slice of the same base that falls inside a
+cached range is answered by slicing the cached value.
+
+Bounds have to be constants or scalar context variables, and the step
+empty. iloc bounds can't be negative, since the length of the base isn't
+known. loc is only served when the base is an in-memory object whose index
+is sorted, otherwise a label slice isn't a contiguous range. On a
+DatetimeIndex, string bounds are partial dates, so `'2016'` covers the
+whole year.
+"""
+import ast
+
+from asttools import ast_source
+
+from .exec_context import ContextObject, ScalarObject
+from .manifest import _manifest
+
+ACCESSORS = ('iloc', 'loc')
+
+
+class _Unbounded(object):
+    """ Compares below or above everything """
+    def __init__(self, sign):
+        self.sign = sign
+
+    def __lt__(self, other):
+        return self.sign < 0
+
+    def __gt__(self, other):
+        return self.sign > 0
+
+    def __le__(self, other):
+        return self.sign < 0 or other is self
+
+    def __ge__(self, other):
+        return self.sign > 0 or other is self
+
+    def __repr__(self):
+        return '-inf' if self.sign < 0 else 'inf'
+
+LOWEST = _Unbounded(-1)
+HIGHEST = _Unbounded(1)
+
+
+class SliceKey(object):
+    """
+    base : Manifest
+        The object being sliced.
+    accessor : str
+        iloc or loc.
+    lo, hi : bound values, None when open
+    """
+    def __init__(self, base, accessor, lo, hi, base_obj=None):
+        self.base = base
+        self.accessor = accessor
+        self.lo = lo
+        self.hi = hi
+        self.base_obj = base_obj
+
+    @property
+    def group(self):
+        return (self.base, self.accessor)
+
+    def __repr__(self):
+        return "SliceKey({0}.{1}[{2}:{3}])".format(
+            self.base.expression.get_source(), self.accessor, self.lo,
+            self.hi)
+
+def _bound(node, context):
+    """ (ok, value) of a slice bound """
+    if node is None:
+        return True, None
+    if isinstance(node, ast.Constant):
+        return True, node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) \
+       and isinstance(node.operand, ast.Constant):
+        return True, -node.operand.value
+    if isinstance(node, ast.Name):
+        item = context.data.get(node.id, None)
+        if type(item) is ScalarObject:
+            return True, item.obj
+    return False, None
+
+def _base_obj(node, context):
+    """ In-memory object being sliced, if it is a plain variable """
+    if not isinstance(node, ast.Name):
+        return None
+    item = context.data.get(node.id, None)
+    if type(item) is not ContextObject:
+        return None
+    return item.obj
+
+def slice_key(manifest):
+    """ SliceKey for a `<base>.iloc[lo:hi]` Manifest, otherwise None """
+    body = manifest.expression.code.body
+    if not isinstance(body, ast.Subscript):
+        return None
+    accessor = body.value
+    if not isinstance(accessor, ast.Attribute) \
+       or accessor.attr not in ACCESSORS:
+        return None
+    index = body.slice
+    if not isinstance(index, ast.Slice) or index.step is not None:
+        return None
+
+    context = manifest.context
+    ok_lo, lo = _bound(index.lower, context)
+    ok_hi, hi = _bound(index.upper, context)
+    if not (ok_lo and ok_hi):
+        return None
+
+    base_node = accessor.value
+    base_obj = _base_obj(base_node, context)
+    if accessor.attr == 'iloc':
+        for bound in (lo, hi):
+            if bound is not None and (type(bound) is not int or bound < 0):
+                return None
+    elif not _sorted(base_obj):
+        return None
+
+    base = _manifest(ast_source(base_node), dict(context.items()))
+    return SliceKey(base, accessor.attr, lo, hi, base_obj)
+
+def _sorted(obj):
+    index = getattr(obj, 'index', None)
+    return bool(getattr(index, 'is_monotonic_increasing', False))
+
+def _label_range(key):
+    """ Inclusive (start, end) covered by a loc slice """
+    lo = LOWEST if key.lo is None else key.lo
+    hi = HIGHEST if key.hi is None else key.hi
+    index = getattr(key.base_obj, 'index', None)
+    if type(index).__name__ != 'DatetimeIndex':
+        return lo, hi
+
+    import pandas as pd
+    if isinstance(lo, str):
+        lo = pd.Period(lo).start_time
+    if isinstance(hi, str):
+        hi = pd.Period(hi).end_time
+    return lo, hi
+
+def _covers(cached, wanted):
+    if cached.accessor == 'iloc':
+        c_lo, w_lo = cached.lo or 0, wanted.lo or 0
+        c_hi = HIGHEST if cached.hi is None else cached.hi
+        w_hi = HIGHEST if wanted.hi is None else wanted.hi
+    else:
+        c_lo, c_hi = _label_range(cached)
+        w_lo, w_hi = _label_range(wanted)
+    try:
+        return bool(c_lo <= w_lo and w_hi <= c_hi)
+    except (TypeError, ValueError):
+        # labels that don't compare
+        return False
+
+def sub_slice(value, cached, wanted):
+    """ wanted out of the value cached for the cached key """
+    if wanted.accessor == 'loc':
+        return value.loc[wanted.lo:wanted.hi]
+    start = (wanted.lo or 0) - (cached.lo or 0)
+    stop = None if wanted.hi is None else wanted.hi - (cached.lo or 0)
+    return value.iloc[start:stop]
+
+
+class RangeIndex(object):
+    """ (base Manifest, accessor) => [(SliceKey, Computable)] """
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, entry):
+        key = slice_key(entry.manifest)
+        if key is None:
+            return None
+        self.groups.setdefault(key.group, []).append((key, entry))
+        return key
+
+    def remove(self, entry):
+        """ Drop entry. Called when it leaves the cache. """
+        key = slice_key(entry.manifest)
+        if key is None:
+            return
+        items = self.groups.get(key.group, None)
+        if items is None:
+            return
+        items[:] = [item for item in items if item[1] is not entry]
+        if not items:
+            del self.groups[key.group]
+
+    def find(self, manifest, valid=None):
+        """
+        (cached key, cached entry, wanted key) for the smallest cached
+        range covering manifest, or None.
+
+        valid : callable(entry)
+            Entries it rejects are dropped from the index.
+        """
+        wanted = slice_key(manifest)
+        if wanted is None:
+            return None
+        items = self.groups.get(wanted.group, None)
+        if not items:
+            return None
+
+        if valid is not None:
+            items[:] = [(key, entry) for key, entry in items if valid(entry)]
+
+        best = None
+        for key, entry in items:
+            if not entry.executed or not _covers(key, wanted):
+                continue
+            size = len(entry.value)
+            if best is None or size < best[0]:
+                best = (size, key, entry)
+        if best is None:
+            return None
+        return best[1], best[2], wanted
+
+    def clear(self):
+        self.groups.clear()
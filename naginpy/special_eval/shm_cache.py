@@ -0,0 +1,361 @@
+"""
+Result cache shared by kernels on the same host through shared memory.
+
+```
+manager = ComputationManager(shared=SharedMemoryCache(capacity=2 ** 30))
+```
+
+Numeric values (ndarrays, frames, series) of stateless Manifests are written
+once into a named shared memory segment using the mmap_store layout. Another
+kernel evaluating the same Manifest attaches to the segment and gets
+read-only views into it. Nothing is copied or recomputed.
+
+The index is the segment name itself. It is derived from
+`Manifest.hash_key`, so looking up a key is just trying to attach to its
+segment. The mmap_store MAGIC is written last, so a segment that another
+kernel is still filling is treated as a miss. Until then the writer keeps
+its pid where MAGIC goes. If that process is gone, the writer crashed and
+the next `put` unlinks the segment and writes it again.
+
+Segments outlive the kernel that created them. `capacity` caps the bytes a
+cache keeps in segments it created, evicting its oldest ones first. `remove`
+and `clear` free segments explicitly.
+"""
+import collections
+import mmap
+import os
+import shutil
+import struct
+import sys
+from multiprocessing import shared_memory
+
+from . import mmap_store
+
+# macOS limits shm names to 31 chars
+_NAME_DIGEST_SIZE = 20
+
+# SharedMemory grew `track` in 3.13. Before that every segment we open is
+# registered with the resource tracker, which unlinks it when we exit.
+_HAS_TRACK = sys.version_info >= (3, 13)
+
+# linux exposes segments as files, so they can be mapped read-only and
+# their filesystem checked for space
+_SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# writer pid, stored where MAGIC goes until the value is complete
+_PID = struct.Struct('<Q')
+
+# handles that back read-only views when segments have no file (macOS).
+# closing a handle with live views crashes, so they are never closed.
+_HANDLES = []
+
+
+def _tracker_name(shm):
+    # the tracker knows posix segments by their name with the leading slash
+    if os.name == 'nt':
+        return shm.name
+    return '/' + shm.name
+
+def _untrack(shm):
+    """
+    The multiprocessing resource tracker unlinks segments when the creating
+    process exits. Shared segments have to survive their creator.
+    """
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(_tracker_name(shm), 'shared_memory')
+    except Exception:
+        pass
+
+def _open(name, size=0, create=False):
+    if _HAS_TRACK:
+        return shared_memory.SharedMemory(name=name, create=create,
+                                          size=size, track=False)
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    _untrack(shm)
+    return shm
+
+def _map_readonly(name):
+    """
+    Read-only map of the segment. Views hold on to the map, so it can't be
+    closed out from under them. Closing a SharedMemory with live views
+    segfaults.
+
+    Raises ValueError for a segment that was created but not sized yet.
+    """
+    if os.name == 'nt':
+        shm = _open(name)
+        try:
+            return mmap.mmap(-1, shm.size, tagname=name,
+                             access=mmap.ACCESS_READ)
+        finally:
+            shm.close()
+
+    if _SHM_DIR is not None:
+        fd = os.open(os.path.join(_SHM_DIR, name), os.O_RDONLY)
+        try:
+            # mmap raises ValueError for an empty file
+            return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+    shm = _open(name)
+    if not shm.size:
+        shm.close()
+        raise ValueError("segment {0} is empty".format(name))
+    _HANDLES.append(shm)
+    return shm.buf.toreadonly()
+
+def _release(buf):
+    if isinstance(buf, mmap.mmap):
+        buf.close()
+    else:
+        buf.release()
+
+def _unlink(shm):
+    if not _HAS_TRACK:
+        # pre 3.13 unlink unregisters with the tracker, register it back
+        # so the tracker doesn't complain about an unknown segment
+        from multiprocessing import resource_tracker
+        resource_tracker.register(_tracker_name(shm), 'shared_memory')
+    shm.unlink()
+
+def _writer_pid(buf):
+    """
+    pid of the process still writing buf. None when buf is complete. 0 when
+    the writer has not stamped it yet.
+    """
+    if mmap_store.is_complete(buf):
+        return None
+    if len(buf) < _PID.size:
+        return 0
+    return _PID.unpack_from(buf, 0)[0]
+
+def _alive(pid):
+    if pid == 0 or os.name == 'nt':
+        # windows frees a segment once every handle to it is closed, so a
+        # crashed writer can't leave one behind. os.kill would terminate.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # alive, but owned by someone else
+        return True
+    return True
+
+def _has_room(nbytes):
+    """
+    Writing past the end of a full tmpfs kills the process with SIGBUS
+    instead of raising, so check before creating the segment.
+    """
+    if _SHM_DIR is None:
+        return True
+    return shutil.disk_usage(_SHM_DIR).free >= nbytes
+
+
+class _NoRoom(Exception):
+    pass
+
+
+class SharedMemoryCache(object):
+    """
+    Same interface as SharedCache, so it can be used as the `shared` backend
+    of a ComputationManager.
+
+    prefix : str
+        Kernels only share segments with the same prefix.
+    capacity : int, optional
+        Max bytes held in segments this cache created. The least recently
+        used ones are unlinked to make room. Values larger than capacity
+        are not shared.
+    """
+    def __init__(self, prefix='ngpy', capacity=None):
+        self.prefix = prefix
+        self.capacity = capacity
+        # key => read-only map of attached segments
+        self.segments = {}
+        # key => nbytes of segments this cache created, least recently used
+        # first
+        self.created = collections.OrderedDict()
+
+    @property
+    def nbytes(self):
+        """ Bytes held in segments this cache created """
+        return sum(self.created.values())
+
+    def segment_name(self, key):
+        digest = key.rpartition('-')[2]
+        return "{0}_{1}".format(self.prefix, digest[:_NAME_DIGEST_SIZE])
+
+    def _attach(self, key):
+        buf = self.segments.get(key, None)
+        if buf is not None:
+            return buf
+
+        try:
+            buf = _map_readonly(self.segment_name(key))
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if not mmap_store.is_complete(buf):
+            # still being written
+            _release(buf)
+            return None
+
+        self.segments[key] = buf
+        return buf
+
+    def __contains__(self, manifest):
+        if not manifest.stateless:
+            return False
+        return self._attach(manifest.hash_key) is not None
+
+    def fetch(self, manifests):
+        """ Attach to every existing segment for manifests """
+        attached = []
+        for manifest in manifests:
+            if not manifest.stateless:
+                continue
+            key = manifest.hash_key
+            if key not in self.segments and self._attach(key) is not None:
+                attached.append(key)
+        return attached
+
+    def get(self, manifest):
+        """ Zero copy, read-only value. Raises KeyError on a miss. """
+        if not manifest.stateless:
+            raise KeyError(manifest.key)
+        key = manifest.hash_key
+        buf = self._attach(key)
+        if buf is None:
+            raise KeyError(key)
+        if key in self.created:
+            self.created.move_to_end(key)
+        return mmap_store.load_buffer(buf)
+
+    def put(self, manifest, value):
+        """
+        Publish value. Non-numeric values and stateful Manifests are
+        skipped, as are values that don't fit under capacity or in free
+        shared memory. Returns the key, or None if nothing was stored.
+        """
+        if not manifest.stateless or not mmap_store.supported(value):
+            return None
+
+        key = manifest.hash_key
+        if self._attach(key) is not None:
+            return key
+
+        try:
+            nbytes = self._create(key, value)
+        except FileExistsError:
+            if self._attach(key) is not None:
+                # finished while we were preparing ours
+                return key
+            if not self._clear_stale(key):
+                # another kernel is writing the same value
+                return None
+            try:
+                nbytes = self._create(key, value)
+            except FileExistsError:
+                return None
+
+        if nbytes is None:
+            return None
+        self.created[key] = nbytes
+        return key
+
+    def _create(self, key, value):
+        """
+        Write value into a new segment. Returns its size, or None if there
+        was no room for it.
+        """
+        name = self.segment_name(key)
+        segments = []
+
+        def allocate(nbytes):
+            if not self._make_room(nbytes):
+                raise _NoRoom()
+            shm = _open(name, size=nbytes, create=True)
+            segments.append(shm)
+            _PID.pack_into(shm.buf, 0, os.getpid())
+            return shm.buf
+
+        try:
+            mmap_store.dump_into(value, allocate)
+        except _NoRoom:
+            return None
+        except BaseException:
+            # don't leave a segment that never completes
+            for shm in segments:
+                _unlink(shm)
+            raise
+        finally:
+            for shm in segments:
+                shm.close()
+
+        return sum(shm.size for shm in segments)
+
+    def _make_room(self, nbytes):
+        if self.capacity is not None:
+            if nbytes > self.capacity:
+                return False
+            while self.created and self.nbytes + nbytes > self.capacity:
+                self._unlink(next(iter(self.created)))
+        return _has_room(nbytes)
+
+    def _clear_stale(self, key):
+        """
+        Unlink the segment for key if its writer died before finishing it.
+        Otherwise the name stays taken and every later put fails. Returns
+        whether the name is free again.
+        """
+        try:
+            buf = _map_readonly(self.segment_name(key))
+        except FileNotFoundError:
+            return True
+        except ValueError:
+            # writer is between creating and sizing the segment
+            return False
+
+        try:
+            pid = _writer_pid(buf)
+        finally:
+            _release(buf)
+
+        if pid is None or _alive(pid):
+            return False
+        self._unlink(key)
+        return True
+
+    def remove(self, manifest):
+        self._unlink(manifest.hash_key)
+
+    def _unlink(self, key):
+        # existing views keep their map. memory is freed when they go.
+        self.segments.pop(key, None)
+        self.created.pop(key, None)
+        try:
+            shm = _open(self.segment_name(key))
+        except FileNotFoundError:
+            # another kernel already removed it
+            return
+        try:
+            _unlink(shm)
+        finally:
+            shm.close()
+
+    def clear(self, all=False):
+        """
+        Unlink every segment this cache created and detach from the rest.
+        Other kernels may still be using segments they created, so those
+        are only unlinked when `all` is True.
+        """
+        if all:
+            for key in list(self.segments):
+                self._unlink(key)
+        for key in list(self.created):
+            self._unlink(key)
+        self.segments.clear()
@@ -0,0 +1,125 @@
+"""
+File backed sources for SourceObject.
+
+Both sources support column projection. When a Manifest only touches
+`df.a` and `df.b`, SourceObject will ask the source for just those columns
+and the rest are never read.
+
+They also support predicates. `df[df.a > 5]` passes the filter down so only
+matching rows are materialized. See pushdown.py.
+
+```
+source = CSVSource('/data/csv')
+df = SourceObject(source, 'prices') # /data/csv/prices.csv
+m = _manifest("df.a + df.b", {'df': df})
+m.eval() # only reads columns a and b
+```
+"""
+import abc
+import os
+
+from .pushdown import apply_filters
+
+
+class FileSource(metaclass=abc.ABCMeta):
+    """
+    Directory of files. The key is the file name without the extension.
+    Subclasses set `extension` and implement `read_columns` and `read`.
+    """
+    supports_projection = True
+    supports_predicates = True
+    extension = None
+
+    def __init__(self, path, source_key=None, **read_kwargs):
+        self.path = path
+        if source_key is None:
+            source_key = "{0}({1})".format(self.__class__.__name__,
+                                           os.path.abspath(path))
+        self.source_key = source_key
+        self.read_kwargs = read_kwargs
+        self._columns = {}
+
+    def file_path(self, key):
+        return os.path.join(self.path, key + self.extension)
+
+    def columns(self, key):
+        """ Column names, read from the file metadata and cached """
+        if key not in self._columns:
+            self._columns[key] = list(self.read_columns(self.file_path(key)))
+        return self._columns[key]
+
+    def get(self, key, columns=None, filters=None):
+        return self.read(self.file_path(key), columns, filters)
+
+    @abc.abstractmethod
+    def read_columns(self, path):
+        """ Column names of the file, without reading its data """
+        pass
+
+    @abc.abstractmethod
+    def read(self, path, columns, filters=None):
+        """
+        Read the file as a DataFrame. columns is None for every column.
+        filters is a list of (column, op, value) that rows must all match.
+        """
+        pass
+
+
+class CSVSource(FileSource):
+    """
+    With filters, the file is read in chunks of `chunksize` rows and each
+    chunk is filtered before moving on. Only matching rows are kept.
+    """
+    extension = '.csv'
+    chunksize = 2 ** 16
+
+    def read_columns(self, path):
+        import pandas as pd
+        return pd.read_csv(path, nrows=0, **self.read_kwargs).columns
+
+    def read(self, path, columns, filters=None):
+        import pandas as pd
+        kwargs = self.read_kwargs.copy()
+        index_col = kwargs.get('index_col', None)
+        # positional index_col would shift once columns are dropped
+        if index_col is not None and not isinstance(index_col, str):
+            columns = None
+
+        if columns is not None:
+            usecols = list(columns)
+            # index column has to be read to set the index
+            if index_col is not None and index_col not in usecols:
+                usecols.append(index_col)
+            kwargs['usecols'] = usecols
+
+        if not filters:
+            return pd.read_csv(path, **kwargs)
+
+        kwargs['chunksize'] = self.chunksize
+        chunks = [apply_filters(chunk, filters)
+                  for chunk in pd.read_csv(path, **kwargs)]
+        if not chunks:
+            # empty file, no chunks to concat
+            del kwargs['chunksize']
+            return pd.read_csv(path, **kwargs)
+        return pd.concat(chunks)
+
+
+class ParquetSource(FileSource):
+    """
+    Requires pyarrow, `pip install naginpy[parquet]`. Only the column
+    chunks of the requested columns are read from disk, and filters let
+    pyarrow skip row groups whose statistics can't match.
+    """
+    extension = '.parquet'
+
+    def read_columns(self, path):
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+
+    def read(self, path, columns, filters=None):
+        import pandas as pd
+        kwargs = self.read_kwargs.copy()
+        if filters:
+            kwargs['filters'] = filters
+        return pd.read_parquet(path, columns=columns, **kwargs)
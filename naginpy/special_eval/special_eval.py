@@ -1,10 +1,10 @@
 import ast
 from functools import partial
 
-from asttools import ast_repr, _eval
+from asttools import ast_repr, replace_node, _eval
 
 from ..graph import GatherGrapher
-from .node_context import NodeContextManager
+from .node_context import NodeContextManager, runs_once
 
 
 class EvalEvent(object):
@@ -59,12 +59,48 @@ class SpecialEval(object):
         if not self.grapher._processed:
             self.grapher.process()
 
+        # lines no engine wants to touch. these get run in bulk
+        unclaimed = []
+
         for line in self.grapher.code.body:
+            if not self.line_claimed(line):
+                unclaimed.append(line)
+                continue
+
+            yield from self.flush_unclaimed(unclaimed)
+            unclaimed = []
+
             for engine in self.engines:
                 yield from filter(None, self.process_line(line, engine))
-            self.sanity_check_objects(line)
+            getter_names = self.sanity_check_objects(line)
             for engine in self.engines:
                 res = engine.line_postprocess(line, self.ns)
+            for name in getter_names:
+                self.ns.pop(name, None)
+            self.context_manager.clear()
+
+        yield from self.flush_unclaimed(unclaimed)
+
+    def line_claimed(self, line):
+        load_names = self.grapher.gather_nodes.get(line, None)
+        return any(engine.should_handle_line(line, load_names)
+                   for engine in self.engines)
+
+    def flush_unclaimed(self, lines):
+        """
+        Lines that no engine handles do not need node processing. Hand the
+        whole run to the engines so NormalEval can compile it once.
+        """
+        if not lines:
+            return
+
+        event = self.debug(lines[0], "Bulk processing {0} unclaimed lines"
+                                  "".format(len(lines)))
+        if event:
+            yield event
+
+        for engine in self.engines:
+            engine.bulk_postprocess(lines, self.ns)
 
     def __next__(self):
         return next(iter(self))
@@ -84,7 +120,7 @@ class SpecialEval(object):
                              "".format(engine=repr(engine)))
             return
 
-        for node in reversed(load_names):
+        for node in reversed(load_names or []):
             self.handle_load_name(node, line, engine)
 
         engine.post_node_loop(line, ns)
@@ -143,10 +179,42 @@ class SpecialEval(object):
 
         We could either warn, error, or automatically replace the ast.Attribute
 
-        HM. Auto replacing might be the way to go.
+        We auto replace. Every resolved node still in the line is swapped
+        for a getter Name so the final exec reuses the value instead of
+        evaluating the node again. Returns the getter names added to ns.
+
+        Only nodes that run exactly once at line level are replaced. Inside
+        a def, lambda, loop or branch the value would be stale or the getter
+        gone by the time the code runs.
         """
         # TODO put object replacing logic into NormalEval
-        for node in ast.walk(line):
-            if node in self.context_manager.objects:
-                if isinstance(node, ast.Name):
+        ns_update = {}
+        self.replace_resolved(line, ns_update)
+        self.ns.update(ns_update)
+        return list(ns_update)
+
+    def replace_resolved(self, node, ns_update):
+        mgr = self.context_manager
+        for field, value in ast.iter_fields(node):
+            children = value if isinstance(value, list) else [value]
+            for i, child in enumerate(children):
+                if not isinstance(child, ast.AST):
+                    continue
+                if not runs_once(node, field, i):
                     continue
+
+                ctx = getattr(child, 'ctx', None)
+                replaceable = mgr.resolved(child) \
+                    and not isinstance(child, ast.Name) \
+                    and not isinstance(ctx, (ast.Store, ast.Del))
+
+                if not replaceable:
+                    self.replace_resolved(child, ns_update)
+                    continue
+
+                getter, getter_ns = mgr.getter(child)
+                ns_update.update(getter_ns)
+                if isinstance(value, list):
+                    value[i] = getter
+                else:
+                    setattr(node, field, getter)
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+import numpy as np
+import nose.tools as nt
+
+from ..admission import AdmissionPolicy, ExprStats
+from ..computation import ComputationManager
+from ..manifest import Expression
+
+
+def slow(x):
+    time.sleep(0.002)
+    return x + 1
+
+class TestAdmissionPolicy(TestCase):
+    def test_learning(self):
+        policy = AdmissionPolicy(min_samples=2, min_time=1e-3)
+        nt.assert_true(policy.admit('cheap'))
+        policy.record('cheap', 1e-6, 8)
+        policy.record('cheap', 1e-6, 8)
+        # fast to recompute
+        nt.assert_false(policy.admit('cheap'))
+
+        policy.record('unused', 1.0, 8)
+        policy.record('unused', 1.0, 8)
+        # never reused
+        nt.assert_false(policy.admit('unused'))
+
+        policy.record('reused', 1.0, 8)
+        policy.record('reused', 1.0, 8)
+        policy.hit('reused')
+        nt.assert_true(policy.admit('reused'))
+
+    def test_probe(self):
+        policy = AdmissionPolicy(min_samples=1, probe_interval=3)
+        policy.record('key', 0.0, 8)
+        admits = [policy.admit('key') for _ in range(6)]
+        nt.assert_equal(admits, [False, False, True, False, False, True])
+
+    def test_moving_average(self):
+        stats = ExprStats()
+        stats.record(1.0, 100)
+        for _ in range(50):
+            stats.record(0.0, 100)
+        nt.assert_less(stats.exec_time, 1e-3)
+
+    def test_persist(self):
+        with tempfile.TemporaryDirectory() as path:
+            policy = AdmissionPolicy(path, min_samples=1)
+            policy.record('key', 0.5, 100)
+            policy.hit('key')
+            policy.close()
+            nt.assert_true(os.path.exists(policy.stats_path))
+
+            loaded = AdmissionPolicy(path, min_samples=1)
+            loaded.close()
+            stats = loaded.stats['key']
+            nt.assert_equal((stats.execs, stats.hits), (1, 1))
+            nt.assert_equal(stats.exec_time, 0.5)
+
+
+class TestManagerAdmission(TestCase):
+    def test_rejects_cheap(self):
+        policy = AdmissionPolicy(min_samples=2, min_time=1e-3)
+        manager = ComputationManager(admission=policy)
+        arrays = [np.arange(10) for _ in range(3)]
+
+        for arr in arrays:
+            entry = manager.get('arr + 1', {'arr': arr})
+            manager.execute(entry)
+
+        key = Expression('arr + 1').key
+        # learned it is cheap, value no longer kept
+        nt.assert_false(policy.worth_caching(policy.stats[key]))
+        # only the value from before it had enough samples
+        nt.assert_equal(len(manager.cache), 1)
+        nt.assert_not_in(entry.manifest, manager.cache)
+        nt.assert_false(manager.admits('arr + 1'))
+
+    def test_keeps_reused(self):
+        policy = AdmissionPolicy(min_samples=2, min_time=1e-3)
+        manager = ComputationManager(admission=policy)
+
+        for x in range(3):
+            for _ in range(2):
+                entry = manager.get('slow(x)', {'slow': slow, 'x': x})
+                manager.execute(entry)
+
+        key = Expression('slow(x)').key
+        stats = policy.stats[key]
+        nt.assert_equal((stats.execs, stats.hits), (3, 3))
+        nt.assert_true(manager.admits('slow(x)'))
+        nt.assert_equal(len(manager.cache), 3)
+
+    def test_would_be_hits(self):
+        """ Reuse of evicted values still counts """
+        policy = AdmissionPolicy(min_samples=1, min_time=1e-3)
+        manager = ComputationManager(admission=policy)
+
+        entry = manager.get('slow(x)', {'slow': slow, 'x': 1})
+        manager.execute(entry)
+        # never reused yet, evicted
+        nt.assert_equal(len(manager.cache), 0)
+
+        entry = manager.get('slow(x)', {'slow': slow, 'x': 1})
+        manager.execute(entry)
+        key = Expression('slow(x)').key
+        nt.assert_equal(policy.stats[key].hits, 1)
+        nt.assert_equal(len(manager.cache), 1)
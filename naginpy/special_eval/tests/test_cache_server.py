@@ -0,0 +1,142 @@
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+import nose.tools as nt
+
+from ..cache_server import LocalStore, CacheServer, CacheClient, SharedCache
+from ..exec_context import SourceObject
+
+SECRET = 'test-secret'
+
+from ..computation import ComputationManager
+from ..manifest import Manifest, _manifest
+
+
+class TestCacheServer(TestCase):
+    def setUp(self):
+        self.dirs = [tempfile.mkdtemp() for i in range(3)]
+        self.server = CacheServer(LocalStore(self.dirs[0]), chunk_size=7,
+                                  secret=SECRET)
+        self.server.start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.stop()
+        for d in self.dirs:
+            shutil.rmtree(d)
+
+    def shared(self, i, secret=SECRET):
+        # tiny chunks so blobs are streamed in many pieces
+        client = CacheClient(self.server.server_address, chunk_size=5,
+                             secret=secret)
+        self.clients.append(client)
+        return SharedCache(LocalStore(self.dirs[i]), client)
+
+    def test_share(self):
+        kernel1 = self.shared(1)
+        kernel2 = self.shared(2)
+
+        m = _manifest("np.arange(n)", {'np': np, 'n': 100})
+        m2 = _manifest("np.ones(n)", {'np': np, 'n': 100})
+        nt.assert_not_in(m, kernel2)
+
+        kernel1.put(m, np.arange(100))
+        kernel1.put(m2, {'some': 'value'})
+        nt.assert_in(m.hash_key, self.server.store)
+        nt.assert_in(m, kernel2)
+
+        # batch fetch
+        fetched = kernel2.fetch([m, m2])
+        nt.assert_equal(fetched, [m.hash_key, m2.hash_key])
+        np.testing.assert_array_equal(kernel2.get(m), np.arange(100))
+        nt.assert_equal(kernel2.get(m2), {'some': 'value'})
+
+        # already local, nothing transferred
+        nt.assert_equal(kernel2.fetch([m, m2]), [])
+
+        # missing keys are skipped
+        m3 = _manifest("np.zeros(n)", {'np': np, 'n': 100})
+        nt.assert_equal(kernel2.fetch([m3]), [])
+        with nt.assert_raises(KeyError):
+            kernel2.get(m3)
+
+    def test_stateful(self):
+        kernel1 = self.shared(1)
+        df = pd.DataFrame({'a': [1, 2]})
+        m = _manifest("df + 1", {'df': df})
+        nt.assert_not_in(m, kernel1)
+        with nt.assert_raises(ValueError):
+            kernel1.put(m, df + 1)
+
+    def test_secret(self):
+        with nt.assert_raises(ValueError):
+            CacheClient(self.server.server_address, secret='')
+
+        # wrong secret, the server hangs up
+        intruder = self.shared(1, secret='guess')
+        m = _manifest("np.arange(n)", {'np': np, 'n': 10})
+        with nt.assert_raises(ConnectionError):
+            intruder.put(m, np.arange(10))
+        nt.assert_not_in(m.hash_key, self.server.store)
+
+    def test_tampered_blob(self):
+        """ blobs that don't verify are never published """
+        kernel1 = self.shared(1)
+        m = _manifest("np.ones(n)", {'np': np, 'n': 10})
+        kernel1.put(m, {'some': 'value'})
+
+        # poison the server's copy
+        with open(self.server.store.blob_path(m.hash_key), 'ab') as f:
+            f.write(b'evil')
+        kernel2 = self.shared(2)
+        nt.assert_equal(kernel2.fetch([m]), [])
+        nt.assert_not_in(m.hash_key, kernel2.local)
+
+        # signed with another secret, the server refuses it
+        m2 = _manifest("np.zeros(n)", {'np': np, 'n': 10})
+        forged = SharedCache(LocalStore(self.dirs[2]), secret='other')
+        forged.put(m2, {'some': 'value'})
+        nt.assert_equal(kernel1.client.push([m2.hash_key], forged.local), [])
+        nt.assert_not_in(m2.hash_key, self.server.store)
+
+    def test_unkeyed_source(self):
+        """ sources keyed by id() are not shared """
+        kernel1 = self.shared(1)
+        m = _manifest("s + 1", {'s': SourceObject({'a': 1}, 'a')})
+        nt.assert_false(m.stateless)
+        with nt.assert_raises(ValueError):
+            kernel1.put(m, 2)
+
+    def test_pool(self):
+        kernel1 = self.shared(1)
+        client = kernel1.client
+        m = _manifest("np.arange(n)", {'np': np, 'n': 10})
+        kernel1.put(m, np.arange(10))
+        kernel1.fetch([m])
+        client.contains([m.hash_key])
+        # connections were reused
+        nt.assert_equal(len(client._pool), 1)
+
+    def test_computation_manager(self):
+        frame = pd.DataFrame(np.random.randn(20, 3), columns=['a', 'b', 'c'])
+        ns = {'pd': pd, 'n': 20}
+        source = "pd.DataFrame(n)"
+
+        cm1 = ComputationManager(shared=self.shared(1))
+        entry = cm1.get(source, ns)
+        with mock.patch.object(Manifest, 'eval', lambda self: frame):
+            cm1.execute(entry)
+
+        cm2 = ComputationManager(shared=self.shared(2))
+        entry2 = cm2.get(source, ns)
+        nt.assert_equal(cm2.prefetch([entry2]), [entry2.manifest.hash_key])
+        # served from the shared cache instead of executed
+        tm.assert_frame_equal(cm2.execute(entry2), frame)
+        nt.assert_true(entry2.executed)
+        nt.assert_is_none(entry2.exec_time)
@@ -1,7 +1,7 @@
 import ast
 from collections import OrderedDict
 from textwrap import dedent
-from unittest import TestCase
+from unittest import TestCase, mock
 
 import nose.tools as nt
 import pandas as pd
@@ -38,6 +38,26 @@ class TestComputationManager(TestCase):
         entry2 = cm.get(source, locals())
         nt.assert_is(entry, entry2)
 
+    def test_interned(self):
+        """ managers share one Manifest per key """
+        df = pd.DataFrame(np.random.randn(30, 3), columns=['a', 'bob', 'c'])
+        ns = {'df': df}
+        entry = ComputationManager().get("df.a + 1", ns)
+        entry2 = ComputationManager().get("df.a + 1", ns)
+        nt.assert_is_not(entry, entry2)
+        nt.assert_is(entry.manifest, entry2.manifest)
+        nt.assert_true(entry.manifest.interned)
+
+    def test_hit_no_hash_key(self):
+        """ lookups of existing entries don't compute hash_key """
+        from ..manifest import Manifest
+        cm = ComputationManager()
+        ns = {'n': 10}
+        entry = cm.get("n + 1", ns)
+        with mock.patch.object(Manifest, 'hash_key',
+                               property(lambda self: 1 / 0)):
+            nt.assert_is(cm.get("n + 1", ns), entry)
+
     def test_execute(self):
         cm = ComputationManager()
 
@@ -107,5 +127,55 @@ class TestComputationManager(TestCase):
         # TODO, so https://github.com/dalejung/naginpy/issues/2
         # having to mutate the manifest doesn't seem like a great idea.
         # need to re-think this api
-        entry.context.data.update(__defer_manager__=_contextify(ns['__defer_manager__']))
+        entry.context.data.update({k: _contextify(v)
+                                   for k, v in ns_update.items()})
         cm.execute(entry)
+
+    def test_getter_slot(self):
+        cm = ComputationManager()
+        df = pd.DataFrame(np.random.randn(30, 3), columns=['a', 'bob', 'c'])
+        ns = {'df': df, 'np': np}
+        entry = cm.get("np.log(df+10)", ns)
+        val = cm.execute(entry)
+
+        getter, ns_update = cm.generate_getter_node(entry)
+        # same slot is reused
+        getter2, ns_update2 = cm.generate_getter_node(entry)
+        nt.assert_equal(ns_update.keys(), ns_update2.keys())
+
+        ns.update(ns_update)
+        nt.assert_is(_eval(getter, ns), val)
+
+        # context changed, slot falls back to a full lookup
+        ns['df'] = df + 1
+        new_val = _eval(getter, ns)
+        nt.assert_is_not(new_val, val)
+        tm.assert_frame_equal(new_val, np.log(df + 11))
+
+        # a cache hit should not create any new entries
+        nt.assert_equal(len(cm.cache), 2)
+        nt.assert_is(_eval(getter, ns), new_val)
+        nt.assert_equal(len(cm.cache), 2)
+
+    def test_slot_hits(self):
+        """ repeated slot calls count as hits, the first one doesn't """
+        cm = ComputationManager()
+        ns = {'n': 10, 'np': np}
+        entry = cm.get("np.arange(n)", ns)
+        cm.execute(entry)
+        nt.assert_equal(entry.hits, 0)
+
+        getter, ns_update = cm.generate_getter_node(entry)
+        ns.update(ns_update)
+        # the get for this line already counted
+        _eval(getter, ns)
+        nt.assert_equal(entry.hits, 0)
+        # e.g. a loop body
+        _eval(getter, ns)
+        _eval(getter, ns)
+        nt.assert_equal(entry.hits, 2)
+
+        nt.assert_is(cm.get("np.arange(n)", ns), entry)
+        cm.generate_getter_node(entry)
+        _eval(getter, ns)
+        nt.assert_equal(entry.hits, 3)
@@ -1,9 +1,12 @@
 import ast
+import gc
+import weakref
 from collections import OrderedDict
 from textwrap import dedent
 
 import pandas as pd
 import numpy as np
+import pandas.util.testing as tm
 
 from asttools import ast_print, ast_source, replace_node, _eval
 
@@ -11,6 +14,7 @@ from ..special_eval import SpecialEval
 from ..engine import Engine, NormalEval
 from ..datacache import DataCacheEngine
 from ..computation import ComputationManager
+from ..purity import declare, get_traits, CHEAP, TRIVIAL
 
 
 class Dale(object):
@@ -29,12 +33,12 @@ class slow_func(object):
         self.count += 1
         return df
 
-def run_datacache(ns, global_ns, source):
+def run_datacache(ns, global_ns, source, **kwargs):
     source = dedent(source)
     ns = ns.copy()
     ns.update({k: v for k, v in global_ns.items() if k not in ns})
     dm = ComputationManager()
-    dc = DataCacheEngine(dm)
+    dc = DataCacheEngine(dm, **kwargs)
     ns['dm'] = dm
     ns['dc'] = dc
 
@@ -52,7 +56,8 @@ def test_hot_cache():
     res2 = df.rolling(5).sum() + some_func(df.bob) + 1
     """
 
-    ns = run_datacache(locals(), globals(), source)
+    # cache elementwise ops regardless of size
+    ns = run_datacache(locals(), globals(), source, min_size=0)
 
     assert id(ns['res']) == id(ns['res2'])
     assert some_func.count == 1
@@ -76,3 +81,132 @@ def test_changed_context():
 
     assert id(ns['res']) != id(ns['res2'])
     assert some_func.count == 2
+
+def test_cheap_nodes():
+    """
+    Elementwise ops on small inputs and trivial calls aren't worth a cache
+    lookup. The expensive parts are still cached.
+    """
+    df = pd.DataFrame(np.random.randn(30, 3), columns=['a', 'bob', 'c'])
+    some_func = slow_func()
+    source = """
+    res = df.rolling(5).sum() + some_func(df.bob) + 1
+    res2 = df.rolling(5).sum() + some_func(df.bob) + 1
+    """
+
+    ns = run_datacache(locals(), globals(), source)
+
+    assert some_func.count == 1
+    tm.assert_frame_equal(ns['res'], ns['res2'])
+    assert id(ns['res']) != id(ns['res2'])
+
+    sources = [entry.expression.get_source()
+               for entry in ns['dm'].cache.values()]
+    assert 'some_func(df.bob)' in sources
+    # df.rolling is TRIVIAL
+    assert 'df.rolling(5)' not in sources
+    assert not any(source.endswith('+ 1') for source in sources)
+
+def test_impure():
+    @declare(pure=False)
+    def counter():
+        counter.count += 1
+        return counter.count
+    counter.count = 0
+
+    arr = np.arange(10)
+    source = """
+    a = counter() + arr.sum()
+    b = counter() + arr.sum()
+    c = np.random.randn(3)
+    d = np.random.randn(3)
+    """
+
+    ns = run_datacache(locals(), globals(), source, min_size=0)
+
+    assert ns['a'] == 46
+    assert ns['b'] == 47
+    assert not np.array_equal(ns['c'], ns['d'])
+    # only the pure part
+    sources = [entry.expression.get_source()
+               for entry in ns['dm'].cache.values()]
+    assert sources == ['arr.sum()']
+
+def test_inplace_invalidates():
+    df = pd.DataFrame({'a': np.arange(5.)})
+    some_func = slow_func()
+    source = """
+    res = some_func(df).a.sum()
+    df.insert(0, 'b', 1)
+    res2 = some_func(df).b.sum()
+    """
+
+    ns = run_datacache(locals(), globals(), source)
+
+    assert ns['res2'] == 5
+    assert some_func.count == 2
+
+def test_traits():
+    df = pd.DataFrame({'a': [1, 2]})
+    assert get_traits(df.head).cost == TRIVIAL
+    assert get_traits(np.exp).cost == CHEAP
+    assert not get_traits(df.to_csv).pure
+    assert get_traits(df.insert).inplace
+    assert not get_traits(np.random.randn).pure
+    assert not get_traits(print).pure
+
+def test_builtin_methods():
+    """ `list` being a cheap call doesn't make its methods pure """
+    for method in ([].append, {}.update, set().add):
+        traits = get_traits(method)
+        assert traits.inplace
+        assert not traits.cacheable
+    assert get_traits(list).cacheable
+
+    out = []
+    x = 4
+    source = """
+    out.append(x.bit_length())
+    out.append(x.bit_length())
+    """
+
+    run_datacache(locals(), globals(), source, min_size=0)
+
+    assert out == [3, 3]
+
+def test_slot_names_removed():
+    """ cache slots only live in ns for their line """
+    df = pd.DataFrame(np.random.randn(30, 3), columns=['a', 'bob', 'c'])
+    source = """
+    res = df.rolling(5).sum() + 1
+    """
+
+    ns = run_datacache(locals(), globals(), source, min_size=0)
+
+    dm = ns['dm']
+    assert dm.cache
+    assert not [k for k in ns if k.startswith('__cache_slot_')]
+
+    # nothing else holds an invalidated value
+    entry, = [entry for entry in dm.cache.values()
+              if entry.expression.get_source() == 'df.rolling(5).sum()']
+    ref = weakref.ref(entry.value)
+    dm.invalidate(df)
+    del entry
+    gc.collect()
+    assert ref() is None
+
+def test_deferred_scopes():
+    """ code that runs later or repeatedly isn't swapped for slots """
+    df = pd.DataFrame(np.random.randn(30, 3), columns=['a', 'bob', 'c'])
+    source = """
+    def f():
+        return np.log(df + 10)
+    res = [np.log(df + 10) for i in range(2)]
+    """
+
+    ns = run_datacache(locals(), globals(), source, min_size=0)
+
+    tm.assert_frame_equal(ns['f'](), np.log(df + 10))
+    tm.assert_frame_equal(ns['res'][1], np.log(df + 10))
+    assert not ns['dm'].cache
@@ -12,6 +12,7 @@ from ..exec_context import (
     ScalarObject,
     ExecutionContext,
     _obj,
+    _is_scalar,
     get_source_key
 )
 
@@ -27,6 +28,16 @@ class TestContextObject(TestCase):
         assert co.get_obj() is obj
 
 
+    def test_is_scalar(self):
+        """ _is_scalar should agree with np.isscalar """
+        from fractions import Fraction
+        values = [1, 1.5, 1j, True, 'str', b'bytes', Fraction(1, 3),
+                  np.float64(1), np.int8(3), np.bool_(True), None, [1],
+                  (1,), np.arange(3), np.array(1), object()]
+        for val in values:
+            nt.assert_equal(_is_scalar(val), np.isscalar(val))
+
+
 class TestSourceObject(TestCase):
     def test_source_context(self):
         """
@@ -86,6 +97,12 @@ class TestSourceObject(TestCase):
 
         so = SourceObject(source, 'test')
         assert so.key == 'sk_attr::test'
+        nt.assert_true(so.stateless)
+
+        # keyed by id(), only means something in this process
+        so = SourceObject(source_dict, 'test')
+        nt.assert_false(so.stateless)
+        nt.assert_true(SourceObject(source_dict, 'test', 'named').stateless)
 
 
 class TestExecutionContext(TestCase):
@@ -0,0 +1,151 @@
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+import nose.tools as nt
+
+from ..computation import ComputationManager
+from ..formula import (
+    DesignBuilder,
+    FORMULA_NS,
+    formula_transform,
+    lm,
+    parse_formula,
+)
+
+
+class TestFormulaTransform(TestCase):
+    def test_transform(self):
+        source = "fit = lm(np.log(y) ~ x1 + x2 * g, data=df)"
+        new_source = formula_transform(source)
+        nt.assert_equal(new_source, "fit = lm(__formula__("
+                        "'np.log(y) ~ x1 + x2 * g'), data=df)")
+
+    def test_unary_invert(self):
+        source = "a = ~mask; b = x & ~y"
+        nt.assert_equal(formula_transform(source), source)
+
+    def test_pipe(self):
+        source = "df %>% lm(y ~ x + a:b) %>% f"
+        new_source = formula_transform(source)
+        nt.assert_equal(new_source,
+                        "df %>% lm(__formula__('y ~ x + a:b')) %>% f")
+
+
+class TestParseFormula(TestCase):
+    def test_terms(self):
+        spec = parse_formula('y ~ x1 + x2 * g')
+        nt.assert_equal(spec.lhs, 'y')
+        nt.assert_equal(spec.terms, (('x1',), ('x2',), ('g',), ('x2', 'g')))
+        nt.assert_true(spec.intercept)
+
+        spec = parse_formula('y ~ (a + b + c)^2 - 1')
+        nt.assert_equal(spec.terms, (('a',), ('b',), ('c',), ('a', 'b'),
+                                     ('a', 'c'), ('b', 'c')))
+        nt.assert_false(spec.intercept)
+
+        spec = parse_formula('y ~ 0 + a:b + I(x ** 2)')
+        nt.assert_equal(spec.terms, (('a', 'b'), ('I(x ** 2)',)))
+        nt.assert_false(spec.intercept)
+
+    def test_parse_once(self):
+        nt.assert_is(parse_formula('y ~ x'), parse_formula('y ~ x'))
+
+    def test_dot(self):
+        spec = parse_formula('y ~ .')
+        nt.assert_equal(spec.expand_dot(['y', 'a', 'b']), (('a',), ('b',)))
+
+
+class TestDesignBuilder(TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'y': np.arange(6.),
+            'x1': np.arange(6.) ** 2,
+            'x2': np.arange(6.) % 2,
+            'g': list('aabbcc'),
+        })
+
+    def test_build(self):
+        df = self.df
+        y, X = DesignBuilder().build('y ~ x1 + x2 * g', df)
+        tm.assert_series_equal(y, df.y)
+        nt.assert_equal(list(X.columns), ['Intercept', 'x1', 'x2', 'g[b]',
+                                          'g[c]', 'x2:g[b]', 'x2:g[c]'])
+        np.testing.assert_array_equal(X['x2:g[b]'],
+                                      df.x2 * (df.g == 'b'))
+
+        y, X = DesignBuilder().build('y ~ 0 + g', df)
+        # no intercept, every level
+        nt.assert_equal(list(X.columns), ['g[a]', 'g[b]', 'g[c]'])
+
+    def test_env(self):
+        df = self.df
+        scale = 10
+        ns = dict(FORMULA_NS, np=np, df=df, scale=scale)
+        exec(formula_transform("f = y ~ np.log1p(x1) + I(x1 * scale)"), ns)
+        y, X = DesignBuilder().build(ns['f'], df)
+        np.testing.assert_array_equal(X['np.log1p(x1)'], np.log1p(df.x1))
+        np.testing.assert_array_equal(X['I(x1 * scale)'], df.x1 * 10)
+
+    def test_shared_terms(self):
+        """ Models with common terms reuse the cached columns """
+        df = self.df
+        manager = ComputationManager()
+        builder = DesignBuilder(manager)
+
+        builder.build('y ~ x1 + g', df)
+        count = len(manager.cache)
+        X1 = builder.build('y ~ x1 + g', df)[1]
+        # same formula is one lookup
+        nt.assert_equal(len(manager.cache), count)
+
+        X2 = builder.build('y ~ x1 + g + x2', df)[1]
+        # only x2, its term and the new matrix
+        nt.assert_equal(len(manager.cache), count + 3)
+        tm.assert_frame_equal(X2[X1.columns], X1)
+
+        hits = {entry.expression.get_source(): entry.hits
+                for entry in manager.cache.values()}
+        term = [source for source in hits
+                if "term_block" in source and "('g',)" in source][0]
+        nt.assert_equal(hits[term], 1)
+
+    def test_data_manifest(self):
+        """ Data computed by the manager is keyed by its Manifest """
+        df = self.df
+        manager = ComputationManager()
+        builder = DesignBuilder(manager)
+
+        entry = manager.get('df[df.x1 > 0]', {'df': df})
+        data = manager.execute(entry)
+        y, X = builder.build('y ~ x1', data)
+        matrix = [e for e in manager.cache.values()
+                  if 'design_matrix' in e.expression.get_source()][0]
+        nt.assert_is(matrix.context['__data__'], entry.manifest)
+        nt.assert_equal(len(X), 5)
+
+    def test_mutated(self):
+        df = self.df.copy()
+        fit = lm('y ~ x1', df)
+        df['x1'] = df['x1'] * 100
+        # not cached without a builder
+        refit = lm('y ~ x1', df)
+        np.testing.assert_allclose(refit.coef['x1'], fit.coef['x1'] / 100)
+
+        builder = DesignBuilder()
+        X = builder.build('y ~ x1', df)[1]
+        count = len(builder.manager.cache)
+        df['x1'] = df['x1'] / 100
+        nt.assert_true(builder.invalidate(df))
+        X2 = builder.build('y ~ x1', df)[1]
+        np.testing.assert_allclose(X2['x1'], X['x1'] / 100)
+        # rebuilt, not added to the stale entries
+        nt.assert_equal(len(builder.manager.cache), count)
+
+    def test_lm(self):
+        df = self.df
+        df = df.assign(y=3 + 2 * df.x1 - df.x2)
+        fit = lm('y ~ x1 + x2', df, builder=DesignBuilder())
+        np.testing.assert_allclose(fit.coef.values, [3, 2, -1], atol=1e-8)
+        np.testing.assert_allclose(fit.residuals, 0, atol=1e-8)
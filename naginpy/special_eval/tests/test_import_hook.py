@@ -0,0 +1,157 @@
+import ast
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+from textwrap import dedent
+from unittest import TestCase
+
+import nose.tools as nt
+
+from ..engine import Engine
+from ..import_hook import install, uninstall, cache_path, future_flags
+
+
+class MagicEngine(Engine):
+    """
+    Static engine that replaces the name MAGIC with 42.
+    """
+    static = True
+    version = '1'
+
+    def __init__(self):
+        self.count = 0
+
+    def should_handle_line(self, line, load_names):
+        return bool(load_names)
+
+    def should_handle_node(self, node, context):
+        return isinstance(node, ast.Name) and node.id == 'MAGIC'
+
+    def handle_node(self, node, context):
+        self.count += 1
+        return ast.copy_location(ast.Num(n=42), node)
+
+
+class RuntimeEngine(MagicEngine):
+    static = False
+
+
+class TestImportHook(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        pkg = os.path.join(self.dir, 'hooked_pkg')
+        os.mkdir(pkg)
+        with open(os.path.join(pkg, '__init__.py'), 'w') as f:
+            f.write('')
+        self.mod_path = os.path.join(pkg, 'mod.py')
+        with open(self.mod_path, 'w') as f:
+            f.write(dedent("""
+            value = MAGIC + 1
+            other = [MAGIC] * 2
+            """))
+        sys.path.insert(0, self.dir)
+        self.finder = None
+        self.dont_write_bytecode = sys.dont_write_bytecode
+        sys.dont_write_bytecode = False
+
+    def tearDown(self):
+        sys.dont_write_bytecode = self.dont_write_bytecode
+        if self.finder:
+            uninstall(self.finder)
+        sys.path.remove(self.dir)
+        for name in ['hooked_pkg', 'hooked_pkg.mod']:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.dir)
+
+    def _import(self):
+        sys.modules.pop('hooked_pkg.mod', None)
+        importlib.invalidate_caches()
+        return importlib.import_module('hooked_pkg.mod')
+
+    def test_static_cache(self):
+        engine = MagicEngine()
+        self.finder = install([engine], modules=['hooked_pkg'])
+
+        mod = self._import()
+        nt.assert_equal(mod.value, 43)
+        nt.assert_equal(mod.other, [42, 42])
+        nt.assert_equal(engine.count, 2)
+        nt.assert_true(os.path.exists(cache_path(self.mod_path, [engine])))
+
+        # second import is served from cache, no transformation
+        mod = self._import()
+        nt.assert_equal(mod.value, 43)
+        nt.assert_equal(engine.count, 2)
+
+        # bumping the engine version invalidates
+        engine.version = '2'
+        mod = self._import()
+        nt.assert_equal(mod.value, 43)
+        nt.assert_equal(engine.count, 4)
+
+    def test_runtime_engines(self):
+        """ non static engines run line by line and are not cached """
+        engine = RuntimeEngine()
+        self.finder = install([engine], modules=['hooked_pkg'])
+
+        mod = self._import()
+        nt.assert_equal(mod.value, 43)
+        mod = self._import()
+        nt.assert_equal(engine.count, 4)
+        nt.assert_false(os.path.exists(cache_path(self.mod_path, [engine])))
+
+    def test_cache_suffix(self):
+        """ cache file is not a .pyc, the bytecode loader must ignore it """
+        path = cache_path(self.mod_path, [MagicEngine()])
+        nt.assert_false(path.endswith('.pyc'))
+        nt.assert_equal(os.path.basename(os.path.dirname(path)),
+                        '__pycache__')
+
+    def test_runtime_filename(self):
+        """ runtime path compiles with the module file and its futures """
+        with open(self.mod_path, 'w') as f:
+            f.write(dedent('''
+            """ docstring """
+            from __future__ import annotations
+
+            def func(x: Undefined) -> Undefined:
+                return MAGIC
+
+            value = func(1)
+            annotations = func.__annotations__
+
+            def fail():
+                raise ValueError()
+            '''))
+
+        engine = RuntimeEngine()
+        self.finder = install([engine], modules=['hooked_pkg'])
+
+        mod = self._import()
+        nt.assert_equal(mod.value, 42)
+        nt.assert_equal(mod.annotations['x'], 'Undefined')
+        nt.assert_equal(mod.fail.__code__.co_filename, self.mod_path)
+
+    def test_future_flags(self):
+        import __future__
+        tree = ast.parse(dedent("""
+        " doc "
+        from __future__ import annotations, division
+        from __future__ import generator_stop
+        import os
+        from __future__ import nested_scopes
+        """))
+        expected = __future__.annotations.compiler_flag \
+            | __future__.division.compiler_flag \
+            | __future__.generator_stop.compiler_flag
+        nt.assert_equal(future_flags(tree), expected)
+        nt.assert_equal(future_flags(ast.parse("x = 1")), 0)
+
+    def test_unhandled_modules(self):
+        engine = MagicEngine()
+        self.finder = install([engine], modules=['other_pkg'])
+
+        with nt.assert_raises(NameError):
+            self._import()
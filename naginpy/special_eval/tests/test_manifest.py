@@ -1,5 +1,5 @@
 import ast
-from unittest import TestCase
+from unittest import TestCase, mock
 from textwrap import dedent
 
 import pandas as pd
@@ -14,7 +14,9 @@ from asttools import (
 from ..manifest import (
     Expression,
     Manifest,
-    _manifest
+    _manifest,
+    intern_expression,
+    intern_manifest
 )
 
 from ..exec_context import (
@@ -106,12 +108,9 @@ class TestExpression(TestCase):
         expr1 = Expression(code.body[0])
         expr2 = Expression(code.body[1])
 
-        import binascii
-        # changed key to return str, same hash just different rep
-        correct1 = b'}\xff\x1c\x0er\xe8k3\x84\x96R\x98\x9a\xa4\xe0i'
-        correct1 = binascii.b2a_hex(correct1).decode('utf-8')
-        correct2 = b'\xd6\x88\x08\xa2\xd0\x01\xa4\xc6\xabb\x1aTj\xce\x98\x18'
-        correct2 = binascii.b2a_hex(correct2).decode('utf-8')
+        # keys are versioned. v1 is a 128 bit xxh3 of the source
+        correct1 = 'v1-baca0bcc5685c857bfc54349e5027e9a'
+        correct2 = 'v1-7d64817fa25674ee676dddaa1c6a9a5b'
         # keys are stable and should not change between lifecycles
         nt.assert_equal(expr1.key, correct1)
         nt.assert_equal(expr2.key, correct2)
@@ -247,6 +246,25 @@ class TestManifest(TestCase):
         assert_almost_equal(correct, manifest.eval())
         nt.assert_equal(len(aranger.cache), 2)
 
+    def test_hash_key(self):
+        source = "d * string_test"
+        context = {
+            'd': 13,
+            'string_test': 'string_test'
+        }
+
+        manifest = Manifest(Expression(source), ExecutionContext(context))
+        manifest2 = Manifest(Expression(source), ExecutionContext(context))
+        nt.assert_equal(manifest.hash_key, manifest2.hash_key)
+        nt.assert_true(manifest.hash_key.startswith('v1-'))
+
+        context = {
+            'd': 12,
+            'string_test': 'string_test'
+        }
+        manifest3 = Manifest(Expression(source), ExecutionContext(context))
+        nt.assert_not_equal(manifest.hash_key, manifest3.hash_key)
+
     def test_hashable(self):
         source = "d * string_test"
 
@@ -527,3 +545,103 @@ def test_expanded_multi_nested_partial():
     nt.assert_equal(expanded.expression.get_source(),
                     "(e + (a + (x + (test1 + test2))))")
     nt.assert_equal(expanded.eval(), 6)
+
+def test_expand_shared_dag():
+    """ shared sub Manifests are expanded once and spliced by reference """
+    m = _manifest("(x + 1)", {'x': 1})
+    levels = [m]
+    for i in range(40):
+        m = _manifest("(a + b)", {'a': m, 'b': m})
+        levels.append(m)
+
+    memo = {}
+    expanded = m.expand(memo)
+    # one entry per unique Manifest, not per path
+    nt.assert_equal(len(memo), len(levels))
+    body = expanded.expression.code.body
+    nt.assert_is(body.left, body.right)
+    nt.assert_count_equal(expanded.context.keys(), ['x'])
+
+    small = levels[4].expand()
+    nt.assert_equal(small.eval(), 2 ** 4 * 2)
+    # expansion does not touch the original
+    nt.assert_equal(levels[4].expression.get_source(), "(a + b)")
+
+class TestInterning(TestCase):
+    def test_intern_manifest(self):
+        df = pd.DataFrame({'a': range(5)})
+        m1 = intern_manifest(_manifest("df.a + x", {'df': df, 'x': 1}))
+        m2 = intern_manifest(_manifest("df.a + x", {'df': df, 'x': 1}))
+        nt.assert_is(m1, m2)
+        nt.assert_is(intern_manifest(m1), m1)
+        nt.assert_true(m1.interned)
+
+        m3 = intern_manifest(_manifest("df.a + x", {'df': df, 'x': 2}))
+        nt.assert_is_not(m1, m3)
+        nt.assert_not_equal(m1, m3)
+        # shared parts
+        nt.assert_is(m1.expression, m3.expression)
+        m4 = intern_manifest(_manifest("df.a * x", {'df': df, 'x': 1}))
+        nt.assert_is(m1.context, m4.context)
+
+    def test_immutable(self):
+        expr = Expression("a + b", mutable=True)
+        interned = intern_expression(expr)
+        nt.assert_is_not(interned, expr)
+        nt.assert_false(interned.mutable)
+        nt.assert_is(intern_expression(Expression("a + b")), interned)
+
+        # immutable ones are shared as is, nothing is set on them
+        expr = Expression("c + d")
+        nt.assert_is(intern_expression(expr), expr)
+        m = _manifest("c + d", {'c': object(), 'd': object()})
+        interned = intern_manifest(m)
+        nt.assert_is_not(interned, m)
+        nt.assert_true(interned.interned)
+        nt.assert_false(m.interned)
+        nt.assert_is(interned.context, m.context)
+
+        m = _manifest("a + b", {'a': 1, 'b': 2}).copy(mutable=True)
+        interned = intern_manifest(m)
+        nt.assert_false(interned.context.mutable)
+        nt.assert_false(interned.expression.mutable)
+        nt.assert_equal(interned, m)
+
+    def test_nested(self):
+        sub1 = _manifest("a + 1", {'a': 1})
+        sub2 = _manifest("a + 1", {'a': 1})
+        p1 = intern_manifest(_manifest("x * 2", {'x': sub1}))
+        p2 = intern_manifest(_manifest("y * 2", {'y': sub2}))
+        nt.assert_is(p1.context['x'], p2.context['y'])
+        nt.assert_is(p1.context['x'], intern_manifest(sub2))
+
+    def test_hash_collision(self):
+        """ equal hash() alone doesn't make objects shared """
+        from .. import manifest as manifest_mod
+        m1 = intern_manifest(_manifest("qq_a + 1", {'qq_a': 1}))
+        other = _manifest("qq_a + 2", {'qq_a': 2})
+        # pretend every table has a hash() collision
+        tables = {
+            '_MANIFESTS': {hash(other): m1},
+            '_EXPRESSIONS': {hash(other.expression): m1.expression},
+            '_CONTEXTS': {hash(other.context): m1.context},
+        }
+        with mock.patch.multiple(manifest_mod, **tables):
+            m2 = intern_manifest(other)
+        nt.assert_is_not(m2, m1)
+        nt.assert_true(m2.interned)
+        nt.assert_not_equal(m2, m1)
+        nt.assert_is_not(m2.expression, m1.expression)
+        nt.assert_is_not(m2.context, m1.context)
+        nt.assert_equal(m2.hash_key, other.hash_key)
+        nt.assert_equal(m2.eval(), 4)
+
+    def test_weak(self):
+        import gc
+        from .. import manifest as manifest_mod
+        m = intern_manifest(_manifest("zzz_unique + 1", {'zzz_unique': 3}))
+        key = hash(m)
+        nt.assert_in(key, manifest_mod._MANIFESTS)
+        del m
+        gc.collect()
+        nt.assert_not_in(key, manifest_mod._MANIFESTS)
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import nose.tools as nt
+
+from ..computation import ComputationManager
+from ..exec_context import SourceObject
+from ..manifest import _manifest
+from ..manifest_log import ManifestLog, replay, EXEC
+
+
+class DictSource(object):
+    source_key = 'DictSource'
+
+    def __init__(self, data):
+        self.data = data
+
+    def get(self, key):
+        return self.data[key]
+
+
+class TestManifestLog(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = ManifestLog(self.dir, flush_interval=0.01)
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.dir)
+
+    def test_record(self):
+        cm = ComputationManager(log=self.log)
+        df = pd.DataFrame({'a': np.arange(10)})
+        e1 = cm.get("np.arange(n) * 2", {'np': np, 'n': 100})
+        e2 = cm.get("df.a + n", {'df': df, 'n': 1})
+        cm.execute(e1)
+        cm.execute(e2)
+        cm.execute(e1, override=True)
+        self.log.flush()
+
+        records = list(self.log.records())
+        nt.assert_equal(len(records), 3)
+
+        r1, r2, r3 = records
+        nt.assert_equal(r1.key, e1.manifest.hash_key)
+        nt.assert_equal(r1.kind, EXEC)
+        nt.assert_equal(r1.source, "(np.arange(n) * 2)")
+        nt.assert_equal(r1.result_size, 800)
+        # last execution
+        nt.assert_almost_equal(r3.exec_time, e1.exec_time)
+        nt.assert_true(r1.stateless)
+        nt.assert_false(r2.stateless)
+
+        nt.assert_equal(self.log.lookup(e1.manifest.hash_key), [r1, r3])
+        nt.assert_equal(self.log.lookup(e2.manifest.hash_key), [r2])
+        nt.assert_in(e2.manifest.hash_key, self.log)
+
+        # stateless can be rebuilt, stateful can't
+        m = replay(r1)
+        np.testing.assert_array_equal(m.eval(), np.arange(100) * 2)
+        with nt.assert_raises(ValueError):
+            replay(r2)
+
+    def test_source_replay(self):
+        source = DictSource({'prices': np.arange(5)})
+        so = SourceObject(source, 'prices')
+        cm = ComputationManager(log=self.log)
+        entry = cm.get("prices + 1", {'prices': so})
+        cm.execute(entry)
+        self.log.flush()
+
+        record, = self.log.lookup(entry.manifest.hash_key)
+        with nt.assert_raises(ValueError):
+            replay(record)
+        m = replay(record, sources={'DictSource': source})
+        np.testing.assert_array_equal(m.eval(), np.arange(5) + 1)
+
+    def test_unmarshalable_scalar(self):
+        """ scalars marshal can't handle don't kill the writer """
+        from fractions import Fraction
+        cm = ComputationManager(log=self.log)
+        e1 = cm.get("x * 2", {'x': Fraction(1, 3)})
+        e2 = cm.get("d", {'d': np.datetime64('2016-01-01')})
+        for entry in (e1, e2):
+            cm.execute(entry)
+        self.log.flush()
+        cm.execute(cm.get("n + 1", {'n': 1}))
+        self.log.flush()
+
+        nt.assert_true(self.log._thread.is_alive())
+        records = list(self.log.records())
+        nt.assert_equal(len(records), 3)
+        name, kind, key, value = records[0].context[0]
+        nt.assert_equal(value, repr(Fraction(1, 3)))
+        with nt.assert_raises(ValueError):
+            replay(records[0])
+
+    def test_encode_error(self):
+        """ a record that fails to encode is dropped, the rest written """
+        cm = ComputationManager(log=self.log)
+        entry = cm.get("n + 1", {'n': 1})
+        cm.execute(entry)
+        self.log.queue.put((EXEC, 'bad time', entry.manifest, None, 0))
+        cm.execute(entry, override=True)
+        self.log.flush()
+
+        nt.assert_true(self.log._thread.is_alive())
+        nt.assert_equal(self.log.dropped, 1)
+        nt.assert_equal(len(list(self.log.records())), 2)
+
+    def test_reopen(self):
+        """ index catches up with the log and torn writes are dropped """
+        cm = ComputationManager(log=self.log)
+        entries = [cm.get("np.arange(n)", {'np': np, 'n': i})
+                   for i in range(5)]
+        for entry in entries:
+            cm.execute(entry)
+        self.log.close()
+
+        # lose part of the index and tear the last record
+        index_path = os.path.join(self.dir, 'manifests.idx')
+        log_path = os.path.join(self.dir, 'manifests.log')
+        with open(index_path, 'r+b') as f:
+            f.truncate(24 * 2 + 5)
+        with open(log_path, 'r+b') as f:
+            f.truncate(os.path.getsize(log_path) - 3)
+
+        self.log = ManifestLog(self.dir)
+        nt.assert_equal(len(list(self.log.records())), 4)
+        for entry in entries[:4]:
+            nt.assert_equal(len(self.log.lookup(entry.manifest.hash_key)), 1)
+        nt.assert_equal(self.log.lookup(entries[4].manifest.hash_key), [])
+
+        # appends go after the last good record
+        cm = ComputationManager(log=self.log)
+        cm.execute(cm.get("np.arange(n)", {'np': np, 'n': 4}))
+        self.log.flush()
+        nt.assert_equal(len(self.log.lookup(entries[4].manifest.hash_key)), 1)
+        nt.assert_equal(len(list(self.log.records())), 5)
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+import nose.tools as nt
+
+from ..mmap_store import dump, load, supported, MMapStore
+
+
+class TestMMapFormat(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'value.ngbuf')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def roundtrip(self, value):
+        dump(value, self.path)
+        return load(self.path)
+
+    def test_ndarray(self):
+        arr = np.random.randn(100, 3)
+        test = self.roundtrip(arr)
+        np.testing.assert_array_equal(arr, test)
+        # read-only view into the map
+        nt.assert_false(test.flags.writeable)
+        with nt.assert_raises(ValueError):
+            test[0, 0] = 1
+
+        # not c contiguous
+        test = self.roundtrip(arr.T)
+        np.testing.assert_array_equal(arr.T, test)
+
+        with nt.assert_raises(TypeError):
+            dump(np.array(['a', object()]), self.path)
+
+    def test_frame_zero_copy(self):
+        df = pd.DataFrame(np.random.randn(100, 3), columns=['a', 'b', 'c'])
+        test = self.roundtrip(df)
+        tm.assert_frame_equal(df, test)
+        nt.assert_false(test['a'].values.flags.writeable)
+        nt.assert_false(test.values.flags.owndata)
+
+    def test_mixed_frame(self):
+        index = pd.date_range('2015-01-01', periods=50, name='date')
+        df = pd.DataFrame({
+            'a': np.random.randn(50),
+            'b': np.arange(50),
+            'c': np.random.randn(50),
+            'name': ['x'] * 50,
+            'd': index,
+            'tz': pd.date_range('2015', periods=50, tz='US/Eastern'),
+            'cat': pd.Categorical(['a', 'b'] * 25),
+        }, index=index)
+        test = self.roundtrip(df)
+        tm.assert_frame_equal(df, test)
+        # non adjacent float columns still share one mapped block
+        nt.assert_false(test['a'].values.flags.writeable)
+        nt.assert_false(test['b'].values.flags.writeable)
+        nt.assert_false(test['c'].values.flags.writeable)
+
+        empty = pd.DataFrame(index=index)
+        tm.assert_frame_equal(empty, self.roundtrip(empty))
+
+    def test_series(self):
+        s = pd.Series(np.random.randn(10), index=list('abcdefghij'),
+                      name='bob')
+        test = self.roundtrip(s)
+        tm.assert_series_equal(s, test)
+        nt.assert_false(test.values.flags.writeable)
+
+        # tz aware values are kept intact
+        s = pd.Series(pd.date_range('2015', periods=5, tz='US/Eastern'))
+        tm.assert_series_equal(s, self.roundtrip(s))
+
+    def test_supported(self):
+        nt.assert_true(supported(np.arange(10)))
+        nt.assert_true(supported(pd.DataFrame()))
+        nt.assert_false(supported([1, 2]))
+        nt.assert_false(supported(np.array([object()])))
+
+
+class TestMMapStore(TestCase):
+    def test_store(self):
+        path = tempfile.mkdtemp()
+        try:
+            store = MMapStore(path)
+            arr = np.arange(10)
+            store.put('v1-abc', arr)
+            nt.assert_in('v1-abc', store)
+            nt.assert_not_in('v1-xyz', store)
+            np.testing.assert_array_equal(store.get('v1-abc'), arr)
+            nt.assert_equal(list(store.keys()), ['v1-abc'])
+            with nt.assert_raises(KeyError):
+                store.get('v1-xyz')
+        finally:
+            shutil.rmtree(path)
@@ -0,0 +1,187 @@
+import ast
+from textwrap import dedent
+from unittest import TestCase
+
+import nose.tools as nt
+from asttools import ast_source
+
+from ..special_eval import SpecialEval
+from ..engine import Engine, NormalEval
+from ..node_context import NodeContextManager, _missing, deferred_nodes
+
+
+class Counter(object):
+    """ Keeps track of how many times its attributes and items are used """
+    def __init__(self):
+        self.access_count = 0
+        self.call_count = 0
+        self.data = [10, 20, 30]
+
+    @property
+    def value(self):
+        self.access_count += 1
+        return self
+
+    def __getitem__(self, key):
+        self.access_count += 1
+        return self.data[key]
+
+    def __call__(self, *args, **kwargs):
+        self.call_count += 1
+        return sum(args) + sum(kwargs.values())
+
+
+class Holder(object):
+    def __init__(self, s):
+        self.s = s
+
+
+class GreedyEngine(Engine):
+    """ Asks for the object of every node it can walk up to """
+    def __init__(self):
+        self.objects = []
+
+    def should_handle_line(self, line, load_names):
+        return True
+
+    def should_handle_node(self, node, context):
+        return not isinstance(node, ast.stmt)
+
+    def handle_node(self, node, context):
+        self.objects.append(context.obj())
+        # ask again, should be served from memo
+        context.obj()
+        return node
+
+
+def run_engines(ns, source, engines):
+    source = dedent(source)
+    se = SpecialEval(source, ns=ns, engines=engines)
+    se.process()
+    return ns
+
+
+class TestNodeContextManager(TestCase):
+    def test_single_access(self):
+        """
+        Attribute and Subscript nodes should only be evaluated once, even
+        though both the engine and the final exec need the value.
+        """
+        counter = Counter()
+        ns = {'counter': counter}
+        source = """
+        res = counter.value.value[1]
+        """
+        engine = GreedyEngine()
+        run_engines(ns, source, [engine, NormalEval()])
+
+        nt.assert_equal(ns['res'], 20)
+        # two .value and one __getitem__
+        nt.assert_equal(counter.access_count, 3)
+        nt.assert_in(20, engine.objects)
+
+    def test_call_resolution(self):
+        counter = Counter()
+        ns = {'counter': counter, 'x': 1}
+        source = """
+        res = counter(x, 2, *[3], y=4, **{'z': 5}) + 1
+        """
+        engine = GreedyEngine()
+        run_engines(ns, source, [engine, NormalEval()])
+
+        nt.assert_equal(ns['res'], 16)
+        nt.assert_equal(counter.call_count, 1)
+        nt.assert_in(15, engine.objects)
+
+    def test_builtins(self):
+        """ builtins inside a resolved call are found """
+        counter = Counter()
+        ns = {'counter': counter}
+        source = """
+        res = counter(len(counter.data))
+        """
+        engine = GreedyEngine()
+        run_engines(ns, source, [engine, NormalEval()])
+
+        nt.assert_equal(ns['res'], 3)
+        nt.assert_equal(counter.call_count, 1)
+        nt.assert_in(len, engine.objects)
+
+    def test_missing_arg(self):
+        """ a missing argument stops resolution, the call isn't made """
+        class Lenient(GreedyEngine):
+            _allow_missing = True
+
+        counter = Counter()
+        mgr = NodeContextManager({'counter': counter})
+        mgr.engine = Lenient()
+        for source in ("counter(y)", "counter(*y)", "counter(a=y)",
+                       "counter.data[y:]"):
+            node = ast.parse(source, mode='eval').body
+            nt.assert_is(mgr.obj(node), _missing)
+        nt.assert_equal(counter.call_count, 0)
+
+    def test_slice_resolution(self):
+        counter = Counter()
+        ns = {'counter': counter, 'start': 1}
+        source = """
+        res = counter.value[start:]
+        """
+        run_engines(ns, source, [GreedyEngine(), NormalEval()])
+
+        nt.assert_equal(ns['res'], [20, 30])
+        nt.assert_equal(counter.access_count, 2)
+
+    def test_getters_cleaned_up(self):
+        """ getter vars used for the final exec should not leak into ns """
+        counter = Counter()
+        ns = {'counter': counter}
+        source = """
+        res = counter.value
+        """
+        run_engines(ns, source, [GreedyEngine(), NormalEval()])
+
+        nt.assert_is(ns['res'], counter)
+        nt.assert_count_equal(ns.keys(), ['counter', 'res', '__builtins__'])
+
+    def test_def_body(self):
+        """ getters are gone when a def body runs, it keeps its nodes """
+        class Lenient(GreedyEngine):
+            _allow_missing = True
+
+        counter = Counter()
+        ns = {'counter': counter}
+        source = """
+        def g():
+            return counter(len(counter.data))
+        """
+        run_engines(ns, source, [Lenient(), NormalEval()])
+
+        nt.assert_equal(ns['g'](), 3)
+        nt.assert_equal(ns['g'](), 3)
+
+    def test_loop_body(self):
+        """ nodes in a loop body are evaluated every iteration """
+        class Lenient(GreedyEngine):
+            _allow_missing = True
+
+        ns = {'h': Holder('init'), 'out': []}
+        source = """
+        for s in ['a', 'bb']:
+            h.s = s
+            u = h.s.upper()
+            out += [u]
+        """
+        run_engines(ns, source, [Lenient(), NormalEval()])
+
+        nt.assert_equal(ns['out'], ['A', 'BB'])
+
+    def test_deferred_nodes(self):
+        source = dedent("""
+        res = [f(x) for x in a.b if x] if g(y) else h(z) or k(w)
+        """)
+        line = ast.parse(source).body[0]
+        deferred = set(ast_source(node).strip()
+                       for node in deferred_nodes(line)
+                       if isinstance(node, ast.Call))
+        nt.assert_equal(deferred, {'f(x)', 'h(z)', 'k(w)'})
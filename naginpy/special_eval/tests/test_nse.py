@@ -1,12 +1,16 @@
 import ast
-from unittest import TestCase
+from unittest import TestCase, mock
 from textwrap import dedent
 
 import pandas as pd
 import numpy as np
+import nose.tools as nt
 from nose.tools import raises
+import pandas.util.testing as tm
 
 from ..nse import NSEEngine, nse
+from ..column_expr import ColumnExpr, compile_expr
+from .. import column_expr
 from ..special_eval import SpecialEval
 from ..engine import NormalEval
 
@@ -82,6 +86,97 @@ class TestNSE(TestCase):
 
         assert ns['l'] == 'x~y'
 
+class TestColumnNSE(TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({'hp': np.arange(10) * 30,
+                                'mpg': np.arange(10.)})
+
+    def test_filter(self):
+        from naginpy.dplr import filter, mutate
+
+        source = """
+        fast = filter(df, hp > 100)
+        both = filter(df, hp > 100 and not mpg > 7)
+        over = filter(df, hp > threshold)
+        more = mutate(df, power=hp * 2, plus='hp + 1')
+        """
+        df = self.df
+        threshold = 200
+
+        ns = run_nse(locals(), source)
+
+        tm.assert_frame_equal(ns['fast'], df[df.hp > 100])
+        tm.assert_frame_equal(ns['both'], df[(df.hp > 100) & ~(df.mpg > 7)])
+        tm.assert_frame_equal(ns['over'], df[df.hp > 200])
+        tm.assert_series_equal(ns['more'].power, df.hp * 2,
+                               check_names=False)
+        # strings are still query strings
+        tm.assert_series_equal(ns['more'].plus, df.hp + 1, check_names=False)
+
+    def test_pipe_stage(self):
+        from naginpy.dplr import filter, select
+        from naginpy.pipeline import Stage, chain
+
+        source = """
+        out = chain(df, Stage(filter, hp > 100), Stage(select, 'hp'))
+        """
+        df = self.df
+
+        ns = run_nse(locals(), source)
+        tm.assert_frame_equal(ns['out'], df.loc[df.hp > 100, ['hp']])
+
+    def test_column_expr(self):
+        expr = ColumnExpr('hp > limit or mpg < 1', {'limit': 240})
+        nt.assert_equal(expr.names, {'hp', 'limit', 'mpg'})
+        nt.assert_equal(set(expr.columns(self.df)), {'hp', 'mpg'})
+        df = self.df
+        mask = np.asarray(expr(df))
+        np.testing.assert_array_equal(mask, (df.hp > 240) | (df.mpg < 1))
+
+        # compiled once per source
+        nt.assert_is(compile_expr('hp > limit or mpg < 1'), expr.compiled)
+
+    def test_names_removed(self):
+        """ ColumnExpr getters don't leak into the namespace """
+        from naginpy.dplr import filter
+
+        source = """
+        fast = filter(df, hp > 100)
+        """
+        df = self.df
+        ns = run_nse(locals(), source)
+        nt.assert_equal(len(ns['fast']), 6)
+        nt.assert_equal([k for k in ns if k.startswith('__nse_col_')], [])
+
+    def test_deferred(self):
+        """ deferred code can still reach its ColumnExpr after the line """
+        from naginpy.dplr import filter
+
+        source = """
+        fast = lambda: filter(df, hp > 100)
+        def slow():
+            return filter(df, hp > 100)
+        now = filter(df, hp > 100)
+        """
+        df = self.df
+        ns = run_nse(locals(), source)
+        nt.assert_equal(len(ns['now']), 6)
+        tm.assert_frame_equal(ns['fast'](), ns['now'])
+        tm.assert_frame_equal(ns['slow'](), ns['now'])
+
+    def test_unknown_name(self):
+        """ unknown names raise NameError on the numexpr path too """
+        numexpr = mock.Mock()
+        expr = ColumnExpr('hp > nope', {})
+        with mock.patch.object(column_expr, '_numexpr', lambda: numexpr):
+            with nt.assert_raises(NameError):
+                expr(self.df)
+            nt.assert_false(numexpr.evaluate.called)
+
+            ColumnExpr('hp > limit', {'limit': 100})(self.df)
+            nt.assert_true(numexpr.evaluate.called)
+
 
 source = """
 i = dale.non_nse(123)
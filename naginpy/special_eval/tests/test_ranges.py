@@ -0,0 +1,142 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+import nose.tools as nt
+
+from ..computation import ComputationManager
+from ..exec_context import SourceObject
+from ..manifest_log import ManifestLog, EXEC
+from ..ranges import slice_key
+
+
+class FrameSource(object):
+    source_key = 'frames'
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.reads = 0
+
+    def get(self, key):
+        self.reads += 1
+        return self.frame
+
+
+class TestSliceKey(TestCase):
+    def test_slice_key(self):
+        manager = ComputationManager()
+        df = pd.DataFrame({'a': range(10)})
+        key = slice_key(manager.get('df.iloc[2:n]', {'df': df, 'n': 5})
+                        .manifest)
+        nt.assert_equal((key.accessor, key.lo, key.hi), ('iloc', 2, 5))
+
+        other = slice_key(manager.get('df.iloc[:3]', {'df': df}).manifest)
+        nt.assert_equal(key.group, other.group)
+
+        for source in ['df.iloc[-5:]', 'df.iloc[::2]', 'df.iloc[df.a]',
+                       'df.head(5)']:
+            manifest = manager.get(source, {'df': df}).manifest
+            nt.assert_is_none(slice_key(manifest))
+
+        # unsorted index can't answer label slices
+        unsorted = df.iloc[::-1]
+        manifest = manager.get('df.loc[2:5]', {'df': unsorted}).manifest
+        nt.assert_is_none(slice_key(manifest))
+
+
+class TestRangeReuse(TestCase):
+    def test_iloc(self):
+        source = FrameSource(pd.DataFrame({'a': np.arange(1000)}))
+        df = SourceObject(source, 'frame')
+        manager = ComputationManager()
+
+        big = manager.execute(manager.get('df.iloc[100:800]', {'df': df}))
+        nt.assert_equal(source.reads, 1)
+
+        entry = manager.get('df.iloc[200:300]', {'df': df})
+        part = manager.execute(entry)
+        # served from the cached slice
+        nt.assert_equal(source.reads, 1)
+        tm.assert_frame_equal(part, source.frame.iloc[200:300])
+
+        part = manager.execute(manager.get('df.iloc[700:]', {'df': df}))
+        # not covered
+        nt.assert_equal(source.reads, 2)
+        tm.assert_frame_equal(part, source.frame.iloc[700:])
+
+        part = manager.execute(manager.get('df.iloc[750:]', {'df': df}))
+        nt.assert_equal(source.reads, 2)
+        tm.assert_frame_equal(part, source.frame.iloc[750:])
+
+    def test_loc_dates(self):
+        index = pd.date_range('2014-01-01', '2017-12-31', freq='D')
+        df = pd.DataFrame({'a': np.arange(len(index))}, index=index)
+        manager = ComputationManager()
+
+        manager.execute(manager.get("df.loc['2015':'2016']", {'df': df}))
+        entry = manager.get("df.loc['2015-06':'2015-12']", {'df': df})
+        ranges = manager.ranges
+        nt.assert_is_not_none(ranges.find(entry.manifest))
+
+        part = manager.execute(entry)
+        tm.assert_frame_equal(part, df.loc['2015-06':'2015-12'])
+
+        # outside the cached range
+        entry = manager.get("df.loc['2016-06':'2017-02']", {'df': df})
+        nt.assert_is_none(ranges.find(entry.manifest))
+        tm.assert_frame_equal(manager.execute(entry),
+                              df.loc['2016-06':'2017-02'])
+
+    def test_other_object(self):
+        """ Only slices of the same object are reused """
+        manager = ComputationManager()
+        df = pd.DataFrame({'a': np.arange(10)})
+        df2 = pd.DataFrame({'a': np.arange(10) * 2})
+
+        manager.execute(manager.get('df.iloc[:8]', {'df': df}))
+        entry = manager.get('df.iloc[:4]', {'df': df2})
+        nt.assert_is_none(manager.ranges.find(entry.manifest))
+        tm.assert_frame_equal(manager.execute(entry), df2.iloc[:4])
+
+    def test_removed(self):
+        """ entries leaving the cache leave the range index """
+        manager = ComputationManager()
+        df = pd.DataFrame({'a': np.arange(10)})
+        manager.execute(manager.get('df.iloc[:8]', {'df': df}))
+        nt.assert_equal(len(manager.ranges.groups), 1)
+        manager.invalidate(df)
+        nt.assert_equal(manager.ranges.groups, {})
+
+        entry = manager.get('df.iloc[:8]', {'df': df})
+        manager.execute(entry)
+        manager.evict(entry)
+        nt.assert_equal(manager.ranges.groups, {})
+
+    def test_recorded(self):
+        """ range hits go through the log like executions """
+        path = tempfile.mkdtemp()
+        log = ManifestLog(path, flush_interval=0.01)
+        try:
+            manager = ComputationManager(log=log)
+            df = pd.DataFrame({'a': np.arange(10)})
+            big = manager.get('df.iloc[:8]', {'df': df})
+            manager.execute(big)
+            part = manager.get('df.iloc[2:4]', {'df': df})
+            manager.execute(part)
+            log.flush()
+
+            nt.assert_true(part.executed)
+            nt.assert_is_not_none(part.exec_time)
+            nt.assert_equal(big.hits, 1)
+            group = manager.ranges.groups[slice_key(part.manifest).group]
+            nt.assert_in(part, [entry for _, entry in group])
+            records = log.lookup(part.manifest.hash_key)
+            nt.assert_equal([r.kind for r in records], [EXEC])
+            # the covering slice was reused
+            nt.assert_equal(len(log.lookup(big.manifest.hash_key)), 2)
+        finally:
+            log.close()
+            shutil.rmtree(path)
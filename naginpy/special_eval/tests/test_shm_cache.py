@@ -0,0 +1,145 @@
+import os
+import subprocess
+import sys
+from textwrap import dedent
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+import nose.tools as nt
+
+from ..computation import ComputationManager
+from ..manifest import _manifest
+from ..shm_cache import SharedMemoryCache, _open, _PID
+
+
+class TestSharedMemoryCache(TestCase):
+    def setUp(self):
+        prefix = 'ngtest{0}'.format(os.getpid())
+        self.kernel1 = SharedMemoryCache(prefix)
+        self.kernel2 = SharedMemoryCache(prefix)
+
+    def tearDown(self):
+        self.kernel1.clear(all=True)
+        self.kernel2.clear(all=True)
+
+    def test_share(self):
+        m = _manifest("np.arange(n)", {'np': np, 'n': 100})
+        nt.assert_not_in(m, self.kernel2)
+
+        nt.assert_equal(self.kernel1.put(m, np.arange(100)), m.hash_key)
+        nt.assert_in(m, self.kernel2)
+        test = self.kernel2.get(m)
+        np.testing.assert_array_equal(test, np.arange(100))
+        nt.assert_false(test.flags.writeable)
+
+        # only numeric values
+        m2 = _manifest("str(n)", {'n': 100})
+        nt.assert_is_none(self.kernel1.put(m2, '100'))
+        with nt.assert_raises(KeyError):
+            self.kernel2.get(m2)
+
+    def test_frame(self):
+        df = pd.DataFrame(np.random.randn(50, 3), columns=['a', 'b', 'c'])
+        df['d'] = np.arange(50)
+        m = _manifest("pd.DataFrame(n)", {'pd': pd, 'n': 50})
+        self.kernel1.put(m, df)
+        tm.assert_frame_equal(self.kernel2.get(m), df)
+
+    def test_other_process(self):
+        m = _manifest("np.arange(n)", {'np': np, 'n': 1000})
+        self.kernel1.put(m, np.arange(1000))
+
+        code = dedent("""
+            import numpy as np
+            from naginpy.special_eval.manifest import _manifest
+            from naginpy.special_eval.shm_cache import SharedMemoryCache
+            m = _manifest("np.arange(n)", {{'np': np, 'n': 1000}})
+            print(SharedMemoryCache({0!r}).get(m).sum())
+        """).format(self.kernel1.prefix)
+        out = subprocess.check_output([sys.executable, '-c', code],
+                                      env=dict(os.environ))
+        nt.assert_equal(int(out), np.arange(1000).sum())
+        # segment outlives the other process
+        nt.assert_in(m, self.kernel2)
+
+    def test_computation_manager(self):
+        ns = {'np': np, 'n': 100}
+        cm1 = ComputationManager(shared=self.kernel1)
+        cm1.execute(cm1.get("np.arange(n) * 2", ns))
+
+        cm2 = ComputationManager(shared=self.kernel2)
+        entry = cm2.get("np.arange(n) * 2", ns)
+        np.testing.assert_array_equal(cm2.execute(entry), np.arange(100) * 2)
+        # attached, not executed
+        nt.assert_is_none(entry.exec_time)
+
+    def test_crashed_writer(self):
+        """ segment left without MAGIC by a dead writer is replaced """
+        m = _manifest("np.arange(n)", {'np': np, 'n': 10})
+        proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proc.wait()
+
+        shm = _open(self.kernel1.segment_name(m.hash_key), size=4096,
+                    create=True)
+        _PID.pack_into(shm.buf, 0, proc.pid)
+        shm.close()
+        nt.assert_not_in(m, self.kernel2)
+
+        nt.assert_equal(self.kernel1.put(m, np.arange(10)), m.hash_key)
+        np.testing.assert_array_equal(self.kernel2.get(m), np.arange(10))
+
+    def test_live_writer(self):
+        """ segment still being written by a live process is left alone """
+        m = _manifest("np.arange(n)", {'np': np, 'n': 10})
+        shm = _open(self.kernel2.segment_name(m.hash_key), size=4096,
+                    create=True)
+        _PID.pack_into(shm.buf, 0, os.getpid())
+        shm.close()
+        self.kernel2.created[m.hash_key] = 4096
+
+        nt.assert_is_none(self.kernel1.put(m, np.arange(10)))
+        nt.assert_not_in(m, self.kernel1)
+
+    def test_capacity(self):
+        ms = [_manifest("np.arange(n)", {'np': np, 'n': n})
+              for n in (100, 101, 102)]
+        self.kernel1.put(ms[0], np.arange(100))
+        size = self.kernel1.nbytes
+        self.kernel1.clear()
+
+        # room for two values
+        cache = SharedMemoryCache(self.kernel1.prefix, capacity=size * 2)
+        try:
+            for m in ms[:2]:
+                cache.put(m, np.arange(100))
+            cache.get(ms[0])
+            # ms[1] is least recently used
+            cache.put(ms[2], np.arange(100))
+            nt.assert_equal(cache.nbytes, size * 2)
+            nt.assert_in(ms[0], self.kernel2)
+            nt.assert_not_in(ms[1], self.kernel2)
+            nt.assert_in(ms[2], self.kernel2)
+
+            big = _manifest("np.arange(n)", {'np': np, 'n': 10000})
+            nt.assert_is_none(cache.put(big, np.arange(10000)))
+            nt.assert_not_in(big, self.kernel2)
+        finally:
+            cache.clear()
+
+    def test_clear(self):
+        """ clear only unlinks other kernels' segments when asked """
+        m1 = _manifest("np.arange(n)", {'np': np, 'n': 10})
+        m2 = _manifest("np.arange(n)", {'np': np, 'n': 20})
+        self.kernel1.put(m1, np.arange(10))
+        self.kernel2.put(m2, np.arange(20))
+        nt.assert_in(m1, self.kernel2)
+
+        self.kernel2.clear()
+        nt.assert_in(m1, self.kernel1)
+        nt.assert_not_in(m2, self.kernel1)
+
+        nt.assert_in(m1, self.kernel2)
+        self.kernel2.clear(all=True)
+        nt.assert_not_in(m1, SharedMemoryCache(self.kernel1.prefix))
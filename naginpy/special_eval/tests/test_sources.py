@@ -0,0 +1,176 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pytest
+import pandas.util.testing as tm
+import nose.tools as nt
+
+from ..exec_context import SourceObject
+from ..manifest import _manifest, column_projections
+from ..sources import CSVSource, FileSource, ParquetSource
+
+
+class RecordingCSVSource(CSVSource):
+    """ Keeps track of the columns requested on each read """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+        self.filters = []
+
+    def read(self, path, columns, filters=None):
+        self.reads.append(columns)
+        self.filters.append(filters)
+        return super().read(path, columns, filters)
+
+
+class RecordingParquetSource(ParquetSource):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+        self.filters = []
+
+    def read(self, path, columns, filters=None):
+        self.reads.append(columns)
+        self.filters.append(filters)
+        return super().read(path, columns, filters)
+
+
+def test_abstract():
+    with nt.assert_raises(TypeError):
+        FileSource('/tmp')
+
+
+class TestCSVSource(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        columns = ['c{0}'.format(i) for i in range(20)]
+        self.df = pd.DataFrame(np.random.randn(10, 20), columns=columns)
+        self.df.index.name = 'id'
+        self.df.to_csv(os.path.join(self.dir, 'wide.csv'))
+        self.source = RecordingCSVSource(self.dir, index_col='id')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_source_key(self):
+        so = SourceObject(self.source, 'wide')
+        nt.assert_true(so.key.startswith('RecordingCSVSource('))
+        nt.assert_true(so.key.endswith('::wide'))
+        nt.assert_true(so.stateless)
+
+    def test_columns(self):
+        so = SourceObject(self.source, 'wide')
+        nt.assert_equal(so.columns(), list(self.df.columns))
+        # reading the header does not go through read
+        nt.assert_equal(self.source.reads, [])
+
+    def test_projection(self):
+        so = SourceObject(self.source, 'wide')
+        manifest = _manifest("df.c1 + df['c3'] * df.c1", {'df': so})
+        nt.assert_equal(column_projections(manifest.expression.code,
+                                           manifest.context),
+                        {'df': ['c1', 'c3']})
+
+        res = manifest.eval()
+        tm.assert_series_equal(res, self.df.c1 + self.df.c3 * self.df.c1,
+                               check_names=False)
+        nt.assert_equal(self.source.reads, [['c1', 'c3']])
+
+    def test_list_projection(self):
+        so = SourceObject(self.source, 'wide')
+        manifest = _manifest("df[['c1', 'c2']].sum()", {'df': so})
+        res = manifest.eval()
+        tm.assert_series_equal(res, self.df[['c1', 'c2']].sum())
+        nt.assert_equal(self.source.reads, [['c1', 'c2']])
+
+    def test_full_read(self):
+        """ any non column use of the var requires the whole frame """
+        so = SourceObject(self.source, 'wide')
+        manifest = _manifest("df.c1 + df.sum(axis=1)", {'df': so})
+        res = manifest.eval()
+        tm.assert_series_equal(res, self.df.c1 + self.df.sum(axis=1))
+        nt.assert_equal(self.source.reads, [None])
+
+        # sum is an attribute but not a column
+        manifest = _manifest("df.sum()", {'df': so})
+        manifest.eval()
+        nt.assert_equal(self.source.reads, [None, None])
+
+    def test_predicate_pushdown(self):
+        so = SourceObject(self.source, 'wide')
+        self.source.chunksize = 3
+        df = self.df
+        manifest = _manifest("df[(df.c1 > lower) & (0.5 >= df['c2'])].c3",
+                             {'df': so, 'lower': -0.5})
+        res = manifest.eval()
+        correct = df[(df.c1 > -0.5) & (0.5 >= df['c2'])].c3
+        tm.assert_series_equal(res, correct, check_exact=False)
+
+        nt.assert_equal(self.source.reads, [['c3', 'c1', 'c2']])
+        nt.assert_equal(self.source.filters,
+                        [[('c1', '>', -0.5), ('c2', '<=', 0.5)]])
+
+    def test_loc_pushdown(self):
+        so = SourceObject(self.source, 'wide')
+        df = self.df
+        manifest = _manifest("df.loc[df.c1 > 0].sum()", {'df': so})
+        res = manifest.eval()
+        tm.assert_series_equal(res, df.loc[df.c1 > 0].sum(),
+                               check_exact=False)
+        # sum needs every column
+        nt.assert_equal(self.source.reads, [None])
+        nt.assert_equal(self.source.filters, [[('c1', '>', 0)]])
+
+    def test_no_pushdown(self):
+        """ df used outside the filter needs the full read """
+        so = SourceObject(self.source, 'wide')
+        df = self.df
+        manifest = _manifest("df[df.c1 > 0].c2.sum() + df.c3.sum()",
+                             {'df': so})
+        res = manifest.eval()
+        nt.assert_almost_equal(res, df[df.c1 > 0].c2.sum() + df.c3.sum())
+        nt.assert_equal(self.source.filters, [None])
+
+        # original expression is untouched
+        nt.assert_equal(manifest.expression.get_source(),
+                        "(df[df.c1 > 0].c2.sum() + df.c3.sum())")
+
+
+class TestParquetSource(TestCase):
+    def setUp(self):
+        pytest.importorskip('pyarrow')
+        self.dir = tempfile.mkdtemp()
+        columns = ['c{0}'.format(i) for i in range(20)]
+        self.df = pd.DataFrame(np.random.randn(10, 20), columns=columns)
+        self.df.to_parquet(os.path.join(self.dir, 'wide.parquet'))
+        self.source = RecordingParquetSource(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_columns(self):
+        so = SourceObject(self.source, 'wide')
+        nt.assert_true(so.stateless)
+        nt.assert_equal(so.columns(), list(self.df.columns))
+        nt.assert_equal(self.source.reads, [])
+
+    def test_projection(self):
+        so = SourceObject(self.source, 'wide')
+        manifest = _manifest("df.c1 + df['c3']", {'df': so})
+        res = manifest.eval()
+        tm.assert_series_equal(res, self.df.c1 + self.df.c3,
+                               check_names=False)
+        nt.assert_equal(self.source.reads, [['c1', 'c3']])
+
+    def test_predicate_pushdown(self):
+        so = SourceObject(self.source, 'wide')
+        df = self.df
+        manifest = _manifest("df[df.c1 > lower].c3", {'df': so, 'lower': 0})
+        res = manifest.eval()
+        correct = df[df.c1 > 0].c3
+        np.testing.assert_allclose(res.to_numpy(), correct.to_numpy())
+        nt.assert_equal(self.source.filters, [[('c1', '>', 0)]])
@@ -0,0 +1,69 @@
+import ast
+from textwrap import dedent
+from unittest import TestCase
+
+import nose.tools as nt
+
+from ..special_eval import SpecialEval
+from ..engine import Engine, NormalEval
+
+
+class RecordingEval(NormalEval):
+    """ NormalEval that records how lines were executed """
+    def __init__(self):
+        self.single = []
+        self.bulk = []
+
+    def line_postprocess(self, line, ns):
+        self.single.append(line)
+        return super().line_postprocess(line, ns)
+
+    def bulk_postprocess(self, lines, ns):
+        self.bulk.append(len(lines))
+        return super().bulk_postprocess(lines, ns)
+
+
+class AssignClaimer(Engine):
+    """ Claims only lines that assign to `claimed` """
+    def should_handle_line(self, line, load_names):
+        return isinstance(line, ast.Assign) \
+            and line.targets[0].id == 'claimed'
+
+
+class TestBulkExec(TestCase):
+    def test_unclaimed_runs(self):
+        source = dedent("""
+        a = 1
+        b = a + 1
+        claimed = b * 2
+        c = claimed + 1
+        d = c + 1
+        """)
+        ns = {}
+        normal = RecordingEval()
+        se = SpecialEval(source, ns=ns, engines=[AssignClaimer(), normal])
+        se.process()
+
+        nt.assert_equal(ns['d'], 6)
+        # two runs of unclaimed lines around the claimed one
+        nt.assert_equal(normal.bulk, [2, 2])
+        # claimed line goes through normal per line processing
+        nt.assert_equal(len(normal.single), 1)
+
+    def test_all_unclaimed(self):
+        source = dedent("""
+        a = 1
+        for i in range(3):
+            a += i
+        def f(x):
+            return x + a
+        b = f(1)
+        """)
+        ns = {}
+        normal = RecordingEval()
+        se = SpecialEval(source, ns=ns, engines=[normal])
+        se.process()
+
+        nt.assert_equal(ns['b'], 5)
+        nt.assert_equal(normal.bulk, [4])
+        nt.assert_equal(normal.single, [])
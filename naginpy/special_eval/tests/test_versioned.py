@@ -0,0 +1,131 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+import nose.tools as nt
+
+from ..computation import ComputationManager
+from ..manifest import _manifest
+from ..manifest_log import ManifestLog, replay
+from ..versioned import AppendOnlySource, VersionedSourceObject
+
+
+def batch(start, stop):
+    return pd.DataFrame({'a': np.arange(start, stop),
+                         'b': np.arange(start, stop) * 2.},
+                        index=np.arange(start, stop))
+
+class TestAppendOnlySource(TestCase):
+    def setUp(self):
+        source = AppendOnlySource('history')
+        for start in range(0, 100, 25):
+            source.append('AAPL', batch(start, start + 25))
+        self.source = source
+        self.full = batch(0, 100)
+
+    def test_snapshot(self):
+        source = self.source
+        nt.assert_equal(source.version('AAPL'), 100)
+        tm.assert_frame_equal(source.get('AAPL'), self.full)
+        tm.assert_frame_equal(source.get('AAPL', version=60),
+                              self.full.iloc[:60])
+        tm.assert_frame_equal(source.get('AAPL', version=60, columns=['b']),
+                              self.full.iloc[:60][['b']])
+        with nt.assert_raises(KeyError):
+            source.get('AAPL', version=101)
+
+    def test_isolated(self):
+        """ callers can't change the stored rows or the cached snapshot """
+        source = AppendOnlySource('history')
+        rows = batch(0, 10)
+        source.append('AAPL', rows)
+        rows.iloc[0, 0] = -1
+
+        snapshot = source.get('AAPL')
+        nt.assert_equal(snapshot.a.iloc[0], 0)
+        snapshot.iloc[1, 0] = -1
+        snapshot['c'] = 1
+        tm.assert_frame_equal(source.get('AAPL'), batch(0, 10))
+
+        since = source.since('AAPL', 5)
+        since.iloc[0, 0] = -1
+        tm.assert_frame_equal(source.get('AAPL'), batch(0, 10))
+
+    def test_since(self):
+        source = self.source
+        tm.assert_frame_equal(source.since('AAPL', 60), self.full.iloc[60:])
+        tm.assert_frame_equal(source.since('AAPL', 10, upto=30),
+                              self.full.iloc[10:30])
+        nt.assert_equal(len(source.since('AAPL', 100)), 0)
+
+    def test_cursor(self):
+        source = self.source
+        cursor = source.cursor('AAPL')
+        nt.assert_equal(len(cursor.fetch()), 100)
+        nt.assert_equal(len(cursor.fetch()), 0)
+        source.append('AAPL', batch(100, 110))
+        tm.assert_frame_equal(cursor.fetch(), batch(100, 110))
+        nt.assert_equal(cursor.snapshot().version, 110)
+
+
+class TestVersionedSourceObject(TestCase):
+    def test_pinned(self):
+        source = AppendOnlySource('history')
+        source.append('AAPL', batch(0, 50))
+        aapl = VersionedSourceObject(source, 'AAPL')
+        nt.assert_equal(aapl.key, 'history::AAPL@50')
+        nt.assert_true(aapl.stateless)
+
+        m = _manifest("aapl.a.sum()", {'aapl': aapl})
+        nt.assert_true(m.stateless)
+        nt.assert_equal(m.eval(), batch(0, 50).a.sum())
+
+        source.append('AAPL', batch(50, 60))
+        # snapshot doesn't move
+        nt.assert_equal(m.eval(), batch(0, 50).a.sum())
+        tm.assert_frame_equal(aapl.delta(40), batch(40, 50))
+
+        latest = aapl.latest()
+        nt.assert_equal(latest.version, 60)
+        nt.assert_not_equal(aapl, latest)
+        nt.assert_equal(aapl, VersionedSourceObject(source, 'AAPL', 50))
+        tm.assert_frame_equal(latest.delta(aapl.version), batch(50, 60))
+
+    def test_cache_key(self):
+        source = AppendOnlySource('history')
+        source.append('AAPL', batch(0, 10))
+        manager = ComputationManager()
+
+        old = manager.get('aapl.a.sum()',
+                          {'aapl': VersionedSourceObject(source, 'AAPL')})
+        manager.execute(old)
+        source.append('AAPL', batch(10, 20))
+        new = manager.get('aapl.a.sum()',
+                          {'aapl': VersionedSourceObject(source, 'AAPL')})
+        nt.assert_is_not(old, new)
+        nt.assert_equal(manager.execute(new), batch(0, 20).a.sum())
+
+        same = manager.get('aapl.a.sum()',
+                           {'aapl': VersionedSourceObject(source, 'AAPL', 10)})
+        nt.assert_is(same, old)
+
+    def test_replay(self):
+        source = AppendOnlySource('history')
+        source.append('AAPL', batch(0, 10))
+        aapl = VersionedSourceObject(source, 'AAPL')
+        manager = ComputationManager()
+        with tempfile.TemporaryDirectory() as path:
+            log = ManifestLog(path)
+            entry = manager.get('aapl.a.sum()', {'aapl': aapl})
+            manager.execute(entry)
+            log.record(entry)
+            log.flush()
+            record = list(log.records())[0]
+            log.close()
+
+        source.append('AAPL', batch(10, 20))
+        manifest = replay(record, {'history': source})
+        nt.assert_equal(manifest.hash_key, entry.manifest.hash_key)
+        nt.assert_equal(manifest.eval(), batch(0, 10).a.sum())
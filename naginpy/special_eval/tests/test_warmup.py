@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import nose.tools as nt
+
+from ..cache_server import LocalStore, SharedCache
+from ..computation import ComputationManager, Computable
+from ..manifest import _manifest
+from ..manifest_log import ManifestLog, HIT
+from ..warmup import rank, warm_up
+
+
+def _entry(source, context, exec_time):
+    entry = Computable(_manifest(source, context))
+    entry.exec_time = exec_time
+    entry.value = 1
+    return entry
+
+
+class TestWarmUp(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = ManifestLog(self.dir, flush_interval=0.01)
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.dir)
+
+    def test_rank(self):
+        ns = {'np': np, 'n': 10}
+        slow = _entry("np.arange(n) * 2", ns, 1.0)
+        reused = _entry("np.arange(n) * 3", ns, 0.3)
+        fast = _entry("np.arange(n) * 4", ns, 0.01)
+        stateful = _entry("df + 1", {'df': pd.DataFrame()}, 10.0)
+
+        for entry in [slow, reused, fast, stateful]:
+            self.log.record(entry)
+        for i in range(4):
+            self.log.hit(reused)
+        self.log.flush()
+
+        ranked = rank(self.log)
+        keys = [item.record.key for item in ranked]
+        nt.assert_equal(keys, [reused.manifest.hash_key,
+                               slow.manifest.hash_key,
+                               fast.manifest.hash_key])
+        nt.assert_equal(ranked[0].hits, 5)
+        nt.assert_almost_equal(ranked[0].score, 1.5)
+        nt.assert_equal(len(rank(self.log, limit=1)), 1)
+
+        # slow falls out of the last 7 records
+        ranked = rank(self.log, window=7)
+        nt.assert_equal([item.record.key for item in ranked],
+                        [reused.manifest.hash_key, fast.manifest.hash_key])
+
+    def test_warm_up(self):
+        ns = {'np': np, 'n': 10}
+        cm = ComputationManager(log=self.log)
+        cm.execute(cm.get("np.arange(n) * 2", ns))
+        # hit is logged
+        cm.get("np.arange(n) * 2", ns)
+        self.log.flush()
+        nt.assert_equal([r.kind for r in self.log.records()][-1], HIT)
+
+        # new session
+        cm = ComputationManager()
+        warmer = warm_up(cm, self.log, background=False)
+        entry, = warmer.entries
+        # no shared cache and compute=False, placeholder only
+        nt.assert_false(entry.executed)
+        nt.assert_true(entry.manifest.interned)
+        nt.assert_is(next(iter(cm.cache)), entry.manifest)
+        nt.assert_is(cm.get("np.arange(n) * 2", ns), entry)
+        np.testing.assert_array_equal(cm.execute(entry), np.arange(10) * 2)
+
+        cm = ComputationManager()
+        warmer = warm_up(cm, self.log, compute=True)
+        warmer.join()
+        entry, = warmer.loaded
+        nt.assert_true(entry.executed)
+        nt.assert_is(cm.get("np.arange(n) * 2", ns), entry)
+
+    def test_shared(self):
+        ns = {'np': np, 'n': 10}
+        shared = SharedCache(LocalStore(tempfile.mkdtemp(dir=self.dir)))
+        cm = ComputationManager(shared=shared, log=self.log)
+        cm.execute(cm.get("np.arange(n) * 2", ns))
+        self.log.flush()
+
+        cm = ComputationManager(shared=shared)
+        warmer = warm_up(cm, self.log)
+        warmer.join()
+        entry, = warmer.loaded
+        # loaded, not executed
+        nt.assert_is_none(entry.exec_time)
+        np.testing.assert_array_equal(entry.value, np.arange(10) * 2)
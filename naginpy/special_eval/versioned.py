@@ -0,0 +1,211 @@
+"""
+Append-only, versioned sources.
+
+```
+history = AppendOnlySource('history')
+history.append('AAPL', first_batch)
+
+aapl = VersionedSourceObject(history, 'AAPL')  # pinned to the current version
+m = _manifest("aapl.close.mean()", {'aapl': aapl})
+
+history.append('AAPL', next_batch)
+m.eval()  # still only sees first_batch
+```
+
+Rows are only ever appended, so the version of a key is its high-water mark,
+the number of rows written so far. Everything up to a version never
+changes. VersionedSourceObject puts the version in its key, which makes
+Manifests over it stateless and valid forever. New data means a new
+version and so a new key.
+
+Reads are snapshots: `get(key, version=v)` returns the first v rows. A
+consumer that has seen version N only needs `since(key, N)`, which never
+touches older chunks. `Cursor` keeps track of N.
+
+Any source with `version(key)`, `get(key, version=...)` and
+`since(key, version, upto=None)` works with VersionedSourceObject.
+"""
+import bisect
+
+from .exec_context import SourceObject
+from .pushdown import apply_filters
+
+
+def _head(chunk, n):
+    return getattr(chunk, 'iloc', chunk)[:n]
+
+def _tail(chunk, n):
+    return getattr(chunk, 'iloc', chunk)[n:]
+
+def _copy(value):
+    # frames, arrays and lists all have copy
+    return value.copy()
+
+def _concat(chunks):
+    from naginpy.pipeline import concat
+    return concat(chunks)
+
+
+class AppendOnlySource(object):
+    """
+    In-memory append-only store. Each key is a list of row chunks, frames
+    or arrays, and the cumulative row count at the end of each chunk.
+    """
+    supports_projection = True
+    supports_predicates = True
+
+    def __init__(self, source_key):
+        self.source_key = source_key
+        self.chunks = {}
+        self.ends = {}
+        # key => (version, value) of the last snapshot read
+        self._snapshots = {}
+
+    def append(self, key, rows):
+        """
+        Add a copy of rows, so later changes to the caller's object can't
+        rewrite history. Returns the new version.
+        """
+        chunks = self.chunks.setdefault(key, [])
+        ends = self.ends.setdefault(key, [])
+        if len(rows):
+            chunks.append(_copy(rows))
+            ends.append(self.version(key) + len(rows))
+        return self.version(key)
+
+    def version(self, key):
+        """ High-water mark, rows written so far """
+        ends = self.ends.get(key, None)
+        if not ends:
+            return 0
+        return ends[-1]
+
+    def columns(self, key):
+        chunks = self.chunks.get(key, None)
+        if not chunks:
+            return None
+        return list(getattr(chunks[0], 'columns', [])) or None
+
+    def _rows(self, key, start, stop):
+        """ Rows [start, stop) from the chunks that hold them """
+        chunks = self.chunks.get(key, [])
+        ends = self.ends.get(key, [])
+        if stop > self.version(key):
+            raise KeyError("{0} has no version {1}".format(key, stop))
+
+        first = bisect.bisect_right(ends, start)
+        out = []
+        for i in range(first, len(chunks)):
+            chunk_start = ends[i-1] if i else 0
+            if chunk_start >= stop:
+                break
+            chunk = chunks[i]
+            if ends[i] > stop:
+                chunk = _head(chunk, stop - chunk_start)
+            if chunk_start < start:
+                chunk = _tail(chunk, start - chunk_start)
+            out.append(chunk)
+        if not out:
+            empty = chunks[0] if chunks else []
+            return _head(empty, 0)
+        return _concat(out)
+
+    def _select(self, value, columns, filters):
+        """
+        value is the cached snapshot or shares memory with the stored
+        chunks. Selecting builds a new object, otherwise it is copied so the
+        caller can't change either.
+        """
+        if columns is None and not filters:
+            return _copy(value)
+        if columns is not None:
+            value = value[list(columns)]
+        if filters:
+            value = apply_filters(value, filters)
+        return value
+
+    def get(self, key, version=None, columns=None, filters=None):
+        """ Snapshot of the first `version` rows, all rows if None """
+        if version is None:
+            version = self.version(key)
+
+        cached = self._snapshots.get(key, None)
+        if cached is not None and cached[0] == version:
+            value = cached[1]
+        else:
+            value = self._rows(key, 0, version)
+            self._snapshots[key] = (version, value)
+        return self._select(value, columns, filters)
+
+    def since(self, key, version, upto=None, columns=None, filters=None):
+        """ Rows appended after `version`, up to `upto` """
+        if upto is None:
+            upto = self.version(key)
+        value = self._rows(key, version, upto)
+        return self._select(value, columns, filters)
+
+    def cursor(self, key, version=0):
+        return Cursor(self, key, version)
+
+
+class VersionedSourceObject(SourceObject):
+    """
+    SourceObject pinned to a version of an append-only source.
+
+    version : int
+        Defaults to the source's current version.
+    """
+    __slots__ = ('version',)
+
+    def __init__(self, source, key, version=None, source_key=None):
+        super().__init__(source, key, source_key=source_key)
+        if version is None:
+            version = source.version(key)
+        self.version = version
+
+    def get_obj(self, columns=None, filters=None):
+        kwargs = {}
+        if columns is not None and self.supports_projection:
+            kwargs['columns'] = columns
+        if filters and self.supports_predicates:
+            kwargs['filters'] = filters
+        return self.source.get(self._obj_key, version=self.version, **kwargs)
+
+    def delta(self, since):
+        """ Rows between version `since` and this version """
+        return self.source.since(self._obj_key, since, upto=self.version)
+
+    def latest(self):
+        """ Same key at the source's current version """
+        return self.at(self.source.version(self._obj_key))
+
+    def at(self, version):
+        return self.__class__(self.source, self._obj_key, version,
+                              source_key=self.source_key)
+
+    @property
+    def key(self):
+        return "{0}::{1}@{2}".format(self.source_key, self._obj_key,
+                                     self.version)
+
+
+class Cursor(object):
+    """
+    Incremental reader. Each `fetch` returns only the rows appended since
+    the previous one.
+    """
+    def __init__(self, source, key, version=0):
+        self.source = source
+        self.key = key
+        self.version = version
+
+    def fetch(self, columns=None):
+        upto = self.source.version(self.key)
+        rows = self.source.since(self.key, self.version, upto=upto,
+                                 columns=columns)
+        self.version = upto
+        return rows
+
+    def snapshot(self):
+        """ VersionedSourceObject at the cursor's version """
+        return VersionedSourceObject(self.source, self.key, self.version)
@@ -0,0 +1,146 @@
+"""
+Warm the ComputationManager cache from previous sessions.
+
+```
+manager = ComputationManager(shared=shared, log=log)
+warmer = warm_up(manager, log, sources={'CSVSource(/data)': csv_source})
+```
+
+The most recent records of the manifest log are read and the stateless
+Manifests are ranked by past hit count * exec_time, so values that were
+both reused and expensive come first. The top Manifests are interned and
+registered in `manager.cache` right away as unexecuted Computables. A
+background thread then loads their values in rank order, either from the
+manager's shared cache or, with `compute=True`, by executing them.
+
+If the notebook asks for an entry before its value has loaded, it just
+executes it. Each placeholder has a lock so the entry is never executed
+twice.
+"""
+import threading
+from collections import namedtuple
+
+from .computation import Computable
+from .manifest import intern_manifest
+from .manifest_log import EXEC, replay
+
+Ranked = namedtuple('Ranked', ['score', 'hits', 'exec_time', 'record'])
+
+
+# records read from the end of the log. the log only grows, so reading all
+# of it would make every start slower than the last
+WINDOW = 100000
+
+
+def rank(log, limit=None, window=WINDOW):
+    """
+    Aggregate the last `window` log records per key. Only stateless records
+    are considered since the rest can't be rebuilt.
+
+    hits counts executions and cache hits. exec_time is the mean of the
+    recorded executions.
+    """
+    stats = {}
+    for record in log.records(last=window):
+        if not record.stateless:
+            continue
+        hits, total_time, timed, _ = stats.get(record.key, (0, 0.0, 0, None))
+        hits += 1
+        if record.kind == EXEC and record.exec_time is not None:
+            total_time += record.exec_time
+            timed += 1
+        stats[record.key] = (hits, total_time, timed, record)
+
+    ranked = []
+    for hits, total_time, timed, record in stats.values():
+        if not timed:
+            continue
+        exec_time = total_time / timed
+        ranked.append(Ranked(hits * exec_time, hits, exec_time, record))
+
+    ranked.sort(key=lambda item: item.score, reverse=True)
+    if limit is not None:
+        ranked = ranked[:limit]
+    return ranked
+
+
+class WarmUp(object):
+    """
+    Loads placeholder entries in the background. `entries` is in priority
+    order.
+    """
+    def __init__(self, manager, entries, compute=False):
+        self.manager = manager
+        self.entries = entries
+        self.compute = compute
+        self.loaded = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def run(self):
+        for entry in self.entries:
+            if self._stop.is_set():
+                return
+            with entry.lock:
+                if entry.executed:
+                    continue
+                if not self.compute:
+                    if self.manager.load_shared(entry):
+                        self.loaded.append(entry)
+                    continue
+                try:
+                    # tries the shared cache first. the lock is reentrant
+                    self.manager.execute(entry)
+                except Exception:
+                    # sources may have changed. leave it for the notebook.
+                    continue
+                self.loaded.append(entry)
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+
+
+def warm_up(manager, log, sources=None, limit=50, compute=False,
+            background=True, window=WINDOW):
+    """
+    Register the top `limit` Manifests from log as placeholders in
+    manager.cache and start loading their values.
+
+    sources : dict
+        source_key => source for SourceObject contexts. See replay.
+    compute : bool
+        Execute Manifests the shared cache doesn't have.
+    window : int
+        Only the most recent `window` records are ranked.
+    """
+    entries = []
+    for item in rank(log, limit=limit, window=window):
+        try:
+            manifest = replay(item.record, sources)
+        except (ValueError, ImportError):
+            continue
+
+        # same as ComputationManager.get, cache keys are interned
+        manifest = intern_manifest(manifest)
+        entry = manager.cache.setdefault(manifest, Computable(manifest))
+        if entry.executed:
+            continue
+        entry.lock = threading.RLock()
+        entries.append(entry)
+
+    warmer = WarmUp(manager, entries, compute=compute)
+    if background:
+        warmer.start()
+    else:
+        warmer.run()
+    return warmer
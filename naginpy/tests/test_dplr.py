@@ -0,0 +1,57 @@
+from textwrap import dedent
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+import nose.tools as nt
+
+from .. import dplr
+from ..dplr import pipe_transform, PIPE_NS
+
+
+class TestPipeTransform(TestCase):
+    def test_transform(self):
+        source = dedent("""
+            res = mtcars %>%
+                filter('hp > 100') %>%
+                select('mpg', 'hp') %>%
+                head(n=3)
+        """).strip()
+        new_source = pipe_transform(source)
+        nt.assert_not_in('%>%', new_source)
+
+        mtcars = pd.DataFrame({'hp': [50, 150, 120, 300, 110],
+                               'mpg': [1., 2, 3, 4, 5]})
+        ns = dict(PIPE_NS, mtcars=mtcars, filter=dplr.filter,
+                  select=dplr.select, head=dplr.head)
+        exec(new_source, ns)
+        correct = mtcars.query('hp > 100')[['mpg', 'hp']].head(3)
+        tm.assert_frame_equal(ns['res'], correct)
+
+    def test_bare_func(self):
+        ns = dict(PIPE_NS, np=np, arr=np.arange(5))
+        source = pipe_transform("arr %>% np.exp %>% np.sum")
+        nt.assert_almost_equal(eval(source, ns), np.exp(np.arange(5)).sum())
+
+    def test_indented(self):
+        """ chains inside a block keep their indentation """
+        source = "    res = arr %>%\n        np.exp %>%\n        np.sum"
+        new_source = pipe_transform(source)
+        nt.assert_true(new_source.startswith('    res = __pipe_chain__('))
+
+        block = "if True:\n" + new_source
+        ns = dict(PIPE_NS, np=np, arr=np.arange(5))
+        exec(block, ns)
+        nt.assert_almost_equal(ns['res'], np.exp(np.arange(5)).sum())
+
+    def test_no_pipe(self):
+        source = "a = '%>%' % b"
+        nt.assert_equal(pipe_transform(source), source)
+
+    def test_logical_line(self):
+        transform = dplr.DSL().logical_line_transform()
+        next(transform)
+        nt.assert_is_none(transform.send("arr %>%"))
+        line = transform.send("    np.sum")
+        nt.assert_equal(eval(line, dict(PIPE_NS, np=np, arr=np.ones(3))), 3)
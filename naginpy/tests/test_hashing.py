@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+import numpy as np
+import nose.tools as nt
+
+from .. import hashing
+from ..util import string_to_hash, hash_fields
+
+
+class TestHashing(TestCase):
+    def test_stable_key(self):
+        """ keys should not change between processes or versions """
+        key = hashing.hash_key('np.arange(20)')
+        nt.assert_equal(key, 'v1-baca0bcc5685c857bfc54349e5027e9a')
+        nt.assert_equal(hashing.key_version(key), 1)
+        # old md5 keys have no version
+        nt.assert_is_none(hashing.key_version('7dff1c0e72e86b338496529'))
+
+    def test_str_bytes(self):
+        nt.assert_equal(hashing.hash_key('test'), hashing.hash_key(b'test'))
+        nt.assert_equal(len(hashing.digest('test')), hashing.DIGEST_SIZE)
+
+    def test_streaming(self):
+        hasher = hashing.Hasher()
+        hasher.update('df.rolling')
+        hasher.update(b'(5).sum()')
+        nt.assert_equal(hasher.key(), hashing.hash_key('df.rolling(5).sum()'))
+
+    def test_hash_buffer(self):
+        arr = np.arange(100000, dtype=float)
+        key = hashing.hash_buffer(arr, chunk_size=1000)
+        nt.assert_equal(key, hashing.hash_key(arr.tobytes()))
+
+        arr2 = arr.copy()
+        arr2[-1] = -1
+        nt.assert_not_equal(key, hashing.hash_buffer(arr2))
+
+    def test_util(self):
+        nt.assert_equal(string_to_hash('test'), hashing.hash_int('test'))
+        nt.assert_equal(hash_fields(None, ['test', 1]),
+                        hash_fields(None, ['test', 1]))
@@ -0,0 +1,90 @@
+import ast
+from unittest import TestCase
+
+import nose.tools as nt
+
+from ..ipy import RunCellManager
+
+
+class Recorder(object):
+    def __init__(self, suffix=''):
+        self.cells = []
+        self.suffix = suffix
+
+    def __call__(self, cell):
+        self.cells.append(cell)
+        return cell + self.suffix
+
+
+class FakeCompiler(object):
+    def __init__(self):
+        self.parsed = []
+
+    def ast_parse(self, source, filename='<unknown>', symbol='exec'):
+        self.parsed.append(source)
+        return ast.parse(source, filename, symbol)
+
+
+class FakeShell(object):
+    def __init__(self):
+        self.compile = FakeCompiler()
+        self.ast_transformers = []
+        self.ran = []
+
+    def run_cell(self, raw_cell):
+        # IPython adds the newline before parsing
+        tree = self.compile.ast_parse(raw_cell + '\n')
+        self.ran.append(tree)
+        return tree
+
+
+class TestRunCellManager(TestCase):
+    def test_memoize(self):
+        mgr = RunCellManager()
+        any_handler = Recorder()
+        python_handler = Recorder("\nb = 2")
+        mgr.add_handler('any', any_handler, valid_python=False)
+        mgr.add_handler('python', python_handler)
+
+        cell = mgr.handle_cell("a = 1")
+        nt.assert_equal(cell, "a = 1\nb = 2")
+        nt.assert_equal(mgr.handle_cell("a = 1"), cell)
+        # handlers only ran once
+        nt.assert_equal(len(any_handler.cells), 1)
+        nt.assert_equal(len(python_handler.cells), 1)
+
+        # not python, python handlers are skipped
+        nt.assert_equal(mgr.handle_cell("%time a"), "%time a")
+        nt.assert_equal(len(python_handler.cells), 1)
+
+        # new handler set
+        mgr.add_handler('python', Recorder("\nc = 3"))
+        nt.assert_equal(mgr.handle_cell("a = 1"), "a = 1\nc = 3")
+
+    def test_no_memoize(self):
+        mgr = RunCellManager(memoize=False)
+        handler = Recorder()
+        mgr.add_handler('python', handler)
+        mgr.handle_cell("a = 1")
+        mgr.handle_cell("a = 1")
+        nt.assert_equal(len(handler.cells), 2)
+
+    def test_patch(self):
+        ip = FakeShell()
+        mgr = RunCellManager()
+        mgr.add_handler('python', Recorder("\nb = 2"))
+        mgr.patch_run_cell(ip)
+
+        tree = ip.run_cell("a = 1")
+        tree2 = ip.run_cell("a = 1")
+        # IPython never parsed the cell
+        nt.assert_equal(ip.compile.parsed, [])
+        nt.assert_equal(len(tree.body), 2)
+        # each run gets its own body list
+        tree.body.append(None)
+        nt.assert_equal(len(tree2.body), 2)
+
+        # ast transformers could modify our tree
+        ip.ast_transformers.append(object())
+        ip.run_cell("a = 1")
+        nt.assert_equal(len(ip.compile.parsed), 1)
@@ -0,0 +1,228 @@
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+import nose.tools as nt
+
+from ..pipeline import (Chain, Stage, pipe_func, register_pipe, get_meta,
+                        optimize, required_columns)
+from ..dplr import (filter, select, mutate, arrange, head, summarize,
+                    rowwise)
+from ..special_eval.column_expr import ColumnExpr
+
+
+class Recorder(object):
+    """ records the size of each input """
+    def __init__(self):
+        self.sizes = []
+
+    def __call__(self, df):
+        self.sizes.append(len(df))
+        return df
+
+
+class TestChain(TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'hp': np.arange(1000) % 200,
+            'mpg': np.random.randn(1000),
+            'cyl': np.arange(1000) % 8,
+        })
+
+    def test_meta(self):
+        nt.assert_true(get_meta(np.log).chunk_safe)
+        nt.assert_false(get_meta(np.add).chunk_safe)
+        nt.assert_false(get_meta(len).chunk_safe)
+
+        def func(df):
+            return df
+        register_pipe(func, chunk_safe=True)
+        nt.assert_true(get_meta(func).chunk_safe)
+
+        # depends on the args
+        nt.assert_true(Stage(filter, 'hp > 100').chunk_safe)
+        nt.assert_false(Stage(filter, self.df.hp > 100).chunk_safe)
+
+    def test_streaming(self):
+        df = self.df
+        recorder = Recorder()
+        register_pipe(recorder, chunk_safe=True)
+
+        stages = [
+            Stage(filter, 'hp > 100'),
+            Stage(recorder),
+            Stage(mutate, hp2=rowwise(lambda df: df.hp * 2)),
+            Stage(select, 'hp2', 'mpg'),
+        ]
+        res = Chain(df, stages, chunksize=100).run()
+        correct = df.query('hp > 100').assign(hp2=lambda df: df.hp * 2)
+        tm.assert_frame_equal(res, correct[['hp2', 'mpg']])
+        # never more than a chunk at a time
+        nt.assert_equal(len(recorder.sizes), 10)
+        nt.assert_true(max(recorder.sizes) <= 100)
+
+    def test_not_rowwise(self):
+        """ functions of the whole frame don't run per chunk """
+        df = self.df
+        stage = Stage(filter, lambda d: d.hp > d.hp.mean())
+        nt.assert_false(stage.chunk_safe)
+        res = Chain(df, [stage], chunksize=100).run()
+        tm.assert_frame_equal(res, df[df.hp > df.hp.mean()])
+
+        stage = Stage(mutate, z=lambda d: d.mpg.rank())
+        nt.assert_false(stage.chunk_safe)
+        res = Chain(df, [stage], chunksize=100).run()
+        tm.assert_frame_equal(res, df.assign(z=df.mpg.rank()))
+
+        nt.assert_false(Stage(filter, 'hp > hp.mean()').chunk_safe)
+        nt.assert_false(Stage(filter, ColumnExpr('hp > hp.mean()')).chunk_safe)
+        nt.assert_true(Stage(filter, ColumnExpr('np.log1p(hp) > 1',
+                                                {'np': np})).chunk_safe)
+        nt.assert_true(Stage(filter, 'hp > @limit and cyl == 1').chunk_safe)
+
+    def test_blocking(self):
+        df = self.df
+        recorder = Recorder()
+        register_pipe(recorder, chunk_safe=True)
+        stages = [
+            Stage(filter, lambda df: df.cyl == 1),
+            Stage(arrange, 'mpg'),
+            Stage(recorder),
+        ]
+        res = Chain(df, stages, chunksize=100).run()
+        tm.assert_frame_equal(res, df[df.cyl == 1].sort_values(['mpg']))
+        # arrange materialized, then the result is chunked again
+        nt.assert_equal(recorder.sizes, [100, 25])
+
+        res = Chain(df, stages, chunksize=200).run()
+        nt.assert_equal(recorder.sizes[2:], [125])
+
+    def test_head(self):
+        pulled = []
+
+        def chunks():
+            for i in range(10):
+                pulled.append(i)
+                yield self.df.iloc[i*100:(i+1)*100]
+
+        res = Chain(chunks(), [Stage(head, 150)]).run()
+        tm.assert_frame_equal(res, self.df.iloc[:150])
+        nt.assert_equal(pulled, [0, 1])
+
+    def test_summarize(self):
+        df = self.df
+        stages = [
+            Stage(filter, 'hp > 50'),
+            Stage(summarize, total=('mpg', 'sum'), avg=('hp', 'mean'),
+                  n=('hp', 'count'), top=('mpg', 'max')),
+        ]
+        res = Chain(df, stages, chunksize=64).run()
+        sub = df.query('hp > 50')
+        nt.assert_almost_equal(res.total[0], sub.mpg.sum())
+        nt.assert_almost_equal(res.avg[0], sub.hp.mean())
+        nt.assert_equal(res.n[0], len(sub))
+        nt.assert_equal(res.top[0], sub.mpg.max())
+
+        # median can't be combined from chunks
+        stage = Stage(summarize, med=('mpg', 'median'))
+        nt.assert_false(stage.chunk_safe)
+        res = Chain(df, [stage], chunksize=64).run()
+        nt.assert_equal(res.med[0], df.mpg.median())
+
+
+class TestOptimize(TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame(np.random.randn(100, 6),
+                               columns=['a', 'b', 'c', 'd', 'e', 'f'])
+
+    def names(self, stages):
+        return [(stage.func.__name__, stage.args) for stage in stages]
+
+    def test_push_filters(self):
+        stages = [
+            Stage(mutate, x='a * 2'),
+            Stage(mutate, y=rowwise(lambda df: df.b + 1)),
+            Stage(filter, 'c > 0'),
+            Stage(mutate, z='x + 1'),
+            # uses a produced column, can't move ahead of x
+            Stage(filter, 'x > 0'),
+        ]
+        plan = optimize(stages)
+        nt.assert_equal(self.names(plan), [
+            ('filter', ('c > 0',)),
+            ('mutate', ()),
+            ('filter', ('x > 0',)),
+            ('mutate', ()),
+            ('mutate', ()),
+        ])
+        nt.assert_equal(plan[1].kwargs, {'x': 'a * 2'})
+        nt.assert_equal(plan[4].kwargs, {'z': 'x + 1'})
+
+        # unknown columns stay put
+        stages = [Stage(mutate, x='a * 2'),
+                  Stage(filter, lambda df: df.c > 0)]
+        nt.assert_equal(optimize(stages), stages)
+
+    def test_precomputed(self):
+        """ precomputed values are aligned to the rows before the filter """
+        df = self.df.iloc[:10]
+        stages = [Stage(mutate, z=np.arange(10)), Stage(filter, 'a > 0')]
+        nt.assert_equal(optimize(stages), stages)
+        res = Chain(df, stages).run()
+        tm.assert_frame_equal(res, df.assign(z=np.arange(10)).query('a > 0'))
+
+        # unused, but not dropped or pruned around
+        stages = [Stage(mutate, z=np.arange(10)), Stage(select, 'a')]
+        plan = optimize(stages, columns=list(df.columns))
+        nt.assert_equal(plan, stages)
+
+        # non rowwise maps stay ahead of filters too
+        stages = [Stage(mutate, r=lambda d: d.a.rank()), Stage(filter, 'b > 0')]
+        nt.assert_equal(optimize(stages), stages)
+        stages = [Stage(mutate, r='a.rank()'), Stage(filter, 'b > 0')]
+        nt.assert_false(stages[0].chunk_safe)
+        nt.assert_equal(optimize(stages), stages)
+
+    def test_merge_projections(self):
+        stages = [Stage(select, 'a', 'b', 'c'), Stage(select, 'a', 'b')]
+        plan = optimize(stages)
+        nt.assert_equal(self.names(plan), [('select', ('a', 'b'))])
+
+        # not a subset
+        stages = [Stage(select, 'a', 'b'), Stage(select, 'a', 'c')]
+        nt.assert_equal(len(optimize(stages)), 2)
+
+    def test_prune(self):
+        stages = [
+            Stage(mutate, x='a * 2', unused='f * 2'),
+            # never used
+            Stage(mutate, dead='e + 1'),
+            Stage(filter, 'b > 0'),
+            Stage(arrange, 'c'),
+            Stage(select, 'x', 'c'),
+        ]
+        nt.assert_equal(required_columns(stages), {'a', 'b', 'c', 'e', 'f'})
+
+        plan = optimize(stages, columns=list(self.df.columns))
+        nt.assert_equal(self.names(plan)[:3], [
+            ('_project', ('a', 'b', 'c', 'f')),
+            ('filter', ('b > 0',)),
+            ('mutate', ()),
+        ])
+        nt.assert_equal(len(plan), 5)
+
+        df = self.df
+        res = Chain(df, stages).run()
+        correct = df.assign(x=df.a * 2).query('b > 0').sort_values('c')
+        tm.assert_frame_equal(res, correct[['x', 'c']])
+
+        # no optimizing
+        chain = Chain(df, stages, optimize=False)
+        nt.assert_equal(chain.plan(), stages)
+        tm.assert_frame_equal(chain.run(), res)
+
+    def test_unknown(self):
+        stages = [Stage(np.log), Stage(select, 'a')]
+        plan = optimize(stages, columns=list(self.df.columns))
+        nt.assert_equal(plan, stages)
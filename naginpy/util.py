@@ -1,9 +1,7 @@
-import hashlib
+from . import hashing
 
 def string_to_hash(string):
-    if isinstance(string, str):
-        string = string.encode('utf-8')
-    return int(hashlib.md5(string).hexdigest(), 16)
+    return hashing.hash_int(string)
 
 def hash_fields(cls, fields):
     """
@@ -26,7 +24,6 @@ def hash_fields(cls, fields):
             num = hash(string_to_hash(field))
         else:
             num = hash(field)
-        print(num)
         h = h * 31 + num
     return hash(h)
 
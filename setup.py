@@ -9,8 +9,11 @@ setup(
     packages=['naginpy'],
     install_requires = [
         'asttools',
-        'earthdragon',
+        'xxhash>=2',
     ],
+    extras_require = {
+        'parquet': ['pyarrow'],
+    },
     url='http://github.com/dalejung/naginpy/',
     license='BSD',
     author='Dale Jung',